@@ -1,195 +1,909 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import pandas as pd
-import math
+import numpy as np
 import os
-import orjson
+import io
+import re
+import ast
+import csv
 import time
+import threading
+import urllib.request
+import urllib.error
+import orjson
 from collections import defaultdict
 from nltk.tokenize import word_tokenize
-from utility import preprocess, calculate_byte_offset, load_lexicon, load_lexicon_trie, build_trie, read_row_by_byte_offset, autocomplete
+from normalizer import normalizer
+from lexicon_store import load_lexicon
+from completion_index import CompletionIndex
+from doc_store import DocStore
+from forward_store import FIELD_POSITION_GAP
+from attributes import AttributeStore, SORT_MODES, filter_mask, sort_order
+from utility import preprocess
+from barrel_cache import load_hot_terms
+from postings import (
+    concat_postings, decode_positions, decode_postings, candidate_blocks, intersect_sorted, last_doc_id, BLOCK_SIZE,
+    ImpactList,
+)
+from query_parser import is_boolean, parse_boolean, expression_terms
+from delta_index import DeltaIndex, DeltaReplica, Compactor
+from generations import WAL_FILE, read_generation, write_generation, generation_stamp, read_generation_paths
+from shards import ShardSet, ShardSearcher, merge_top_k
+from result_cache import ResultCache
+from cursor import encode_cursor, decode_cursor, resume_position
+from metrics import stage, start_trace, current_trace, finish_trace, cache_metrics, render_metrics
+from scoring import (
+    bm25_idf, score_postings, rank, term_scores, upper_bound, score_top_k, estimate_total_hits,
+    phrase_match, proximity_score, impact_unit, accumulate_impacts, select_top_k, impact_candidates, rescore,
+)
 
 app = Flask(__name__)
 CORS(app)
 
-lexicon = {}
+lexicon = None
 df = pd.DataFrame()
 
+# Columns of the data file, in order
+DOCUMENT_FIELDS = ["title", "abstract", "year", "keywords", "n_citation", "url"]
+
+csv_path = "D:\\code\\DSAProject\\reSearch\\cleaned_data_final.csv"
+lexicon_path = "D:\\code\\DSAProject\\reSearch\\lexicon.csv"
+lexicon_snapshot_path = "D:\\code\\DSAProject\\reSearch\\lexicon.bin"
+doc_store_path = "D:\\code\\DSAProject\\reSearch\\documents"
+attributes_path = "D:\\code\\DSAProject\\reSearch\\attributes"
+barrels_path = "D:\\code\\DSAProject\\reSearch\\barrels"
+wal_path = "D:\\code\\DSAProject\\reSearch\\barrels\\delta.wal"
+hot_terms_path = "D:\\code\\DSAProject\\reSearch\\hot_terms.txt"
+# Published index generation, when there is one; its paths replace the barrels and lexicon paths above
+generation_path = "D:\\code\\DSAProject\\reSearch\\generation.json"
+# Metrics snapshots of serve.py's worker processes, merged by whichever of them is scraped
+metrics_path = "D:\\code\\DSAProject\\reSearch\\metrics"
+
+# Shards of the index with their postings caches; new documents are compacted into the last
+shard_set = None
+# Process pool searching the shards in parallel, when there is more than one
+shard_searcher = None
+delta_index = None
+compactor = None
+completion_index = None
+doc_store = None
+attribute_store = None
+write_lock = threading.Lock()
+next_doc_id = 1
+next_word_id = 1
+# Ranked results of recent queries, shared by all request threads
+result_cache = ResultCache(max_bytes=256 * 1024 * 1024, ttl=600)
+# Budget of the decoded postings caches, split between the shards
+postings_cache_bytes = 512 * 1024 * 1024
+# Generation of the index being served, 0 until one is published, and the stamp of
+# generation.json it was read at
+generation = 0
+generation_seen = None
+# Set in the reader workers of serve.py: writes are forwarded to the writer process at this URL
+writer_url = None
+# Set in the writer process of serve.py, which alone publishes generations. A single-process
+# server answers queries on other threads while a generation would be swapped under them.
+publishes_generations = False
+
+# Pages are served from a top-k window this deep before the query is run again with a larger k
+TOP_K_WINDOW = 100
+# Largest batch accepted by /api/add_documents
+MAX_BATCH_SIZE = 10000
+# Requests a reader worker passes on to the writer process
+WRITE_ROUTES = ("/api/add_document", "/api/add_documents", "/api/generation")
+# Seconds a reader waits for the writer, enough for a full bulk batch
+WRITER_TIMEOUT = 600
+# Quoted parts of a query must match as phrases
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+# Most a proximity boost adds, as a fraction of the best score in the window: what a document
+# whose consecutive query terms are all adjacent gets. Enough to reorder near-ties, not to
+# overturn a clearly better match.
+PROXIMITY_WEIGHT = 0.05
+# Phrase candidates are verified this many at a time, best first, until enough match
+PHRASE_VERIFY_CHUNK = 100
+# Top-k queries on an index built with impacts (inverted_index.py --impacts) are scored
+# score-at-a-time from quantized impacts. Once this many milliseconds are spent the smallest
+# contributions are skipped, trading exactness for latency; None always scores everything,
+# and gives exactly the top k of compute_bm25_top_k.
+IMPACT_BUDGET_MS = 50
+
 top_10_results = [(6835, {'byte_offset': 9040287}), (124369, {'byte_offset': 173489852}), (22679, {'byte_offset': 29713425}), (33470, {'byte_offset': 44328753}), (21085, {'byte_offset': 27681541}), (24494, {'byte_offset': 32075782}), (167004, {'byte_offset': 232005384}), (5229, {'byte_offset': 7111431}), (3885, {'byte_offset': 5416440}), (4112, {'byte_offset': 5708273})]
 
-def compute_bm25(query_terms, k1=1.5, b=0.75):
-    base_path = "D:\\code\\DSAProject\\reSearch\\barrels\\"
-    scores = defaultdict(lambda: {"score": 0.0, "byte_offset": None})
-    total_time = 0
-    
+def corpus_size():
+    # Doc ids are row numbers of the data file, so this counts documents added since the index was built
+    return max(next_doc_id - 1, 1)
+
+
+def term_idf(doc_freq):
+    return bm25_idf(doc_freq, corpus_size())
+
+
+def lookup_terms(query_terms):
+    """
+    Term ids, posting lists and document frequencies of the query terms found in the index.
+    """
+    terms = []
     for term in query_terms:
         term = term.lower()
-        print(f"Processing query term: {term}")
         term_id = lexicon.get(term)
         if term_id is None:
-            print(f"Term '{term}' not found in lexicon.")
             continue
 
-        barrel_index = int(term_id) % 120
-        barrel_path_parquet = os.path.join(base_path, f"barrel_{barrel_index}.parquet")
-        barrel_df = pd.read_parquet(barrel_path_parquet)
-
-        term_row_no = math.floor(term_id / 120)
-        barrel = {barrel_df.iloc[term_row_no]["WordId"]: orjson.loads(barrel_df.iloc[term_row_no]["DocumentDetails"])}
-        if str(term_id) in barrel:
-            print(f"Found term '{term}' in barrel.")
-            postings = barrel[str(term_id)]
-            doc_freq = len(postings)
-            num_docs = 200000
-            idf = math.log((num_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
-
-            for posting in postings:
-                doc_id = posting["DocumentID"]
-                byte_offset = posting["byte_offset"]
-                
-                term_freq = (5 * posting["frequency"][0]/posting["length"][0] + 3 * posting["frequency"][2]/(posting["length"][2]*5) + posting["frequency"][1]/posting["length"][1])
-                doc_length = sum(posting["length"])
-                avg_doc_length = 112.766185
-                numerator = term_freq * (k1 + 1)
-                denominator = term_freq + k1 * (1 - b + b * (doc_length / avg_doc_length))
-                scores[doc_id]["score"] += idf * (numerator / denominator)
-                scores[doc_id]["byte_offset"] = byte_offset
-    
-    print(total_time)
-    print("total docs", len(scores))
-    scores = sorted(scores.items(), key=lambda x: x[1]["score"], reverse=True)
+        # Document frequency comes from the term dictionary and delta, so idf needs no postings
+        doc_freq = document_frequency(term_id)
+        if doc_freq > 0:
+            terms.append((term_id, term_postings(term_id), doc_freq))
+    return terms
+
+
+def bm25_scores(query_terms, k1=1.5, b=0.75):
+    """
+    Dense BM25 scores of every document matching any query term, and their byte offsets.
+    """
+    terms = lookup_terms(query_terms)
+    postings_lists = [postings for _, postings, _ in terms]
+    idfs = [term_idf(doc_freq) for _, _, doc_freq in terms]
+    with stage("scoring"):
+        return score_postings(postings_lists, idfs, k1, b)
+
+
+def hit_arrays(doc_ids, scores, byte_offsets):
+    """
+    Ranked hits as parallel arrays: doc ids, float32 scores and byte offsets in the data file.
+    Results are passed around and cached in this form rather than as a dict per hit.
+    """
+    return (
+        np.asarray(doc_ids, dtype=np.uint32), np.asarray(scores, dtype=np.float32), np.asarray(byte_offsets, dtype=np.uint64),
+    )
+
+
+def compute_bm25(query_terms, k1=1.5, b=0.75):
+    scores, byte_offsets = bm25_scores(query_terms, k1, b)
+    with stage("rank"):
+        ranked = rank(scores)
     
-    return scores    
+    return hit_arrays(ranked, scores[ranked], byte_offsets[ranked])
+
 
+def term_upper_bound(term_id, idf, k1=1.5):
+    return upper_bound(max(shard_set.max_score(term_id), delta_index.max_score(term_id)), idf, k1)
 
-def add_article(document, max_doc_id):
-    document["title"] = word_tokenize(document["title"])
-    document["abstract"] = word_tokenize(document["abstract"])
+
+def compute_bm25_top_k(query_terms, k, k1=1.5, b=0.75):
+    """
+    Best k documents using MaxScore pruning, plus the total hit count
+    (estimated when pruning skipped part of the postings).
+    """
+    if shard_set.has_impacts:
+        return compute_impact_top_k(query_terms, k, k1, b)
+    if shard_searcher is not None:
+        return compute_sharded_top_k(query_terms, k, k1, b)
+    terms = lookup_terms(query_terms)
+    postings_lists = [postings for _, postings, _ in terms]
+    idfs = [term_idf(doc_freq) for _, _, doc_freq in terms]
+    upper_bounds = [term_upper_bound(term_id, idf, k1) for (term_id, _, _), idf in zip(terms, idfs)]
     
-    # length = len(document["title"]) + len(document["abstract"]) + len(document["keywords"])
+    with stage("scoring"):
+        top, scores, byte_offsets, num_scored, pruned = score_top_k(postings_lists, idfs, upper_bounds, k, k1, b)
+    total = num_scored
+    if pruned:
+        total = max(num_scored, estimate_total_hits([doc_freq for _, _, doc_freq in terms], corpus_size()))
     
-    for key in ["title", "abstract"]:
-        document[key] =  preprocess(document[key])
+    return hit_arrays(top, scores, byte_offsets), total
+
+
+def compute_sharded_top_k(query_terms, k, k1=1.5, b=0.75):
+    """
+    compute_bm25_top_k over a sharded index. Every shard finds its own top k on the shard
+    process pool while the delta is searched here, then the lists are merged. Idfs and upper
+    bounds are those of the whole corpus, so scores are identical to the unsharded path.
+    """
+    terms = []
+    for term in query_terms:
+        term_id = lexicon.get(term.lower())
+        doc_freq = 0 if term_id is None else document_frequency(term_id)
+        if doc_freq > 0:
+            terms.append((term_id, doc_freq))
+    term_ids = [term_id for term_id, _ in terms]
+    idfs = [term_idf(doc_freq) for _, doc_freq in terms]
+    upper_bounds = [term_upper_bound(term_id, idf, k1) for term_id, idf in zip(term_ids, idfs)]
 
-    length = [
-        len(document["title"]),
-        len(document["abstract"]),
-        len(document["keywords"]),
+    # Delta first, for the same reason as in term_postings: a compaction landing while the
+    # shards are searched moves documents into the last shard, never out of both. A document
+    # found in both is kept once by merge_top_k.
+    delta = [
+        (postings, idf, bound)
+        for postings, idf, bound in zip(map(delta_index.get, term_ids), idfs, upper_bounds) if postings is not None
     ]
-    
-    # Frequency for title, abstract, and keywords
-    frequency = [0] * 3  
-    
-    # Positions for abstract
-    positions = []  
-
-    # Calculate term frequencies and positions
-    for idx, field in enumerate(["title", "abstract", "keywords"]):
-        for pos, word in enumerate(document[field]):
-            frequency[idx] += 1
-            if field == "abstract":
-                positions.append(pos)
-    
-    byte_offset = calculate_byte_offset()
-    print("byte offset",byte_offset)
-    
-    words = set(document["title"] + document["abstract"] + document["keywords"])
-    last_word_id = max(lexicon.values())
-    base_path = "D:\\code\\DSAProject\\reSearch\\barrels\\"
-    
-    for word in words:
-        word_id = lexicon.get(word)
-        if not word_id:
-            word_id = (last_word_id := last_word_id + 1)
-            print(type(word_id))
-            lexicon[word] = word_id
-            barrel_index = word_id % 120
-            barrel_path_parquet = os.path.join(base_path, f"barrel_{barrel_index}.parquet") 
-            barrel_df = pd.read_parquet(barrel_path_parquet)
-            new_row = {
-                "WordId": str(word_id),
-                "DocumentDetails": orjson.dumps([{
-                    "DocumentID": max_doc_id,
-                    "byte_offset": byte_offset,
-                    "length": length,
-                    "frequency": frequency,
-                    "positions": positions,
-                }]).decode("utf-8")
-            }
-            barrel_df = pd.concat([barrel_df, pd.DataFrame([new_row])], ignore_index=True)
-        else:
-            barrel_index = word_id % 120
-            barrel_path_parquet = os.path.join(base_path, f"barrel_{barrel_index}.parquet")
-            barrel_df = pd.read_parquet(barrel_path_parquet)
-            term_row_no = math.floor(word_id / 120)
-            document_details = orjson.loads(barrel_df.iloc[term_row_no]["DocumentDetails"])
-            document_details.append({
-                "DocumentID": max_doc_id,
-                "byte_offset": byte_offset,
-                "length": length,
-                "frequency": frequency,
-                "positions": positions,
-            })
-            barrel_df.at[term_row_no, "DocumentDetails"] = orjson.dumps(document_details).decode("utf-8")
+    with stage("shards"):
+        parts = shard_searcher.top_k(term_ids, idfs, upper_bounds, k, k1, b) if terms else []
+    if delta:
+        postings_lists, delta_idfs, delta_bounds = map(list, zip(*delta))
+        with stage("scoring"):
+            parts.append(score_top_k(postings_lists, delta_idfs, delta_bounds, k, k1, b))
+
+    with stage("rank"):
+        top, scores, byte_offsets = merge_top_k([part[:3] for part in parts], k)
+    # Shards hold disjoint documents, so their hit counts add up
+    total = sum(part[3] for part in parts)
+    if any(part[4] for part in parts):
+        total = max(total, estimate_total_hits([doc_freq for _, doc_freq in terms], corpus_size()))
+
+    return hit_arrays(top, scores, byte_offsets), total
+
 
-        barrel_df.to_parquet(barrel_path_parquet, index=False)
+def compute_impact_top_k(query_terms, k, k1=1.5, b=0.75):
+    """
+    compute_bm25_top_k from impact-ordered postings. The on-disk postings of every shard add
+    their quantized impacts score-at-a-time, largest contributions first, until IMPACT_BUDGET_MS
+    runs out; recently added documents are scored exactly. When every impact was added in time,
+    the documents quantization leaves within reach of the top k are scored again exactly, so the
+    result is compute_bm25_top_k's; otherwise scores are off by at most one impact step per
+    term. k1 and b are those the index was built with.
+    """
+    deadline = None if IMPACT_BUDGET_MS is None else time.perf_counter() + IMPACT_BUDGET_MS / 1000
+    impact_lists, weights, doc_freqs, deltas = [], [], [], []
+    term_ids, idfs, errors = [], [], []
+    with stage("postings"):
+        for term in query_terms:
+            term_id = lexicon.get(term.lower())
+            doc_freq = 0 if term_id is None else document_frequency(term_id)
+            if doc_freq == 0:
+                continue
+            idf = term_idf(doc_freq)
+            doc_freqs.append(doc_freq)
+            term_ids.append(term_id)
+            idfs.append(idf)
+            # Delta first, for the same reason as in term_postings
+            delta = delta_index.get(term_id)
+            last = 0
+            error = 0.0
+            for store in shard_set.stores:
+                impacts = store.read_impacts(term_id)
+                if impacts is not None:
+                    encoded, scale = impacts
+                    impact_list = ImpactList(encoded)
+                    impact_lists.append(impact_list)
+                    weights.append(impact_unit(idf, scale, k1))
+                    last = max(last, impact_list.last_doc_id)
+                    # A document is in one shard, so its error is that of the coarsest
+                    error = max(error, weights[-1])
+            errors.append(error)
+            if delta is not None:
+                deltas.append((delta.select(np.flatnonzero(delta.doc_ids > last)), idf))
+
+    # A document added while the query ran can be past next_doc_id as read here
+    num_slots = max(
+        [next_doc_id] + [impact_list.last_doc_id + 1 for impact_list in impact_lists]
+        + [int(delta.doc_ids.max()) + 1 for delta, _ in deltas if len(delta)]
+    )
+    accumulators = np.zeros(num_slots, dtype=np.float32)
+    delta_offsets = {}
+    with stage("scoring"):
+        for delta, idf in deltas:
+            accumulators[delta.doc_ids] += term_scores(delta, idf, k1, b)
+            delta_offsets.update(zip(delta.doc_ids.tolist(), delta.byte_offsets.tolist()))
+        _, complete = accumulate_impacts(impact_lists, weights, accumulators, deadline)
+    scores = accumulators
+    if complete and (deadline is None or time.perf_counter() < deadline):
+        candidates = impact_candidates(accumulators, sum(errors), k)
+        postings_lists = [term_postings(term_id) for term_id in term_ids]
+        upper_bounds = [term_upper_bound(term_id, idf, k1) for term_id, idf in zip(term_ids, idfs)]
+        with stage("scoring"):
+            scores = rescore(postings_lists, idfs, upper_bounds, candidates, num_slots, k1, b)
+    with stage("rank"):
+        top = select_top_k(scores, k)
 
-    max_doc_id += 1
+    total = int(np.count_nonzero(accumulators))
+    if not complete:
+        total = max(total, estimate_total_hits(doc_freqs, corpus_size()))
 
+    return hit_arrays(top, scores[top], document_byte_offsets(top, delta_offsets)), total
 
 
-def search(query):
+def document_byte_offsets(doc_ids, delta_offsets):
+    """
+    Byte offsets of documents in the data file, from the doc table of the shard holding them,
+    or from delta_offsets for documents not compacted yet.
+    """
+    byte_offsets = np.zeros(len(doc_ids), dtype=np.uint64)
+    for store in shard_set.stores:
+        table = store.doc_table
+        inside = (doc_ids >= table.first_doc_id) & (doc_ids < table.first_doc_id + len(table))
+        if inside.any():
+            byte_offsets[inside] = table.lookup(doc_ids[inside])[0]
+    return [delta_offsets.get(doc_id, byte_offset) for doc_id, byte_offset in zip(doc_ids.tolist(), byte_offsets.tolist())]
+
+
+def analyse_documents(documents):
+    """
+    Tokenize and normalize a batch of documents together, so their words are lemmatized in one pass.
+    Returns the field lengths, per-word [title, abstract, keywords] frequencies and per-word
+    positions of each document.
+    """
+    titles = normalizer.normalize_batch([word_tokenize(document["title"]) for document in documents])
+    abstracts = normalizer.normalize_batch([word_tokenize(document["abstract"]) for document in documents])
+
+    analysed = []
+    for title, abstract, document in zip(titles, abstracts, documents):
+        fields = [title, abstract, document["keywords"]]
+        # Per-word frequency in title, abstract, and keywords
+        frequencies = defaultdict(lambda: [0, 0, 0])
+        # Positions run through all three fields with a gap between fields, as in the forward index
+        positions = defaultdict(list)
+        position = 0
+        for idx, field in enumerate(fields):
+            for word in field:
+                frequencies[word][idx] += 1
+                positions[word].append(position)
+                position += 1
+            position += FIELD_POSITION_GAP
+        analysed.append(([len(field) for field in fields], frequencies, positions))
+    return analysed
+
+
+def index_documents(analysed, doc_ids, byte_offsets):
+    """
+    Give new words their ids and index a batch through the delta index with a single group commit.
+    Returns the words added to the lexicon.
+    """
+    global next_word_id
+    new_words = {}
+    entries = []
+    for (length, frequencies, positions), doc_id, byte_offset in zip(analysed, doc_ids, byte_offsets):
+        # Each new word is logged with the first document using it, for recovery
+        document_new_words = {}
+        term_frequencies = {}
+        term_positions = {}
+        for word, frequency in frequencies.items():
+            word_id = lexicon.get(word) or new_words.get(word)
+            if not word_id:
+                word_id = new_words[word] = document_new_words[word] = next_word_id
+                next_word_id += 1
+            term_frequencies[word_id] = frequency
+            term_positions[word_id] = positions[word]
+        entries.append((doc_id, byte_offset, length, term_frequencies, document_new_words, term_positions))
+
+    # Logged and searchable immediately; the compactor later folds them into a segment
+    delta_index.add_documents(entries)
+    lexicon.update(new_words)
+    # Autocomplete ranks by document frequency, which grew for these words
+    completion_index.touch({term_id for entry in entries for term_id in entry[3]})
+    return new_words
+
+
+def ingest_documents(documents):
+    """
+    Add a batch of documents. Preprocessing runs outside the write lock; the data file rows,
+    postings and lexicon are then each written once for the whole batch. Returns the doc ids.
+    """
+    global next_doc_id
+    documents = [clean_document(document) for document in documents]
+    with stage("analyse"):
+        analysed = analyse_documents(documents)
+
+    # One writer at a time, so doc ids keep matching row numbers in the data file
+    with write_lock:
+        # Rows go first: a crash before the log write leaves unindexed rows, never index entries without a row
+        with stage("write_rows"):
+            byte_offsets, csv_bytes = append_document_rows(documents)
+        doc_ids = list(range(next_doc_id, next_doc_id + len(documents)))
+        next_doc_id += len(documents)
+        with stage("store"):
+            doc_store.append(doc_ids, documents, csv_bytes)
+            attribute_store.append(doc_ids, documents)
+        with stage("index"):
+            new_words = index_documents(analysed, doc_ids, byte_offsets)
+        with stage("lexicon"):
+            append_lexicon(new_words)
+    with stage("lexicon"):
+        completion_index.add_words(new_words)
+
+    # Cached results for queries using any of the new documents' words are now stale
+    with stage("invalidate"):
+        result_cache.invalidate_terms({word for _, frequencies, _ in analysed for word in frequencies})
+    return doc_ids
+
+
+def document_frequency(term_id):
+    return shard_set.doc_freq(term_id) + delta_index.doc_freq(term_id)
+
+
+def term_postings(term_id):
+    """
+    On-disk postings of a term merged with those of recently added documents.
+    """
+    with stage("postings"):
+        # Read the delta first: if a compaction lands in between, the disk copy already has
+        # the delta's documents and they are dropped below instead of being missed
+        delta = delta_index.get(term_id)
+        # Shards hold increasing doc id ranges, so their postings join in shard order
+        disk = concat_postings([
+            cache.get(term_id) for store, cache in zip(shard_set.stores, shard_set.caches) if store.doc_freq(term_id) > 0
+        ])
+        if disk is None or delta is None:
+            return disk if delta is None else delta
+        delta = delta.select(np.flatnonzero(delta.doc_ids > disk.doc_ids[-1]))
+        return concat_postings([disk, delta])
+
+
+def term_positions(term_id, doc_ids):
+    """
+    Sorted positions of a term in each of the given documents; empty where it doesn't occur.
+    """
+    with stage("positions"):
+        positions = delta_index.positions(term_id)
+        for store, cache in zip(shard_set.stores, shard_set.caches):
+            disk = cache.get(term_id) if store.doc_freq(term_id) > 0 else None
+            if disk is None:
+                continue
+            wanted = np.array([doc_id for doc_id in doc_ids if doc_id not in positions], dtype=np.uint32)
+            indices = np.searchsorted(disk.doc_ids, wanted)
+            found = indices < len(disk.doc_ids)
+            found[found] = disk.doc_ids[indices[found]] == wanted[found]
+            # A compaction since the postings were cached only appends higher doc ids,
+            # so the indices of these documents still hold in the current positions
+            encoded = store.read_positions(term_id)
+            if encoded is not None and found.any():
+                positions.update(zip(wanted[found].tolist(), decode_positions(encoded, indices[found].tolist())))
+    empty = np.zeros(0, dtype=np.uint32)
+    return [positions.get(doc_id, empty) for doc_id in doc_ids]
+
+
+def verify_phrases(phrase_ids, doc_ids):
+    """
+    Boolean mask of the documents that contain every phrase.
+    """
+    with stage("phrase_verify"):
+        matches = np.ones(len(doc_ids), dtype=bool)
+        for phrase in phrase_ids:
+            position_lists = [term_positions(term_id, doc_ids) for term_id in phrase]
+            for i in np.flatnonzero(matches).tolist():
+                matches[i] = phrase_match([positions[i] for positions in position_lists])
+    return matches
+
+
+def compute_phrase_search(query_terms, phrases, k=None, k1=1.5, b=0.75):
+    """
+    Documents containing every phrase, ranked by the BM25 score of all query terms.
+    A conjunction of the phrase terms' postings picks the candidates and only those
+    are scored; positions are then checked best first, stopping once k documents match.
+    """
+    terms = lookup_terms(query_terms)
+    postings_by_id = {term_id: postings for term_id, postings, _ in terms}
+    phrase_ids = [[lexicon.get(term.lower()) for term in phrase] for phrase in phrases]
+    if any(term_id not in postings_by_id for phrase in phrase_ids for term_id in phrase):
+        return hit_arrays([], [], []), 0
+
+    candidates = None
+    for term_id in sorted({term_id for phrase in phrase_ids for term_id in phrase}, key=document_frequency):
+        doc_ids = postings_by_id[term_id].doc_ids
+        candidates = doc_ids if candidates is None else intersect_sorted(candidates, doc_ids)
+    postings_lists = [
+        postings.select(np.flatnonzero(np.isin(postings.doc_ids, candidates, assume_unique=True)))
+        for _, postings, _ in terms
+    ]
+    idfs = [term_idf(doc_freq) for _, _, doc_freq in terms]
+    with stage("scoring"):
+        scores, byte_offsets = score_postings(postings_lists, idfs, k1, b)
+    with stage("rank"):
+        ranked = rank(scores)
+
+    matched = []
+    verified = 0
+    while verified < len(ranked) and (k is None or len(matched) < k):
+        chunk = ranked[verified:verified + PHRASE_VERIFY_CHUNK]
+        matched.extend(chunk[verify_phrases(phrase_ids, chunk.tolist())].tolist())
+        verified += len(chunk)
+    matched = np.array(matched[:k] if k is not None else matched, dtype=np.int64)
+
+    total = len(matched)
+    if verified < len(ranked):
+        # Assume the unchecked candidates match as often as the checked ones
+        total = max(total, round(len(ranked) * len(matched) / verified))
+    return hit_arrays(matched, scores[matched], byte_offsets[matched]), total
+
+
+def postings_within(term_id, doc_ids):
+    """
+    Postings of a term in just the given sorted documents. When they are few next to the
+    term's document frequency, only the on-disk blocks the skip table says can hold them are decoded.
+    """
+    if len(doc_ids) * BLOCK_SIZE >= document_frequency(term_id):
+        postings = term_postings(term_id)
+    else:
+        with stage("postings"):
+            # Delta first, for the same reason as in term_postings
+            delta = delta_index.get(term_id)
+            parts = []
+            for store in shard_set.stores:
+                encoded = store.read(term_id) if store.doc_freq(term_id) > 0 else None
+                if encoded is None:
+                    continue
+                # Candidates below the shard's documents would only ever hit its first block
+                shard_doc_ids = doc_ids[doc_ids >= store.doc_table.first_doc_id]
+                parts.append(decode_postings(encoded, store.doc_table, candidate_blocks(encoded, shard_doc_ids)))
+                if delta is not None:
+                    delta = delta.select(np.flatnonzero(delta.doc_ids > last_doc_id(encoded)))
+            if delta is not None:
+                parts.append(delta)
+            postings = concat_postings(parts)
+    if postings is None:
+        return None
+    return postings.select(np.flatnonzero(np.isin(postings.doc_ids, doc_ids, assume_unique=True)))
+
+
+def estimate_matches(expression):
+    """
+    Upper bound on the documents an expression matches, to intersect the rarest operands first.
+    """
+    kind, value = expression
+    if kind == "term":
+        term_id = lexicon.get(value)
+        return 0 if term_id is None else document_frequency(term_id)
+    if kind == "phrase":
+        return min(estimate_matches(("term", word)) for word in value)
+    if kind == "or":
+        return sum(estimate_matches(child) for child in value)
+    if kind == "and":
+        return min(estimate_matches(child) for child in value)
+    return float("inf")
+
+
+def evaluate(expression, candidates=None):
+    """
+    Sorted doc ids matching a boolean expression. With candidates given, only documents among
+    them are looked at, so AND operands after the first touch just the blocks that can still match.
+    """
+    empty = np.zeros(0, dtype=np.uint32)
+    kind, value = expression
+    if kind == "term":
+        term_id = lexicon.get(value)
+        if term_id is None or document_frequency(term_id) == 0:
+            return empty
+        postings = term_postings(term_id) if candidates is None else postings_within(term_id, candidates)
+        return empty if postings is None else postings.doc_ids
+
+    if kind == "phrase":
+        doc_ids = evaluate(("and", tuple(("term", word) for word in value)), candidates)
+        phrase_ids = [[lexicon.get(word) for word in value]]
+        return doc_ids[verify_phrases(phrase_ids, doc_ids.tolist())] if len(doc_ids) else doc_ids
+
+    if kind == "or":
+        parts = [evaluate(child, candidates) for child in value]
+        return np.unique(np.concatenate(parts)).astype(np.uint32)
+
+    children = value if kind == "and" else (expression,)
+    positives = sorted((child for child in children if child[0] != "not"), key=estimate_matches)
+    if not positives:
+        # A query of only negations would match almost everything, which is never useful
+        return empty
+    result = candidates
+    for child in positives:
+        doc_ids = evaluate(child, result)
+        result = doc_ids if result is None else intersect_sorted(result, doc_ids)
+        if not len(result):
+            return empty
+    for child in children:
+        if child[0] == "not":
+            excluded = evaluate(child[1], result)
+            result = result[~np.isin(result, excluded, assume_unique=True)]
+    return result
+
+
+def boolean_scores(expression, k1=1.5, b=0.75):
+    """
+    Dense BM25 scores of the documents matching a boolean expression, from its positive terms,
+    their byte offsets and the number of matches. Matching runs first, so only matching
+    documents are ever scored.
+    """
+    with stage("boolean_match"):
+        matched = evaluate(expression)
+    postings_lists, idfs = [], []
+    for term in dict.fromkeys(expression_terms(expression)):
+        term_id = lexicon.get(term)
+        doc_freq = 0 if term_id is None else document_frequency(term_id)
+        postings = postings_within(term_id, matched) if doc_freq > 0 and len(matched) else None
+        if postings is not None:
+            postings_lists.append(postings)
+            idfs.append(term_idf(doc_freq))
+    with stage("scoring"):
+        scores, byte_offsets = score_postings(postings_lists, idfs, k1, b)
+    return scores, byte_offsets, len(matched)
+
+
+def compute_boolean_search(expression, k=None, k1=1.5, b=0.75):
+    """
+    Documents matching a boolean expression, ranked by the BM25 score of its positive terms.
+    """
+    scores, byte_offsets, num_matched = boolean_scores(expression, k1, b)
+    with stage("rank"):
+        ranked = rank(scores)
+    if k is not None:
+        ranked = ranked[:k]
+    return hit_arrays(ranked, scores[ranked], byte_offsets[ranked]), num_matched
+
+
+def apply_proximity(hits, query_terms, window=TOP_K_WINDOW):
+    """
+    Boost the top window of hit arrays by how close together the query terms appear, and re-sort
+    it in place. Boosts are never negative, so the window stays ahead of the hits below it, and
+    scaled to the window's best score, so they mean as much whatever the scores of the query.
+    """
+    term_ids = []
+    for term in query_terms:
+        term_id = lexicon.get(term.lower())
+        if term_id is not None and term_id not in term_ids:
+            term_ids.append(term_id)
+    doc_ids, scores, byte_offsets = hits
+    if len(term_ids) < 2 or not len(doc_ids):
+        return hits
+
+    with stage("proximity"):
+        top = doc_ids[:window].tolist()
+        position_lists = [term_positions(term_id, top) for term_id in term_ids]
+        weight = PROXIMITY_WEIGHT * float(scores[:len(top)].max())
+        boosts = [weight * proximity_score([positions[i] for positions in position_lists]) for i in range(len(top))]
+        boosted = scores[:len(top)].astype(np.float64) + boosts
+        # Stable, so equal scores keep their order
+        order = np.argsort(-boosted, kind="stable")
+        doc_ids[:len(top)] = doc_ids[:len(top)][order]
+        scores[:len(top)] = boosted[order]
+        byte_offsets[:len(top)] = byte_offsets[:len(top)][order]
+    return hits
+
+
+def invalidate_terms(term_ids):
+    for term_id in term_ids:
+        shard_set.invalidate(term_id)
+
+
+def append_lexicon(words):
+    """
+    Append new words to lexicon.csv instead of rewriting the whole file.
+    The lexicon snapshot picks them up from the end of the file on the next start.
+    """
+    if not words:
+        return
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(words.items())
+    with open(lexicon_path, "a", encoding="utf-8", newline="") as f:
+        f.write(buffer.getvalue())
+
+
+def append_document_rows(documents):
+    """
+    Append documents to the data file with one write.
+    Returns the byte offset of each row and the new size of the file.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter="|", lineterminator="\n")
+    rows = []
+    for document in documents:
+        writer.writerow([document[field] for field in DOCUMENT_FIELDS])
+        rows.append(buffer.getvalue().encode("utf-8"))
+        buffer.seek(0)
+        buffer.truncate()
+
+    with open(csv_path, "ab") as f:
+        start = f.tell()
+        f.write(b"".join(rows))
+        f.flush()
+        os.fsync(f.fileno())
+        end = f.tell()
+    return (start + np.cumsum([0] + [len(row) for row in rows[:-1]])).tolist(), end
+
+
+def normalise_query(query):
+    return preprocess(word_tokenize(query))
+
+
+def parse_query(query):
+    """
+    Normalised terms of a query, the phrases quoted in it, e.g. '"neural network" pruning',
+    and for queries using AND, OR, NOT or parentheses the parsed boolean expression.
+    Phrase words are terms too, so they count towards the score.
+    """
+    with stage("parse"):
+        if is_boolean(query):
+            expression = parse_boolean(query, normalise_query)
+            return expression_terms(expression, negated=True), [], expression
+        phrases = [normalise_query(phrase) for phrase in PHRASE_PATTERN.findall(query)]
+        terms = normalise_query(query.replace('"', " "))
+    # A quoted single word is an ordinary term
+    return terms, [phrase for phrase in phrases if len(phrase) > 1], None
+
+
+def search(query, top_k=None):
     """
     Perform a search for the given query and rank documents using BM25.
+    With top_k set only the best top_k documents are returned, using MaxScore pruning.
+    Returns the ranked hits as (doc ids, scores, byte offsets) arrays and the total number of hits.
     """
-    query_terms = word_tokenize(query)
-    query_terms = preprocess(query_terms)
-    
-    ranked_results = compute_bm25(query_terms)
-    
-    return ranked_results
+    query_terms, phrases, expression = parse_query(query)
+    return search_terms(query_terms, top_k, phrases, expression)
 
-def count_lines_in_file(filepath):
-    with open(filepath, 'rb') as f:
-        return sum(1 for _ in f)
 
-def calculate_byte_offset():
-    csv_path = "D:\\code\\DSAProject\\reSearch\\cleaned_data_final.csv"
-    if not os.path.exists(csv_path):
-        return 0
-    with open(csv_path, "rb") as f:
-        f.seek(0, os.SEEK_END)
-        return f.tell()
+def search_terms(query_terms, top_k=None, phrases=(), expression=None):
+    if expression is not None:
+        hits, total = compute_boolean_search(expression, top_k)
+        return apply_proximity(hits, expression_terms(expression)), total
+    if phrases:
+        hits, total = compute_phrase_search(query_terms, phrases, top_k)
+    elif top_k is None:
+        hits = compute_bm25(query_terms)
+        total = len(hits[0])
+    else:
+        hits, total = compute_bm25_top_k(query_terms, top_k)
+    return apply_proximity(hits, query_terms), total
+
+
+def search_sorted(query_terms, sort="relevance", filters=None, phrases=(), expression=None):
+    """
+    Every hit of a query that passes the attribute filters, ordered by a sort mode.
+    Filtering and sorting run over the attribute columns of the hit doc ids, so no row is
+    read before the page is chosen. Returns the ordered doc ids and their scores.
+    """
+    if expression is not None:
+        scores, _, _ = boolean_scores(expression)
+    elif phrases:
+        (matched, matched_scores, _), _ = compute_phrase_search(query_terms, phrases)
+        scores = np.zeros(int(matched.max()) + 1 if len(matched) else 0, dtype=np.float32)
+        scores[matched] = matched_scores
+    else:
+        scores, _ = bm25_scores(query_terms)
+
+    with stage("filter"):
+        doc_ids = np.flatnonzero(scores)
+        doc_ids = doc_ids[filter_mask(attribute_store, doc_ids, **(filters or {}))]
+        doc_scores = scores[doc_ids]
+    with stage("rank"):
+        order = sort_order(attribute_store, doc_ids, doc_scores, sort)
+        doc_ids, doc_scores = doc_ids[order], doc_scores[order]
+    if sort == "relevance":
+        # Same proximity boost as unfiltered queries, applied to the window through views of the arrays
+        window = min(TOP_K_WINDOW, len(doc_ids))
+        apply_proximity(
+            (doc_ids[:window], doc_scores[:window], np.zeros(window, dtype=np.uint64)),
+            expression_terms(expression) if expression is not None else query_terms,
+        )
+    return doc_ids, doc_scores
+
+
+def read_filters(data):
+    """
+    Attribute filters of a /api/process request: year_from, year_to and min_citations.
+    Raises ValueError on values that are not whole numbers.
+    """
+    filters = {}
+    for name in ("year_from", "year_to", "min_citations"):
+        value = data.get(name)
+        if value is not None and value != "":
+            if isinstance(value, bool) or not str(value).lstrip("-").isdigit():
+                raise ValueError(f"'{name}' must be a whole number")
+            filters[name] = int(value)
+    return filters
+
+def validate_document(document):
+    """
+    Whether a document has every field, with the text fields the analyser reads as strings
+    and its keywords a list of them.
+    """
+    return (
+        isinstance(document, dict) and all(field in document for field in DOCUMENT_FIELDS)
+        and isinstance(document["title"], str) and isinstance(document["abstract"], str)
+        and isinstance(document["keywords"], list) and all(isinstance(keyword, str) for keyword in document["keywords"])
+    )
+
+
+def clean_document(document):
+    """
+    A valid document with the line breaks in its fields replaced by spaces, as
+    data_cleaning.clean_csv does for the corpus. Every row of the data file must stay one line,
+    since rebuilding from it numbers documents by line.
+    """
+    def clean(value):
+        return value.replace("\n", " ").replace("\r", " ") if isinstance(value, str) else value
+    return {
+        field: [clean(keyword) for keyword in value] if field == "keywords" else clean(value)
+        for field, value in document.items()
+    }
+
+
+def read_batch():
+    """
+    Documents of a bulk request, sent either as a JSON array or as NDJSON (one document per line).
+    Raises ValueError on a body that is neither.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        return [orjson.loads(line) for line in request.get_data().splitlines() if line.strip()]
+    # Silent, so malformed JSON or another content type is the client's error rather than a 500
+    documents = request.get_json(silent=True)
+    if documents is None:
+        raise ValueError("Body is not JSON")
+    return documents
+
+
+@app.before_request
+def begin_trace():
+    start_trace()
+
+
+@app.before_request
+def route_to_writer():
+    """
+    In a reader worker of serve.py, send writes on to the writer process, and catch up with it
+    before anything else.
+    """
+    if writer_url is None:
+        return None
+    if request.method == "POST" and request.path in WRITE_ROUTES:
+        if request.path == "/api/generation" and request.remote_addr not in ("127.0.0.1", "::1"):
+            return jsonify({"error": "Generations can only be published from the server itself"}), 403
+        return forward_to_writer()
+    with stage("follow"):
+        follow_writer()
+    return None
+
+
+@app.after_request
+def end_trace(response):
+    # Requests are recorded by route, not by path, so the number of series stays fixed
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    finish_trace(route, failed=response.status_code >= 500)
+    return response
+
+
+def process_metrics():
+    """
+    Cache statistics and index sizes of this process, as render_metrics takes them.
+    Postings caches of the shard worker processes are not included.
+    """
+    extra = cache_metrics("result_cache", [result_cache.stats()], [{}])
+    if shard_set is not None:
+        extra += cache_metrics(
+            "postings_cache", [cache.stats() for cache in shard_set.caches],
+            [{"shard": str(shard)} for shard in range(len(shard_set))],
+        )
+    extra.append(("documents", "gauge", "Documents in the data file.", [({}, corpus_size())]))
+    extra.append(("index_generation", "gauge", "Generation of the index being served.", [({}, generation)]))
+    if delta_index is not None:
+        extra.append(("delta_documents", "gauge", "Documents added since the last compaction.", [({}, delta_index.num_docs)]))
+    return extra
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_route():
+    """
+    Request and stage latency histograms, cache statistics and index sizes in the Prometheus
+    text format. Under serve.py, those of every worker process: counters add up across them and
+    gauges are labelled by worker.
+    """
+    return Response(render_metrics(process_metrics()), mimetype="text/plain; version=0.0.4")
+
 
 @app.route('/api/add_document', methods=['POST'])
 def add_document():
     try:
-        data = request.get_json()
+        # Silent, so malformed JSON or another content type is the client's error rather than a 500
+        data = request.get_json(silent=True)
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        required_fields = ["title", "abstract", "year", "keywords", "n_citation", "url"]
-        if not all(field in data for field in required_fields):
-            return jsonify({"error": "Missing required fields"}), 400
+        if not validate_document(data):
+            return jsonify({"error": "Missing or invalid fields"}), 400
 
 
         start = time.perf_counter()
-        doc_df = pd.DataFrame([data])
-        
-        # Add document to index
-        add_article(data, max_doc_id)
-        
-        # Append to CSV
-        doc_df.to_csv(csv_path, mode='a', index=False, header=False, sep="|")
         
-        # Update lexicon file
-        df = pd.DataFrame(list(lexicon.items()), columns=["Word", "WordId"])
-        df.to_csv("D:\\code\\DSAProject\\reSearch\\lexicon.csv", index=False)
+        doc_id = ingest_documents([data])[0]
         
         end = time.perf_counter()
         
         return jsonify({
             "message": "Document added successfully",
+            "doc_id": doc_id,
             "time_taken": end - start
         }), 200
 
@@ -198,64 +912,461 @@ def add_document():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/add_documents', methods=['POST'])
+def add_documents():
+    try:
+        try:
+            documents = read_batch()
+        except ValueError:
+            return jsonify({"error": "Malformed JSON or NDJSON body"}), 400
+        if not documents or not isinstance(documents, list):
+            return jsonify({"error": "Expected a non-empty JSON array or NDJSON stream of documents"}), 400
+        if len(documents) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batches are limited to {MAX_BATCH_SIZE} documents"}), 413
+
+        invalid = [i for i, document in enumerate(documents) if not validate_document(document)]
+        if invalid:
+            # Nothing is added unless the whole batch is valid
+            return jsonify({"error": "Missing or invalid fields", "invalid": invalid}), 400
+
+        start = time.perf_counter()
+        doc_ids = ingest_documents(documents)
+        end = time.perf_counter()
+
+        docs_per_second = len(doc_ids) / max(end - start, 1e-9)
+        print(f"Added {len(doc_ids)} documents in {end - start:.2f} seconds ({docs_per_second:.0f} docs/s)")
+        return jsonify({
+            "message": "Documents added successfully",
+            "doc_ids": doc_ids,
+            "count": len(doc_ids),
+            "time_taken": end - start,
+            "docs_per_second": docs_per_second,
+        }), 200
+
+    except Exception as e:
+        print(f"Error adding documents: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/autocomplete', methods=['GET'])
 def autocomplete_route():
     prefix = request.args.get('prefix', '').lower()
-    print(prefix)
-    return jsonify(autocomplete(lexicon_trie, prefix))
+    with stage("complete"):
+        completions = completion_index.complete(prefix)
+    return jsonify(completions)
 
 @app.route('/api/process', methods=['POST'])
 def process_query():
-    global query
-    global all_results
     try:
         data = request.get_json()
-        if not data or 'query' not in data:
+        if not data or ('query' not in data and 'cursor' not in data):
             return jsonify({"error": "Missing 'query' in request body"}), 400
         
-        start = time.perf_counter()
+        # A cursor from an earlier page carries the fields of that search, whatever else the body says
+        last_doc_id = None
+        if data.get('cursor') is not None:
+            try:
+                data = decode_cursor(data['cursor'])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            last_doc_id = data['last']
         current_query = data['query']
         page = data.get('page', 1)
         results_per_page = data.get('per_page', 10)
+        # The exhaustive path scores and sorts every hit, kept for comparison with top-k
+        exhaustive = data.get('exhaustive', False)
+        # Sorting by citations or year, and the year and citation filters, need every hit
+        sort = data.get('sort', 'relevance')
+        if sort not in SORT_MODES:
+            return jsonify({"error": f"'sort' must be one of {', '.join(SORT_MODES)}"}), 400
         
-        if query != current_query:
-            query = current_query
-            all_results = search(query)
+        start_idx = data['offset'] if last_doc_id is not None else (page - 1) * results_per_page
+        end_idx = start_idx + results_per_page
         
-        start_idx = (page - 1) * results_per_page
-        end_idx = page * results_per_page
-        page_results = all_results[start_idx:end_idx]
+        try:
+            query_terms, phrases, expression = parse_query(current_query)
+            filters = read_filters(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # Word order only matters inside phrases and to the proximity boost
+        cache_key = (tuple(query_terms), tuple(map(tuple, phrases)), expression, exhaustive)
         
-        if len(all_results) == 0:
-            page_results = top_10_results
+        if sort != 'relevance' or filters:
+            cache_key += (sort, tuple(sorted(filters.items())))
+            with stage("result_cache"):
+                cached = result_cache.get(cache_key)
+            if cached is None:
+                cached = search_sorted(query_terms, sort, filters, phrases, expression)
+                result_cache.put(cache_key, cached, cache_terms(query_terms), cached[0].nbytes + cached[1].nbytes)
+            doc_ids, _ = cached
+            total_hits = len(doc_ids)
+            truncated = False
+        else:
+            with stage("result_cache"):
+                cached = result_cache.get(cache_key)
+            
+            # Search again on a miss, or when the page runs past a truncated top-k window.
+            # Only the doc ids and scores of the window are kept, a few bytes a hit.
+            while True:
+                if cached is not None and last_doc_id is not None:
+                    # A cursor's page starts further on than its offset when hits were added ahead of it
+                    end_idx = resume_position(cached[0], start_idx, last_doc_id) + results_per_page
+                if cached is not None and not (cached[3] is not None and len(cached[0]) == cached[3] < end_idx):
+                    break
+                # Past the window it doubles, so paging on deeper doesn't search again every page
+                deeper = 2 * cached[3] if cached is not None else 0
+                results_limit = None if exhaustive else max(TOP_K_WINDOW, end_idx, deeper)
+                (doc_ids, scores, _), total_hits = search_terms(query_terms, results_limit, phrases, expression)
+                cached = (doc_ids, scores, total_hits, results_limit)
+                result_cache.put(cache_key, cached, cache_terms(query_terms), doc_ids.nbytes + scores.nbytes)
+            doc_ids, _, total_hits, results_limit = cached
+            truncated = results_limit is not None and len(doc_ids) == results_limit
         
-        with open("D:\\code\\DSAProject\\reSearch\\cleaned_data_final.csv", "rb") as f:
-            results = [
-                read_row_by_byte_offset(f, doc_data["byte_offset"], doc_id)
-                for doc_id, doc_data in page_results
-            ]
+        if last_doc_id is not None:
+            start_idx = resume_position(doc_ids, start_idx, last_doc_id)
+            end_idx = start_idx + results_per_page
+        page_ids = doc_ids[start_idx:end_idx].tolist()
+        # Hits past the page are known, or may be found by searching deeper
+        has_more = bool(page_ids) and (end_idx < len(doc_ids) or (truncated and end_idx < total_hits))
+        if len(doc_ids) == 0 and sort == 'relevance' and not filters:
+            page_ids = [doc_id for doc_id, _ in top_10_results]
         
-        end = time.perf_counter()
-        print(f"Processed query in {end - start} seconds")
-            
-        return jsonify({
-            "input": query, 
+        # The whole page in one call to the memory-mapped document store
+        with stage("documents"):
+            documents = doc_store.get_many(page_ids)
+            results = [document for document in documents if document is not None]
+        
+        body = {
+            "input": current_query, 
             "output": results, 
-            "total": len(all_results),
-        }), 200
+            "total": total_hits,
+            # Opaque token that fetches the next page without searching again, None on the last page
+            "next_cursor": None,
+        }
+        if has_more:
+            state = {"query": current_query, "per_page": results_per_page, "exhaustive": exhaustive, "sort": sort}
+            state.update(filters)
+            body["next_cursor"] = encode_cursor(dict(state, offset=end_idx, last=page_ids[-1]))
+        if data.get('trace') and current_trace() is not None:
+            # Where this request's time went, in milliseconds per stage
+            body["timings"] = current_trace().breakdown()
+        with stage("serialize"):
+            return jsonify(body), 200
 
     except Exception as e:
         print(f"Error processing query: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
-    lexicon = load_lexicon()
-    global lexicon_trie
-    lexicon_trie = build_trie(load_lexicon_trie().keys())
+def use_generation(manifest):
+    """
+    Point the barrels, lexicon and log paths at those of a published generation.
+    """
+    global generation, barrels_path, lexicon_path, lexicon_snapshot_path, wal_path
+    generation = manifest["generation"]
+    barrels_path = manifest["barrels"]
+    lexicon_path = manifest["lexicon"]
+    lexicon_snapshot_path = manifest["lexicon_snapshot"]
+    wal_path = os.path.join(barrels_path, WAL_FILE)
+
+
+def generation_changed():
+    return generation_stamp(generation_path) != generation_seen
+
+
+def open_index(manifest=None):
+    """
+    Open the lexicon, shards and autocomplete of a generation: by default the published one, or
+    the configured paths before one is published. Everything on disk is mapped read-only, so
+    processes forked after this share it.
+    """
+    global lexicon, shard_set, completion_index, generation_seen
+    if manifest is None:
+        # Stamped before reading, so a generation published meanwhile is still noticed
+        generation_seen = generation_stamp(generation_path)
+        manifest = read_generation(generation_path)
+    if manifest is not None:
+        use_generation(manifest)
+    # Memory-mapped snapshot, so startup doesn't parse lexicon.csv
+    lexicon = load_lexicon(lexicon_path, lexicon_snapshot_path)
+    # Decoded postings shared by every request, so hot terms skip segment reads.
+    # Scoring uses the corpus statistics the index was built with.
+    shard_set = ShardSet(barrels_path, cache_bytes=postings_cache_bytes)
+    
+    # Top completions of common prefixes are ranked once here, by document frequency
+    completion_index = CompletionIndex(lexicon, shard_set.doc_freqs(), document_frequency)
+
+    # Load the most searched terms up front so the first queries don't pay for disk reads
+    hot_terms = load_hot_terms(hot_terms_path)
+    print("warmed up", shard_set.warm_up(hot_terms), "hot terms")
+
+
+def open_documents():
+    global doc_store, attribute_store, next_doc_id
+    # Documents are served from the document store; rows the store is missing are caught up from the csv
+    if not os.path.exists(doc_store_path):
+        DocStore.create(doc_store_path)
+    doc_store = DocStore(doc_store_path)
+    print("caught up", doc_store.sync(csv_path), "documents")
+    # Year and citation columns for sorting and filtering, caught up from the document store
+    attribute_store = AttributeStore(attributes_path)
+    print("caught up attributes of", attribute_store.sync(doc_store), "documents")
+    # The store counts documents, which a multi-line row in the csv would throw a line count off from
+    next_doc_id = doc_store.count
+
+
+def apply_records(records, log_words=False):
+    """
+    Bring the lexicon, autocomplete and doc id counter up to date with logged documents, after
+    recovering the log or following the writer's. log_words also appends their words to
+    lexicon.csv, for words a crash kept out of it.
+    """
+    global next_doc_id
+    for record in records:
+        missing_words = {word: word_id for word, word_id in record["new_words"].items() if word not in lexicon}
+        if log_words:
+            append_lexicon(missing_words)
+        lexicon.update(missing_words)
+        completion_index.add_words(missing_words)
+        completion_index.touch(int(term_id) for term_id in record["terms"])
+        next_doc_id = max(next_doc_id, record["doc_id"] + 1)
+
+
+def open_write_path():
+    """
+    The writer's side: the delta index recovered from the write-ahead log, and the compactor.
+    """
+    global delta_index, next_word_id, compactor
+    # Documents added since the last compaction come back from the write-ahead log
+    delta_index = DeltaIndex(wal_path, shard_set.writable)
+    apply_records(delta_index.recovered, log_words=True)
+    next_word_id = lexicon.max_id + 1
     
-    csv_path = "D:\\code\\DSAProject\\reSearch\\cleaned_data_final.csv"
-    max_doc_id = count_lines_in_file(csv_path) - 1
-    query = ""
-    all_results = []
+    compactor = Compactor(delta_index, on_compacted=invalidate_terms)
+    compactor.start()
+
+
+def open_replica():
+    """
+    A reader worker's side: a read-only delta following the writer's write-ahead log.
+    """
+    global delta_index, next_doc_id
+    delta_index = DeltaReplica(wal_path, shard_set.writable)
+    # A worker started again after documents were added and compacted has stale stores
+    doc_store.refresh()
+    attribute_store.refresh()
+    next_doc_id = max(next_doc_id, doc_store.count)
+    apply_records(delta_index.recovered)
+
+
+def follow_writer():
+    """
+    Catch a reader worker up with the writer process before a request: open a newly published
+    generation, then apply what was logged since the last request. Workers serve one request at
+    a time, so the index never changes under a request being served.
+    """
+    global next_doc_id, completion_index
+    if generation_changed():
+        open_index()
+        open_replica()
+        print("serving generation", generation)
+        # Results of the old generation may rank differently
+        result_cache.invalidate_all()
+        return
+    completion_index.add_words(lexicon.follow(lexicon_path))
+    records = delta_index.catch_up()
+    apply_records(records)
+    # Documents added and compacted since this worker's last request never reach it as log records
+    table = shard_set.writable.doc_table
+    missed = table.first_doc_id + len(table) > next_doc_id
+    if not records and not missed:
+        return
+    doc_store.refresh()
+    attribute_store.refresh()
+    next_doc_id = max(next_doc_id, doc_store.count)
+    if missed:
+        result_cache.invalidate_all()
+        # Which words the missed documents hold is unknown, so autocomplete ranks afresh
+        completion_index = CompletionIndex(lexicon, shard_set.doc_freqs(), document_frequency)
+    else:
+        # Cached results for queries using the new documents' terms are now stale, as are those
+        # for words that were not in the lexicon when they were cached
+        terms = {int(term_id) for record in records for term_id in record["terms"]}
+        result_cache.invalidate_terms(terms | {word for record in records for word in record["new_words"]})
+
+
+def cache_terms(query_terms):
+    """
+    What a cached result depends on: its query words, so the writer can drop it by the words of
+    new documents, and their term ids, so reader workers can drop it by the logged term ids.
+    """
+    term_ids = (lexicon.get(term.lower()) for term in query_terms)
+    return set(query_terms) | {term_id for term_id in term_ids if term_id is not None}
+
+
+def forward_to_writer():
+    """
+    Pass a write request on to the writer process, and its response back.
+    """
+    headers = {"Content-Type": request.content_type} if request.content_type else {}
+    forwarded = urllib.request.Request(
+        writer_url + request.full_path.rstrip("?"), data=request.get_data(), headers=headers, method=request.method,
+    )
+    try:
+        with urllib.request.urlopen(forwarded, timeout=WRITER_TIMEOUT) as response:
+            return Response(response.read(), status=response.status, content_type=response.headers.get("Content-Type"))
+    except urllib.error.HTTPError as e:
+        return Response(e.read(), status=e.code, content_type=e.headers.get("Content-Type"))
+    except OSError as e:
+        print(f"Error forwarding to the writer: {str(e)}")
+        return jsonify({"error": "The writer process is unavailable"}), 503
+
+
+def stored_document(document):
+    """
+    A document read back from the document store, with its keywords a list again as /api/add_document takes them.
+    """
+    keywords = document["keywords"]
+    try:
+        keywords = ast.literal_eval(keywords)
+    except (ValueError, SyntaxError):
+        keywords = keywords.split()
+    return dict(document, keywords=[str(keyword) for keyword in keywords] if isinstance(keywords, (list, tuple)) else [str(keywords)])
+
+
+def row_offsets(after, count):
+    """
+    Byte offsets of the count rows of the data file following the row starting at byte after.
+    """
+    offsets = []
+    with open(csv_path, "rb") as f:
+        f.seek(after)
+        f.readline()
+        for _ in range(count):
+            offsets.append(f.tell())
+            f.readline()
+    return offsets
+
+
+def generation_state():
+    """
+    Everything publishing a generation replaces, to put back if it fails.
+    """
+    return (
+        generation, barrels_path, lexicon_path, lexicon_snapshot_path, wal_path,
+        lexicon, shard_set, completion_index, delta_index, compactor, next_word_id,
+    )
+
+
+def restore_generation_state(state):
+    global generation, barrels_path, lexicon_path, lexicon_snapshot_path, wal_path
+    global lexicon, shard_set, completion_index, delta_index, compactor, next_word_id
+    (
+        generation, barrels_path, lexicon_path, lexicon_snapshot_path, wal_path,
+        lexicon, shard_set, completion_index, delta_index, compactor, next_word_id,
+    ) = state
+
+
+def publish_generation(paths):
+    """
+    Serve a newly built index: open it, index the documents it doesn't hold into its own
+    write-ahead log, then publish it. Reader workers open it between requests, so queries in
+    flight finish on the generation they started on. Runs in the writer, with writes paused.
+    If the new index fails to open or catch up, the old generation is kept and the error
+    raised. Returns the new generation's manifest and how many documents were caught up.
+    """
+    global generation_seen
+    manifest = dict(paths, generation=generation + 1)
+    with write_lock:
+        # The old generation keeps its log and compactor until the new one is ready
+        previous = generation_state()
+        old_delta_index, old_compactor = delta_index, compactor
+        try:
+            use_generation(manifest)
+            # Left by an earlier attempt to publish this index; the documents are indexed again below
+            for path in (wal_path, wal_path + ".compacting"):
+                if os.path.exists(path):
+                    os.remove(path)
+            open_index(manifest)
+            open_write_path()
+
+            # Doc ids are row numbers, so the documents the index doesn't hold are the rows after its last
+            table = shard_set.writable.doc_table
+            last = max(table.first_doc_id + len(table) - 1, 0)
+            after = int(table.lookup([last])[0][0]) if last > 0 else 0
+            doc_ids = list(range(last + 1, next_doc_id))
+            byte_offsets = row_offsets(after, len(doc_ids))
+            for start in range(0, len(doc_ids), MAX_BATCH_SIZE):
+                batch = doc_ids[start:start + MAX_BATCH_SIZE]
+                documents = [stored_document(document) for document in doc_store.get_many(batch)]
+                new_words = index_documents(analyse_documents(documents), batch, byte_offsets[start:start + len(batch)])
+                append_lexicon(new_words)
+                completion_index.add_words(new_words)
+        except Exception:
+            if delta_index is not old_delta_index:
+                compactor.stop()
+                delta_index.wal.close()
+            restore_generation_state(previous)
+            raise
+
+        # Waits for a compaction in progress; the old generation's log is then left as it is
+        old_compactor.stop()
+        old_compactor.join()
+        old_delta_index.wal.close()
+        write_generation(generation_path, manifest)
+        # Published by this process, so not a change to pick up again
+        generation_seen = generation_stamp(generation_path)
+        result_cache.invalidate_all()
+    print(f"Published generation {generation}, indexing {len(doc_ids)} documents it didn't hold")
+    return manifest, len(doc_ids)
+
+
+@app.route('/api/generation', methods=['GET', 'POST'])
+def generation_route():
+    """
+    GET: the generation being served. POST, from this machine only: publish the index at the
+    given barrels, lexicon and lexicon_snapshot paths as the next generation.
+    """
+    if request.method == 'GET':
+        return jsonify({
+            "generation": generation, "barrels": barrels_path, "lexicon": lexicon_path, "lexicon_snapshot": lexicon_snapshot_path,
+        })
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "Generations can only be published from the server itself"}), 403
+    if not publishes_generations:
+        return jsonify({"error": "Generations are published by the writer process of serve.py"}), 409
+    try:
+        paths = read_generation_paths(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if os.path.abspath(paths["barrels"]) == os.path.abspath(barrels_path):
+        return jsonify({"error": "That index is already being served"}), 400
+    try:
+        start = time.perf_counter()
+        manifest, caught_up = publish_generation(paths)
+        return jsonify(dict(manifest, caught_up=caught_up, time_taken=time.perf_counter() - start)), 200
+    except Exception as e:
+        print(f"Error publishing generation: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def start():
+    """
+    Open the index, document store and write path at the configured paths, for serving from a
+    single process. Run once at startup, before serving; benchmark.py calls it too, after
+    pointing the paths at its own corpus. serve.py opens the same parts across its processes.
+    """
+    global shard_searcher
+    open_documents()
+    open_index()
+    if len(shard_set) > 1:
+        # Plain top-k queries search the shards in parallel worker processes
+        shard_searcher = ShardSearcher(barrels_path, len(shard_set))
+    open_write_path()
+
+
+if __name__ == '__main__':
+    start()
 
-    app.run(debug=True)
+    # The reloader would run a second copy of this block, with its own log writer and compactor.
+    # For several worker processes, run serve.py instead.
+    app.run(debug=True, use_reloader=False)
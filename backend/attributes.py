@@ -0,0 +1,145 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Per-document attribute columns, one file each, indexed by doc id (entry 0 unused).
+# A value that is missing or not a number is stored as 0. Adding an attribute is adding a
+# column here; stores built before it get the column filled in by sync.
+ATTRIBUTE_COLUMNS = {
+    "year": np.dtype("<u2"),
+    "n_citation": np.dtype("<u4"),
+}
+SORT_MODES = ("relevance", "citations", "newest", "oldest")
+
+
+def column_file(name):
+    return f"{name}.bin"
+
+
+def parse_column(values, dtype):
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").fillna(0).to_numpy()
+    return np.clip(numbers, 0, np.iinfo(dtype).max).astype(dtype)
+
+
+class AttributeStore:
+    """
+    Memory-mapped attribute columns, so hits can be filtered and sorted by year or citations
+    without reading their rows. One writer appends at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        for name in ATTRIBUTE_COLUMNS:
+            column_path = os.path.join(path, column_file(name))
+            if not os.path.exists(column_path):
+                with open(column_path, "wb"):
+                    pass
+        self.columns = self._map()
+
+    def _map(self):
+        columns = {}
+        for name, dtype in ATTRIBUTE_COLUMNS.items():
+            column_path = os.path.join(self.path, column_file(name))
+            if os.path.getsize(column_path) < dtype.itemsize:
+                columns[name] = np.zeros(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(column_path, dtype=dtype, mode="r")
+        return columns
+
+    def refresh(self):
+        """
+        Map the columns again if another process appended to them.
+        """
+        if any(os.path.getsize(os.path.join(self.path, column_file(name))) != self.columns[name].nbytes for name in ATTRIBUTE_COLUMNS):
+            with self.lock:
+                self.columns = self._map()
+
+    def __len__(self):
+        # A crash between column writes leaves some columns shorter; only rows every column has count
+        return min(len(column) for column in self.columns.values())
+
+    def column(self, name, doc_ids):
+        """
+        Values of an attribute for the given documents, 0 for documents it doesn't cover.
+        """
+        values = self.columns[name]
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        known = doc_ids < len(values)
+        result = np.zeros(len(doc_ids), dtype=values.dtype)
+        result[known] = values[doc_ids[known]]
+        return result
+
+    def append(self, doc_ids, documents):
+        """
+        Write the attributes of consecutive new documents, given as dicts of their fields.
+        Writing a row again is harmless.
+        """
+        if not len(doc_ids):
+            return
+        first = int(doc_ids[0])
+        with self.lock:
+            for name, dtype in ATTRIBUTE_COLUMNS.items():
+                values = parse_column([document.get(name) for document in documents], dtype)
+                with open(os.path.join(self.path, column_file(name)), "r+b") as f:
+                    size = f.seek(0, os.SEEK_END) // dtype.itemsize
+                    if size < first:
+                        # Gap rows, and entry 0, stay zero
+                        f.write(np.zeros(first - size, dtype=dtype).tobytes())
+                    f.seek(first * dtype.itemsize)
+                    f.write(values.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.columns = self._map()
+
+    def sync(self, doc_store, chunk_size=10000):
+        """
+        Fill in the attributes of documents the document store has and this store doesn't yet,
+        to build the columns or catch up after documents were added without them.
+        """
+        added = 0
+        first = max(len(self), 1)
+        while first < doc_store.count:
+            doc_ids = np.arange(first, min(first + chunk_size, doc_store.count))
+            documents = [document or {} for document in doc_store.get_many(doc_ids)]
+            self.append(doc_ids, documents)
+            added += len(doc_ids)
+            first += len(doc_ids)
+        return added
+
+
+def filter_mask(attributes, doc_ids, year_from=None, year_to=None, min_citations=None):
+    """
+    Which of doc_ids pass the year range and citation filters. Documents without a known
+    year never pass a year filter.
+    """
+    mask = np.ones(len(doc_ids), dtype=bool)
+    if year_from is not None or year_to is not None:
+        years = attributes.column("year", doc_ids)
+        mask &= years > 0
+        if year_from is not None:
+            mask &= years >= year_from
+        if year_to is not None:
+            mask &= years <= year_to
+    if min_citations is not None:
+        mask &= attributes.column("n_citation", doc_ids) >= min_citations
+    return mask
+
+
+def sort_order(attributes, doc_ids, scores, mode):
+    """
+    Order of the hits for a sort mode: relevance, citations, newest or oldest.
+    Ties are broken by score, then by doc id.
+    """
+    by_score = -np.asarray(scores, dtype=np.float64)
+    if mode == "relevance":
+        return np.lexsort((doc_ids, by_score))
+    if mode == "citations":
+        return np.lexsort((doc_ids, by_score, -attributes.column("n_citation", doc_ids).astype(np.int64)))
+    years = attributes.column("year", doc_ids).astype(np.int64)
+    if mode == "newest":
+        return np.lexsort((doc_ids, by_score, -years))
+    # Unknown years go last rather than first
+    return np.lexsort((doc_ids, by_score, np.where(years > 0, years, np.iinfo(np.int64).max)))
@@ -0,0 +1,108 @@
+import os
+import threading
+from collections import OrderedDict
+from postings import decode_postings, POSTING_SIZE
+
+
+class BarrelCache:
+    """
+    Process-wide cache of typed posting lists, keyed by term id.
+    Entries are evicted least recently used first once max_bytes is exceeded.
+    """
+
+    def __init__(self, store, max_bytes=512 * 1024 * 1024):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # term_id -> (postings, size in bytes, location)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, term_id):
+        """
+        Return the posting list of a term, reading its segment only on a miss.
+        Returns None if the term has no postings.
+        """
+        term_id = int(term_id)
+        location = self.store.location(term_id)
+        with self.lock:
+            entry = self.entries.get(term_id)
+            # A term repointed to a new segment since it was cached counts as a miss
+            if entry is not None and entry[2] == location:
+                self.entries.move_to_end(term_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        encoded = self.store.read(term_id)
+        if encoded is None:
+            return None
+        postings = decode_postings(encoded, self.store.doc_table)
+        self._put(term_id, postings, postings.nbytes, location)
+        return postings
+
+    def warm_up(self, term_ids):
+        """
+        Load the given hot terms into the cache, stopping once the byte budget is full.
+        """
+        loaded = 0
+        for term_id in term_ids:
+            encoded = self.store.read(term_id)
+            if encoded is None:
+                continue
+            # Charged at its decoded size, known from the dictionary before decoding
+            if self.current_bytes + self.store.doc_freq(term_id) * POSTING_SIZE > self.max_bytes:
+                break
+            postings = decode_postings(encoded, self.store.doc_table)
+            self._put(int(term_id), postings, postings.nbytes, self.store.location(term_id))
+            loaded += 1
+        return loaded
+
+    def invalidate(self, term_id):
+        """
+        Drop a term so the next lookup re-reads its updated postings.
+        """
+        with self.lock:
+            entry = self.entries.pop(int(term_id), None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _put(self, term_id, postings, size, location):
+        # A single list larger than the whole budget is served but never cached
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(term_id, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self.entries[term_id] = (postings, size, location)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+
+def load_hot_terms(path):
+    """
+    Read one term id per line, ignoring blank lines and lines that are not ids.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [int(line) for line in (l.strip() for l in f) if line.isdigit()]
@@ -0,0 +1,149 @@
+import bisect
+import threading
+import numpy as np
+
+# Prefixes matching more words than this store their top completions;
+# smaller ranges of the lexicon are ranked when queried
+LEAF_SIZE = 64
+ALNUM_BYTES = np.zeros(256, dtype=bool)
+for char in b"0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ":
+    ALNUM_BYTES[char] = True
+# Bytes of multi-byte utf-8 characters count as alphanumeric, so accented words are kept
+ALNUM_BYTES[128:] = True
+
+
+class CompletionIndex:
+    """
+    Ranked autocomplete over the sorted lexicon snapshot, best completions first by document frequency.
+    The words starting with a prefix are a contiguous range of the snapshot. Every prefix matching
+    more than leaf_size words keeps its top k words, found once at build time, so a lookup is a
+    dict access; rarer prefixes rank their few words directly. Words added since the snapshot
+    are kept in a sorted overlay, and so are the snapshot words new documents contain, whose
+    document frequency may have lifted them above the words ranked at build time.
+    """
+
+    def __init__(self, lexicon, doc_freqs, doc_freq, k=10, leaf_size=LEAF_SIZE):
+        """
+        doc_freqs is the document frequency array by term id used to build the index,
+        doc_freq the function giving a term's current document frequency.
+        """
+        self.lexicon = lexicon
+        self.doc_freq = doc_freq
+        self.k = k
+        self.leaf_size = leaf_size
+        self.top = {}
+        self.added = []
+        self.added_ids = {}
+        # Snapshot indices of words touched since the build, sorted, so a prefix's are a slice
+        self.touched = []
+        self.touched_set = set()
+        self.lock = threading.Lock()
+        self.build(doc_freqs)
+        self.add_words(lexicon.added)
+
+    def build(self, doc_freqs):
+        lexicon = self.lexicon
+        ends = lexicon.ends.astype(np.int64)
+        starts = np.concatenate(([0], ends[:-1])).astype(np.int64)
+        blob = np.frombuffer(lexicon.mm, dtype=np.uint8, count=int(ends[-1]) if len(ends) else 0, offset=lexicon.blob_start)
+
+        # Same filter as before: only alphanumeric words are suggested
+        bad = np.concatenate(([0], np.cumsum(~ALNUM_BYTES[blob])))
+        eligible = (bad[ends] == bad[starts]) & (ends > starts)
+        ids = lexicon.ids.astype(np.int64)
+        known = ids < len(doc_freqs)
+        scores = np.full(len(ids), -1, dtype=np.int64)
+        scores[eligible & known] = doc_freqs[ids[eligible & known]]
+        scores[eligible & ~known] = 0
+        self.scores = scores
+        # Snapshot index of a word id, for touch
+        self.id_order = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.id_order]
+
+        # Walk the byte trie of the sorted words, only down to nodes larger than a leaf
+        stack = [(0, len(ids), 0, b"")]
+        while stack:
+            low, high, depth, prefix = stack.pop()
+            self.top[prefix] = self.rank_range(low, high, self.k)
+            positions = starts[low:high] + depth
+            chars = np.where(positions < ends[low:high], blob[np.minimum(positions, len(blob) - 1)], -1)
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(chars)) + 1, [high - low]))
+            for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                # chars[first] is -1 for the word equal to the prefix itself
+                if last - first > self.leaf_size and chars[first] >= 0:
+                    stack.append((low + first, low + last, depth + 1, prefix + bytes([int(chars[first])])))
+
+    def rank_range(self, low, high, k):
+        """
+        Snapshot indices of the k best suggestable words in low..high-1.
+        """
+        scores = self.scores[low:high]
+        # Ties go to the word sorting first, as in the final ordering
+        keys = (scores << 32) - np.arange(len(scores))
+        if len(scores) > k:
+            best = np.argpartition(-keys, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-keys[best])]
+        return (low + best[scores[best] >= 0]).astype(np.int32)
+
+    def complete(self, prefix, limit=10):
+        """
+        Up to limit words starting with prefix, highest document frequency first.
+        """
+        key = prefix.encode("utf-8")
+        candidates = self.top.get(key) if limit <= self.k else None
+        low = high = None
+        if candidates is None:
+            # No stored list, so the range is at most a leaf (or limit is above k)
+            low, high = self.prefix_range(key)
+            candidates = self.rank_range(low, high, limit)
+        indices = candidates.tolist()
+        if self.touched:
+            # Ranked at build time, so words that gained documents since must be looked at too
+            if low is None:
+                low, high = self.prefix_range(key)
+            with self.lock:
+                indices.extend(self.touched[bisect.bisect_left(self.touched, low):bisect.bisect_left(self.touched, high)])
+
+        suggestions = [
+            (self.doc_freq(int(self.lexicon.ids[index])), self.lexicon.word_bytes(index).decode("utf-8"))
+            for index in dict.fromkeys(indices)
+        ]
+        with self.lock:
+            first = bisect.bisect_left(self.added, prefix)
+            last = bisect.bisect_left(self.added, prefix + "\U0010ffff")
+            suggestions.extend((self.doc_freq(self.added_ids[word]), word) for word in self.added[first:last])
+
+        # Ranked by current document frequency, so documents added since the build count
+        suggestions.sort(key=lambda suggestion: (-suggestion[0], suggestion[1]))
+        return [word for _, word in suggestions[:limit]]
+
+    def prefix_range(self, key):
+        # utf-8 never contains 0xff, so every word starting with key sorts below key + 0xff
+        return self.lexicon.find(key), self.lexicon.find(key + b"\xff")
+
+    def touch(self, term_ids):
+        """
+        Note the snapshot words of term_ids, which new documents contain: their document
+        frequency grew, so they may now outrank the completions stored for their prefixes.
+        """
+        term_ids = np.fromiter(term_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, term_ids), max(len(self.sorted_ids) - 1, 0))
+        found = self.sorted_ids[positions] == term_ids if len(self.sorted_ids) else np.zeros(len(term_ids), dtype=bool)
+        indices = self.id_order[positions[found]]
+        with self.lock:
+            for index in indices[self.scores[indices] >= 0].tolist():
+                if index not in self.touched_set:
+                    bisect.insort(self.touched, index)
+                    self.touched_set.add(index)
+
+    def add_words(self, words):
+        """
+        Make words added to the lexicon after the snapshot suggestable.
+        """
+        with self.lock:
+            for word, word_id in words.items():
+                if word.isalnum() and word not in self.added_ids:
+                    bisect.insort(self.added, word)
+                    self.added_ids[word] = word_id
@@ -0,0 +1,48 @@
+import base64
+import binascii
+import numpy as np
+import orjson
+
+# Bumped whenever the fields of a cursor change, so old tokens are refused instead of misread
+CURSOR_VERSION = 1
+# Every cursor carries these; the rest of its fields are those of the request it came from
+CURSOR_FIELDS = ("v", "query", "per_page", "offset", "last")
+
+
+def encode_cursor(state):
+    """
+    Opaque token for the next page of a search: the request fields deciding the search, the
+    page size, the offset the page starts at and the last doc id already served, as URL-safe
+    base64 of their JSON.
+    """
+    return base64.urlsafe_b64encode(orjson.dumps(dict(state, v=CURSOR_VERSION))).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(token):
+    """
+    Fields of a token made by encode_cursor. Raises ValueError on anything else.
+    """
+    try:
+        state = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError("'cursor' is not a valid cursor")
+    if not isinstance(state, dict) or any(field not in state for field in CURSOR_FIELDS) or state["v"] != CURSOR_VERSION:
+        raise ValueError("'cursor' is not a valid cursor")
+    for field in ("per_page", "offset", "last"):
+        if isinstance(state[field], bool) or not isinstance(state[field], int) or state[field] < 0:
+            raise ValueError("'cursor' is not a valid cursor")
+    return state
+
+
+def resume_position(doc_ids, offset, last_doc_id):
+    """
+    Where the page after a cursor starts in ranked doc_ids. That is the cursor's offset while
+    the hit before it is still the last one served; when the hits have moved, as after documents
+    were added and the search ran again, the page starts after wherever that hit is now.
+    """
+    if offset == 0:
+        return offset
+    if offset <= len(doc_ids) and doc_ids[offset - 1] == last_doc_id:
+        return offset
+    found = np.flatnonzero(doc_ids == last_doc_id)
+    return int(found[0]) + 1 if len(found) else offset
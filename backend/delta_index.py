@@ -0,0 +1,446 @@
+import os
+import contextlib
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+import orjson
+from postings import (
+    PostingList, POSTING_SIZE, encode_postings, decode_postings, concat_postings, last_doc_id,
+    encode_positions, decode_all_positions, encode_impacts,
+)
+from scoring import term_scores, quantize_impacts
+
+# Compaction rewrites a term's whole posting list into the new segment, leaving the old copy
+# behind. The live postings of segments with less than this share of their bytes still in use
+# are copied into the new segment too, so garbage never takes more than about as much disk as
+# the live postings do.
+MIN_LIVE_RATIO = 0.5
+
+
+class DeltaSegment:
+    """
+    Postings of recently added documents, held in memory per term id.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(list)  # term_id -> [(doc_id, byte_offset, frequency, length)]
+        self.positions = defaultdict(list)  # term_id -> [positions], parallel to postings
+        self.max_scores = {}
+        self.docs = []  # (doc_id, byte_offset, length), for the doc table at compaction
+        self.num_docs = 0
+
+    def add(self, record):
+        length = record["length"]
+        term_ids = [int(term_id) for term_id in record["terms"]]
+        frequencies = list(record["terms"].values())
+        # Records logged before positions were indexed have none
+        positions = record.get("positions", {})
+        # Saturation of every new posting at once, to keep the per-term upper bounds current
+        scores = term_scores(PostingList(
+            None, None, np.array(frequencies).reshape(-1, 3), np.tile(length, (len(term_ids), 1)), 0
+        ), 1.0).tolist()
+        for term_id, frequency, score in zip(term_ids, frequencies, scores):
+            self.postings[term_id].append((record["doc_id"], record["byte_offset"], frequency, length))
+            self.positions[term_id].append(np.array(positions.get(str(term_id), []), dtype=np.uint32))
+            self.max_scores[term_id] = max(self.max_scores.get(term_id, 0.0), score)
+        self.docs.append((record["doc_id"], record["byte_offset"], length))
+        self.num_docs += 1
+
+    def get(self, term_id):
+        entries = self.postings.get(term_id)
+        if not entries:
+            return None
+        doc_ids, byte_offsets, frequencies, lengths = zip(*entries)
+        return PostingList(
+            np.array(doc_ids, dtype=np.uint32), np.array(byte_offsets, dtype=np.uint64),
+            np.array(frequencies, dtype=np.uint16), np.array(lengths, dtype=np.uint16),
+            len(doc_ids) * POSTING_SIZE,
+        )
+
+    def get_positions(self, term_id):
+        """
+        Positions of a term in each of its documents, in the order of get().
+        """
+        return list(self.positions.get(term_id, ()))
+
+
+class DeltaIndex:
+    """
+    Log-structured write path. New documents are appended to a write-ahead log and
+    applied to an in-memory delta segment, so they are searchable as soon as add_document
+    returns. compact() folds the delta into a new immutable segment of the SegmentStore.
+    """
+
+    def __init__(self, wal_path, store):
+        self.wal_path = wal_path
+        self.compacting_path = wal_path + ".compacting"
+        self.store = store
+        self.active = DeltaSegment()
+        # Delta being compacted; still searched until its segment is live
+        self.frozen = None
+        self.lock = threading.RLock()
+        self.compaction_lock = threading.Lock()
+        # Segments nothing pointed at after the last compaction, deleted after the next one so
+        # serving processes have switched dictionaries by then
+        self.retired = set()
+        self.recover()
+        self.wal = open(self.wal_path, "ab")
+
+    def recover(self):
+        """
+        Rebuild the delta from the logs left by the last run. Records whose documents
+        already made it into a segment before a crash are skipped.
+        """
+        records = []
+        torn = False
+        for path in (self.compacting_path, self.wal_path):
+            if os.path.exists(path):
+                path_records, path_torn = read_wal(path)
+                records.extend(path_records)
+                torn = torn or path_torn
+
+        recovered = [record for record in records if not self.is_compacted(record)]
+        for record in recovered:
+            self.active.add(record)
+
+        if torn or os.path.exists(self.compacting_path):
+            # Rewrite a single clean log, folding in an interrupted compaction's log
+            # and dropping a torn final record so new appends start on a fresh line
+            tmp_path = self.wal_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for record in recovered:
+                    f.write(orjson.dumps(record) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.wal_path)
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+        # Read by the caller to restore words and doc ids added since the last snapshot
+        self.recovered = recovered
+
+    def is_compacted(self, record):
+        # Doc ids only grow, so a document is on disk if a term's segment postings reach its id
+        term_id = next(iter(record["terms"]), None)
+        if term_id is None:
+            # A document without terms only adds its doc table entry, written before its
+            # compaction is published
+            table = self.store.doc_table
+            return record["doc_id"] < table.first_doc_id + len(table)
+        encoded = self.store.read(int(term_id))
+        return encoded is not None and last_doc_id(encoded) >= record["doc_id"]
+
+    def add_document(self, doc_id, byte_offset, length, frequencies, new_words=None, positions=None):
+        """
+        Durably log a document, then make it searchable.
+        frequencies maps term id to its [title, abstract, keywords] frequency
+        and positions maps term id to its token positions.
+        """
+        self.add_documents([(doc_id, byte_offset, length, frequencies, new_words, positions)])
+
+    def add_documents(self, documents):
+        """
+        Group commit: log a batch of (doc_id, byte_offset, length, frequencies, new_words, positions)
+        documents with a single write and fsync, then make them all searchable.
+        """
+        records = [make_record(*document) for document in documents]
+        data = b"".join(orjson.dumps(record) + b"\n" for record in records)
+        with self.lock:
+            self.wal.write(data)
+            self.wal.flush()
+            os.fsync(self.wal.fileno())
+            for record in records:
+                self.active.add(record)
+
+    def segments(self):
+        with self.lock:
+            return [segment for segment in (self.frozen, self.active) if segment is not None]
+
+    def get(self, term_id):
+        """
+        Delta postings of a term, or None if no recent document contains it.
+        """
+        parts = [segment.get(term_id) for segment in self.segments()]
+        return concat_postings([part for part in parts if part is not None])
+
+    def positions(self, term_id):
+        """
+        Positions of a term in each recent document containing it, keyed by doc id.
+        """
+        positions = {}
+        for segment in self.segments():
+            postings = segment.get(term_id)
+            if postings is not None:
+                positions.update(zip(postings.doc_ids.tolist(), segment.get_positions(term_id)))
+        return positions
+
+    def doc_freq(self, term_id):
+        return sum(len(segment.postings.get(term_id, ())) for segment in self.segments())
+
+    def max_score(self, term_id):
+        return max((segment.max_scores.get(term_id, 0.0) for segment in self.segments()), default=0.0)
+
+    @property
+    def num_docs(self):
+        return sum(segment.num_docs for segment in self.segments())
+
+    def compact(self, on_compacted=None):
+        """
+        Merge the delta with the on-disk postings of its terms into one new segment.
+        Writes arriving meanwhile go to a fresh delta and log. The live postings of mostly
+        replaced segments are moved along unchanged, and segments left with no live postings
+        are deleted one compaction later.
+        """
+        with self.compaction_lock:
+            with self.lock:
+                if self.active.num_docs == 0:
+                    return 0
+                self.frozen, self.active = self.active, DeltaSegment()
+                self.wal.close()
+                os.replace(self.wal_path, self.compacting_path)
+                self.wal = open(self.wal_path, "ab")
+
+            # Stream each merged term into the new segment so only one posting list is held at a time
+            segment, segment_path, positions_path, impacts_path = self.store.new_segment()
+            # An index built with impacts keeps them for every term, compacted ones included
+            paths = [segment_path, positions_path] + ([impacts_path] if self.store.has_impacts else [])
+            entries = []
+            with open(segment_path + ".tmp", "wb") as f, open(positions_path + ".tmp", "wb") as positions_f, \
+                    open(impacts_path + ".tmp", "wb") if self.store.has_impacts else contextlib.nullcontext() as impacts_f:
+                for term_id in self.frozen.postings:
+                    parts = [self.frozen.get(term_id)]
+                    delta_positions = self.frozen.get_positions(term_id)
+                    position_counts = [np.array([len(p) for p in delta_positions], dtype=np.int64)]
+                    position_parts = delta_positions
+                    encoded = self.store.read(term_id)
+                    if encoded is not None:
+                        disk = decode_postings(encoded, self.store.doc_table)
+                        parts.insert(0, disk)
+                        encoded_positions = self.store.read_positions(term_id)
+                        if encoded_positions is not None:
+                            counts, positions = decode_all_positions(encoded_positions)
+                        else:
+                            # Segments written before positions were indexed
+                            counts, positions = np.zeros(len(disk), dtype=np.int64), np.zeros(0, dtype=np.uint32)
+                        position_counts.insert(0, counts)
+                        position_parts = [positions] + position_parts
+                    postings = concat_postings(parts)
+                    encoded = encode_postings(postings.doc_ids, postings.frequencies)
+                    encoded_positions = encode_positions(np.concatenate(position_counts), np.concatenate(position_parts))
+                    saturations = term_scores(postings, 1.0)
+                    entry = (
+                        term_id, f.tell(), len(encoded), len(postings), float(saturations.max()),
+                        positions_f.tell(), len(encoded_positions),
+                    )
+                    if impacts_f is not None:
+                        levels, scale = quantize_impacts(saturations)
+                        encoded_impacts = encode_impacts(postings.doc_ids, levels)
+                        entry += (impacts_f.tell(), len(encoded_impacts), scale)
+                        impacts_f.write(encoded_impacts)
+                    entries.append(entry)
+                    f.write(encoded)
+                    positions_f.write(encoded_positions)
+                for term_id in self.sparse_terms(segment):
+                    entries.append(self.move_term(term_id, f, positions_f, impacts_f))
+                for out in (f, positions_f, impacts_f):
+                    if out is not None:
+                        out.flush()
+                        os.fsync(out.fileno())
+            for path in paths:
+                os.replace(path + ".tmp", path)
+            # The compacted documents' lengths and offsets must be readable before their postings are
+            doc_ids, byte_offsets, lengths = zip(*self.frozen.docs)
+            self.store.doc_table.append(doc_ids, byte_offsets, lengths)
+
+            with self.lock:
+                # The new segment and the end of the frozen delta become visible together
+                self.store.publish_segment(segment, entries)
+                compacted_terms = list(self.frozen.postings)
+                num_docs = self.frozen.num_docs
+                self.frozen = None
+            os.remove(self.compacting_path)
+            self.store.remove_segments(self.retired)
+            self.retired = {segment for segment, (live, _) in self.store.segment_usage().items() if live == 0}
+
+        if on_compacted is not None:
+            on_compacted(compacted_terms)
+        return num_docs
+
+
+    def sparse_terms(self, new_segment):
+        """
+        Terms outside the delta whose postings sit in a segment that is mostly garbage.
+        """
+        sparse = [
+            segment for segment, (live, file_bytes) in self.store.segment_usage().items()
+            if segment != new_segment and 0 < live < MIN_LIVE_RATIO * file_bytes
+        ]
+        entries = self.store.dictionary.entries
+        term_ids = np.flatnonzero(np.isin(entries["segment"], sparse) & (entries["length"] > 0)).tolist()
+        return [term_id for term_id in term_ids if term_id not in self.frozen.postings]
+
+    def move_term(self, term_id, f, positions_f, impacts_f):
+        """
+        Copy a term's encoded postings, positions and impacts as they are to the ends of the given
+        files. Returns its entry for publish_segment.
+        """
+        entry = self.store.dictionary.get(term_id)
+        encoded = self.store.read(term_id)
+        encoded_positions = self.store.read_positions(term_id) or b""
+        moved = (
+            term_id, f.tell(), len(encoded), int(entry["doc_freq"]), float(entry["max_score"]),
+            positions_f.tell(), len(encoded_positions),
+        )
+        f.write(encoded)
+        positions_f.write(encoded_positions)
+        if impacts_f is not None:
+            impacts = self.store.read_impacts(term_id)
+            encoded_impacts, scale = impacts if impacts is not None else (b"", 0.0)
+            moved += (impacts_f.tell(), len(encoded_impacts), scale)
+            impacts_f.write(encoded_impacts)
+        return moved
+
+
+class DeltaReplica(DeltaIndex):
+    """
+    Read-only copy of the delta for serving processes that don't write, following the writer's
+    log. catch_up() applies the records logged since it last ran. When the writer starts a new
+    log for a compaction, or publishes one, the copy is rebuilt from the logs as on recovery.
+    """
+
+    def __init__(self, wal_path, store):
+        self.wal_path = wal_path
+        self.compacting_path = wal_path + ".compacting"
+        self.store = store
+        self.active = DeltaSegment()
+        self.frozen = None
+        self.lock = threading.RLock()
+        # Identity of the log followed, how far into it records were applied, and the
+        # dictionary those records were checked against
+        self.log_id = None
+        self.log_offset = 0
+        self.dictionary_stamp = None
+        self.recovered = self.catch_up()
+
+    def catch_up(self):
+        """
+        Apply what the writer logged since the last call. Returns the records applied; after a
+        rebuild that is every record of the delta, some of them seen before.
+        """
+        self.store.refresh()
+        if file_id(self.wal_path) != self.log_id or self.store.dictionary_stamp != self.dictionary_stamp:
+            return self.rebuild()
+        records, self.log_offset = read_wal_from(self.wal_path, self.log_offset)
+        with self.lock:
+            for record in records:
+                self.active.add(record)
+        return records
+
+    def rebuild(self):
+        # Read until the log and dictionary stay put across the read, so a compaction
+        # landing meanwhile can't leave documents in neither
+        while True:
+            dictionary_stamp = self.store.dictionary_stamp
+            log_id = file_id(self.wal_path)
+            records, _ = read_wal_from(self.compacting_path, 0)
+            wal_records, log_offset = read_wal_from(self.wal_path, 0)
+            self.store.refresh()
+            if file_id(self.wal_path) == log_id and self.store.dictionary_stamp == dictionary_stamp:
+                break
+        segment = DeltaSegment()
+        recovered = [record for record in records + wal_records if not self.is_compacted(record)]
+        for record in recovered:
+            segment.add(record)
+        with self.lock:
+            self.active = segment
+        self.log_id, self.log_offset, self.dictionary_stamp = log_id, log_offset, dictionary_stamp
+        return recovered
+
+    def add_documents(self, documents):
+        raise RuntimeError("A delta replica is read-only; documents are added by the writer process")
+
+    def compact(self, on_compacted=None):
+        raise RuntimeError("A delta replica is read-only; the writer process compacts")
+
+
+class Compactor(threading.Thread):
+    """
+    Background thread that compacts the delta once it holds min_docs documents,
+    checking every interval seconds.
+    """
+
+    def __init__(self, delta_index, on_compacted=None, interval=30, min_docs=100):
+        super().__init__(daemon=True)
+        self.delta_index = delta_index
+        self.on_compacted = on_compacted
+        self.interval = interval
+        self.min_docs = min_docs
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.delta_index.active.num_docs >= self.min_docs:
+                start = time.perf_counter()
+                try:
+                    num_docs = self.delta_index.compact(self.on_compacted)
+                except Exception as e:
+                    print(f"Error compacting delta: {str(e)}")
+                    continue
+                print(f"Compacted {num_docs} documents in {time.perf_counter() - start:.2f} seconds")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def make_record(doc_id, byte_offset, length, frequencies, new_words=None, positions=None):
+    return {
+        "doc_id": int(doc_id),
+        "byte_offset": int(byte_offset),
+        "length": [int(x) for x in length],
+        "terms": {str(term_id): [int(x) for x in frequency] for term_id, frequency in frequencies.items()},
+        "new_words": new_words or {},
+        "positions": {str(term_id): [int(x) for x in term_positions] for term_id, term_positions in (positions or {}).items()},
+    }
+
+
+def file_id(path):
+    """
+    Identity of the file at path, which changes when another file is moved there; None if there is none.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def read_wal_from(path, offset):
+    """
+    Complete records of a log from byte offset on, and the offset after the last of them.
+    A record still being written is left for the next read.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    end = data.rfind(b"\n") + 1
+    return [orjson.loads(line) for line in data[:end].splitlines() if line.strip()], offset + end
+
+
+def read_wal(path):
+    """
+    Records of a log and whether it ended in a torn record.
+    """
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise orjson.JSONDecodeError("unterminated record", "", 0)
+                records.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # A torn final record from a crash mid-write was never acknowledged
+                return records, True
+    return records, False
@@ -0,0 +1,248 @@
+import os
+import io
+import itertools
+import mmap
+import zlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import orjson
+
+# Document store, two files:
+#   documents.dat  records (orjson objects of the document fields), optionally zlib compressed
+#                  in blocks of about block_size bytes
+#   documents.idx  STORE_HEADER, then one DOC_ENTRY_DTYPE entry per doc id (entry 0 unused)
+# A document is record bytes [offset, offset + length) of the block starting at byte block of
+# documents.dat. Uncompressed records are read straight from the mapped file.
+DATA_FILE = "documents.dat"
+INDEX_FILE = "documents.idx"
+STORE_MAGIC = b"RSDOC001"
+STORE_HEADER = np.dtype([
+    ("magic", "S8"),
+    # Entries in the table, one more than the highest doc id
+    ("count", "<u8"),
+    # Bytes of the data csv the store covers, so documents added to the csv can be caught up
+    ("csv_bytes", "<u8"),
+    ("compressed", "<u4"),
+    ("block_size", "<u4"),
+])
+DOC_ENTRY_DTYPE = np.dtype([
+    ("block", "<u8"),
+    ("block_length", "<u4"),
+    ("offset", "<u4"),
+    ("length", "<u4"),
+])
+DOCUMENT_FIELDS = ["title", "abstract", "year", "keywords", "n_citation", "url"]
+
+
+class DocStore:
+    """
+    Documents by doc id, read through memory maps. get_many fetches a whole page in one call,
+    decompressing each needed block once and keeping recent blocks in a small LRU cache.
+    One writer appends at a time; readers see a document once its table entry is written.
+    """
+
+    def __init__(self, path, cache_blocks=256):
+        self.path = path
+        self.data_path = os.path.join(path, DATA_FILE)
+        self.index_path = os.path.join(path, INDEX_FILE)
+        with open(self.index_path, "rb") as f:
+            header = np.frombuffer(f.read(STORE_HEADER.itemsize), dtype=STORE_HEADER)[0]
+        if header["magic"] != STORE_MAGIC:
+            raise ValueError(f"{self.index_path} is not a document store")
+        self.count = int(header["count"])
+        self.csv_bytes = int(header["csv_bytes"])
+        self.compressed = bool(header["compressed"])
+        self.block_size = int(header["block_size"])
+
+        self.cache_blocks = cache_blocks
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+        self.data_map = None
+        self.index_map = None
+        self.entries = np.zeros(0, dtype=DOC_ENTRY_DTYPE)
+
+    @classmethod
+    def create(cls, path, compressed=False, block_size=64 * 1024):
+        os.makedirs(path, exist_ok=True)
+        header = np.zeros(1, dtype=STORE_HEADER)
+        header["magic"] = STORE_MAGIC
+        header["count"] = 1
+        header["compressed"] = int(compressed)
+        header["block_size"] = block_size
+        with open(os.path.join(path, DATA_FILE), "wb"):
+            pass
+        with open(os.path.join(path, INDEX_FILE), "wb") as f:
+            f.write(header.tobytes())
+            f.write(np.zeros(1, dtype=DOC_ENTRY_DTYPE).tobytes())
+        return cls(path)
+
+    def refresh(self):
+        """
+        Pick up documents another process appended, from the count in the header.
+        The header is written last, so every document it counts is complete.
+        """
+        with open(self.index_path, "rb") as f:
+            header = np.frombuffer(f.read(STORE_HEADER.itemsize), dtype=STORE_HEADER)[0]
+        self.count = max(self.count, int(header["count"]))
+        self.csv_bytes = max(self.csv_bytes, int(header["csv_bytes"]))
+
+    @property
+    def num_docs(self):
+        return self.count - 1
+
+    def _maps(self, count):
+        """
+        Data map and entry table covering the first count entries, remapped when the files grew.
+        """
+        if len(self.entries) < count:
+            with self.lock:
+                if len(self.entries) < count:
+                    with open(self.index_path, "rb") as f:
+                        self.index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.entries = np.frombuffer(self.index_map, dtype=DOC_ENTRY_DTYPE, count=count, offset=STORE_HEADER.itemsize)
+                    with open(self.data_path, "rb") as f:
+                        self.data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+        return self.data_map, self.entries
+
+    def get(self, doc_id):
+        return self.get_many([doc_id])[0]
+
+    def get_many(self, doc_ids):
+        """
+        Documents of doc_ids, in order, as dicts of their fields plus doc_id. None for unknown ids.
+        """
+        count = self.count
+        data_map, entries = self._maps(count)
+        documents = []
+        for doc_id in doc_ids:
+            doc_id = int(doc_id)
+            if doc_id <= 0 or doc_id >= count or entries[doc_id]["length"] == 0:
+                documents.append(None)
+                continue
+            block, block_length, offset, length = entries[doc_id].tolist()
+            if self.compressed:
+                record = self._block(data_map, block, block_length)[offset:offset + length]
+            else:
+                record = data_map[block + offset:block + offset + length]
+            document = orjson.loads(record)
+            document["doc_id"] = doc_id
+            documents.append(document)
+        return documents
+
+    def _block(self, data_map, block, block_length):
+        with self.lock:
+            data = self.blocks.get(block)
+            if data is not None:
+                self.blocks.move_to_end(block)
+                return data
+        data = zlib.decompress(data_map[block:block + block_length])
+        with self.lock:
+            self.blocks[block] = data
+            while len(self.blocks) > self.cache_blocks:
+                self.blocks.popitem(last=False)
+        return data
+
+    def append(self, doc_ids, documents, csv_bytes=None):
+        """
+        Group commit of consecutive new documents: one data write and one table write, each fsync'd.
+        csv_bytes is the size of the data csv once the documents are in it.
+        """
+        if not len(doc_ids):
+            return
+        records = [orjson.dumps({field: str(document[field]) for field in DOCUMENT_FIELDS}) for document in documents]
+        first = int(doc_ids[0])
+        entries = np.zeros(len(records), dtype=DOC_ENTRY_DTYPE)
+
+        with open(self.data_path, "ab") as f:
+            position = f.tell()
+            if self.compressed:
+                chunks = []
+                start = 0
+                while start < len(records):
+                    # Fill a block up to block_size bytes of records
+                    end, size = start, 0
+                    while end < len(records) and (end == start or size + len(records[end]) <= self.block_size):
+                        size += len(records[end])
+                        end += 1
+                    block = zlib.compress(b"".join(records[start:end]))
+                    lengths = np.array([len(record) for record in records[start:end]], dtype=np.int64)
+                    entries["block"][start:end] = position
+                    entries["block_length"][start:end] = len(block)
+                    entries["offset"][start:end] = np.cumsum(lengths) - lengths
+                    entries["length"][start:end] = lengths
+                    chunks.append(block)
+                    position += len(block)
+                    start = end
+                f.write(b"".join(chunks))
+            else:
+                lengths = np.array([len(record) for record in records], dtype=np.int64)
+                entries["block"] = position + np.cumsum(lengths) - lengths
+                entries["block_length"] = lengths
+                entries["length"] = lengths
+                f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Entries are written after the records they point to, and the header last
+        with open(self.index_path, "r+b") as f:
+            f.seek(STORE_HEADER.itemsize + first * DOC_ENTRY_DTYPE.itemsize)
+            f.write(entries.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            self._write_header(f, max(self.count, first + len(records)), self.csv_bytes if csv_bytes is None else csv_bytes)
+
+    def _write_header(self, f, count, csv_bytes):
+        header = np.zeros(1, dtype=STORE_HEADER)
+        header["magic"] = STORE_MAGIC
+        header["count"] = count
+        header["csv_bytes"] = csv_bytes
+        header["compressed"] = int(self.compressed)
+        header["block_size"] = self.block_size
+        f.seek(0)
+        f.write(header.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        self.count = count
+        self.csv_bytes = csv_bytes
+
+    def sync(self, csv_path, chunk_size=10000):
+        """
+        Append the rows of the data csv past csv_bytes, to build the store or to catch up
+        with documents added to the csv while it was not updated.
+        Doc ids are line numbers, as in the forward index, so the csv is read line by line.
+        """
+        added = 0
+        with open(csv_path, "rb") as f:
+            if self.csv_bytes == 0:
+                f.readline()  # header
+            else:
+                f.seek(self.csv_bytes)
+            position = f.tell()
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                # A final line without a newline is still being written
+                complete = bool(lines) and lines[-1].endswith(b"\n")
+                if lines and not complete:
+                    lines.pop()
+                if not lines:
+                    break
+                size = sum(len(line) for line in lines)
+                rows = b"".join(line for line in lines if line.strip())
+                # Quoted fields may contain "|", which the csv parser handles
+                chunk = pd.read_csv(
+                    io.BytesIO(rows), sep="|", header=None, names=DOCUMENT_FIELDS,
+                    dtype=str, keep_default_na=False,
+                ) if rows else pd.DataFrame(columns=DOCUMENT_FIELDS)
+                doc_ids = np.arange(self.count, self.count + len(chunk))
+                if len(chunk):
+                    self.append(doc_ids, chunk.to_dict("records"), position + size)
+                else:
+                    with open(self.index_path, "r+b") as index:
+                        self._write_header(index, self.count, position + size)
+                position += size
+                added += len(chunk)
+                if not complete:
+                    break
+        return added
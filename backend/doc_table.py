@@ -0,0 +1,87 @@
+import os
+import threading
+import numpy as np
+
+# Per-document data the postings used to repeat: one fixed-width entry per doc id
+# (entry 0 unused), holding the row's byte offset and its (title, abstract, keywords) lengths.
+# The table of a shard starts at the shard's first doc id instead of 0.
+DOC_TABLE_DTYPE = np.dtype([
+    ("byte_offset", "<u8"),
+    ("length", "<u2", (3,)),
+])
+DOC_TABLE_FILE = "doc_table.bin"
+
+
+class DocTable:
+    """
+    Memory-mapped per-document table, gathered into posting lists as they are decoded.
+    """
+
+    def __init__(self, path, first_doc_id=0):
+        self.path = path
+        self.first_doc_id = first_doc_id
+        self.lock = threading.Lock()
+        self.entries = self._map()
+
+    def _map(self):
+        if os.path.getsize(self.path) == 0:
+            return np.zeros(0, dtype=DOC_TABLE_DTYPE)
+        return np.memmap(self.path, dtype=DOC_TABLE_DTYPE, mode="r")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def refresh(self):
+        """
+        Map the table again if another process appended to it.
+        """
+        if os.path.getsize(self.path) != self.entries.nbytes:
+            with self.lock:
+                self.entries = self._map()
+
+    def lookup(self, doc_ids):
+        """
+        Byte offsets and (n, 3) lengths of the given documents.
+        """
+        if self.first_doc_id:
+            doc_ids = np.asarray(doc_ids, dtype=np.int64) - self.first_doc_id
+        rows = self.entries[doc_ids]
+        return rows["byte_offset"], rows["length"]
+
+    def append(self, doc_ids, byte_offsets, lengths):
+        """
+        Write the entries of new documents. Writing an entry again is harmless,
+        so a compaction replayed after a crash can repeat it.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64) - self.first_doc_id
+        if len(doc_ids) == 0:
+            return
+        with self.lock:
+            table = np.zeros(int(doc_ids.max()) + 1 - len(self.entries), dtype=DOC_TABLE_DTYPE) if doc_ids.max() >= len(self.entries) else None
+            with open(self.path, "r+b") as f:
+                if table is not None:
+                    # Extend the file first so every new entry has a slot
+                    f.seek(0, os.SEEK_END)
+                    f.write(table.tobytes())
+                rows = np.zeros(len(doc_ids), dtype=DOC_TABLE_DTYPE)
+                rows["byte_offset"] = byte_offsets
+                rows["length"] = np.minimum(np.asarray(lengths).reshape(-1, 3), np.iinfo(np.uint16).max)
+                for doc_id, row in zip(doc_ids.tolist(), rows):
+                    f.seek(doc_id * DOC_TABLE_DTYPE.itemsize)
+                    f.write(row.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries = self._map()
+
+
+def write_doc_table(path, doc_ids, byte_offsets, lengths, first_doc_id=0):
+    """
+    Write a fresh table holding the given documents.
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64) - first_doc_id
+    table = np.zeros(int(doc_ids.max()) + 1 if len(doc_ids) else 1, dtype=DOC_TABLE_DTYPE)
+    table["byte_offset"][doc_ids] = byte_offsets
+    table["length"][doc_ids] = lengths
+    tmp_path = path + ".tmp"
+    table.tofile(tmp_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+
+# Binary forward index, four flat files:
+#   docs.bin       one DOC_DTYPE record per document, in doc id order
+#   terms.bin      uint32 term ids, each document's ids stored contiguously and sorted
+#   freqs.bin      uint16 x 3 (title, abstract, keywords) frequencies, parallel to terms.bin
+#   positions.bin  uint32 token positions of each (document, term) entry, ascending,
+#                  as many per entry as its three frequencies add up to
+# A document's terms are terms[start:start + count] and its positions begin at position_start.
+# Positions number the tokens of title, abstract and keywords in one sequence, with
+# FIELD_POSITION_GAP unused positions between fields, so phrases never match across them and
+# terms in different fields are never close enough to count as near each other.
+FIELD_POSITION_GAP = 1 << 16
+DOC_DTYPE = np.dtype([
+    ("doc_id", "<u4"),
+    ("byte_offset", "<u8"),
+    ("length", "<u2", (3,)),
+    ("start", "<u8"),
+    ("count", "<u4"),
+    ("position_start", "<u8"),
+])
+DOCS_FILE = "docs.bin"
+TERMS_FILE = "terms.bin"
+FREQS_FILE = "freqs.bin"
+POSITIONS_FILE = "positions.bin"
+
+
+class ForwardIndexWriter:
+    """
+    Appends chunks of documents to a binary forward index.
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.docs = open(os.path.join(path, DOCS_FILE), "wb")
+        self.terms = open(os.path.join(path, TERMS_FILE), "wb")
+        self.freqs = open(os.path.join(path, FREQS_FILE), "wb")
+        self.positions = open(os.path.join(path, POSITIONS_FILE), "wb")
+        self.num_postings = 0
+        self.num_positions = 0
+        self.num_docs = 0
+
+    def append(self, doc_ids, byte_offsets, lengths, counts, term_ids, frequencies, positions):
+        """
+        Write a chunk. counts[i] is the number of distinct terms of document i, whose
+        term ids and (n, 3) frequencies come next in term_ids and frequencies, and whose
+        positions come next in positions.
+        """
+        if len(doc_ids) == 0:
+            return
+        docs = np.zeros(len(doc_ids), dtype=DOC_DTYPE)
+        docs["doc_id"] = doc_ids
+        docs["byte_offset"] = byte_offsets
+        docs["length"] = np.minimum(lengths, np.iinfo(np.uint16).max)
+        docs["count"] = counts
+        docs["start"] = self.num_postings + np.concatenate(([0], np.cumsum(counts, dtype=np.uint64)[:-1]))
+        # An entry has one position per occurrence, the sum of its three frequencies
+        entry_positions = np.concatenate(([0], np.cumsum(np.asarray(frequencies, dtype=np.uint64).sum(axis=1))))
+        docs["position_start"] = self.num_positions + entry_positions[docs["start"] - self.num_postings]
+
+        docs.tofile(self.docs)
+        np.asarray(term_ids, dtype=np.uint32).tofile(self.terms)
+        np.asarray(frequencies, dtype=np.uint16).tofile(self.freqs)
+        np.asarray(positions, dtype=np.uint32).tofile(self.positions)
+        self.num_postings += int(np.sum(counts, dtype=np.uint64))
+        self.num_positions += len(positions)
+        self.num_docs += len(doc_ids)
+
+    def close(self):
+        for f in (self.docs, self.terms, self.freqs, self.positions):
+            f.close()
+
+
+def read_forward_index(path):
+    """
+    Memory-map a binary forward index. Returns (docs, term_ids, frequencies, positions).
+    """
+    def load(name, dtype):
+        file_path = os.path.join(path, name)
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode="r")
+
+    docs = load(DOCS_FILE, DOC_DTYPE)
+    term_ids = load(TERMS_FILE, np.uint32)
+    frequencies = load(FREQS_FILE, np.uint16).reshape(-1, 3)
+    positions = load(POSITIONS_FILE, np.uint32)
+    return docs, term_ids, frequencies, positions
@@ -0,0 +1,56 @@
+import os
+import orjson
+
+# The index generation being served, as {"generation": n, "barrels": ..., "lexicon": ...,
+# "lexicon_snapshot": ...}. The writer process replaces the file whole once a new generation is
+# ready, so a serving process opens either the old generation or the new one, never a mix.
+# Each generation keeps its own write-ahead log in its barrels directory.
+GENERATION_PATHS = ("barrels", "lexicon", "lexicon_snapshot")
+WAL_FILE = "delta.wal"
+
+
+def read_generation(path):
+    """
+    The published generation, or None before one is published.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def write_generation(path, generation):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(generation, option=orjson.OPT_INDENT_2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def generation_stamp(path):
+    """
+    Changes whenever a generation is published at path, so serving processes can check for one
+    with a stat per request.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def read_generation_paths(data):
+    """
+    Paths of a generation to publish, from a request body. Raises ValueError unless each names
+    something that exists.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected an object with {', '.join(GENERATION_PATHS)}")
+    paths = {}
+    for name in GENERATION_PATHS:
+        value = data.get(name)
+        if not isinstance(value, str) or not os.path.exists(value):
+            raise ValueError(f"'{name}' must be the path of an existing file or directory")
+        paths[name] = value
+    return paths
@@ -0,0 +1,182 @@
+import os
+import io
+import csv
+import mmap
+import numpy as np
+import pandas as pd
+
+# Binary lexicon snapshot, memory-mapped at startup instead of parsing lexicon.csv:
+#   header  SNAPSHOT_HEADER
+#   ends    uint64 end offset of each word in the blob
+#   ids     uint32 word id of each word
+#   blob    the utf-8 encoded words, sorted bytewise and concatenated
+# Word i is blob[ends[i - 1]:ends[i]], so a lookup is a binary search over the blob.
+SNAPSHOT_MAGIC = b"RSLEX001"
+SNAPSHOT_HEADER = np.dtype([
+    ("magic", "S8"),
+    ("count", "<u8"),
+    ("blob_size", "<u8"),
+    # Bytes of lexicon.csv the snapshot covers; words appended after that are read from the csv
+    ("csv_bytes", "<u8"),
+    ("max_id", "<u4"),
+    ("reserved", "<u4"),
+])
+# Past this many words appended since the snapshot, it is rebuilt on load
+MAX_TAIL_WORDS = 50000
+
+
+class Lexicon:
+    """
+    Word -> word id map backed by a memory-mapped snapshot, plus the words added since it was written.
+    """
+
+    def __init__(self, snapshot_path):
+        with open(snapshot_path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self.mm, dtype=SNAPSHOT_HEADER, count=1)[0]
+        if header["magic"] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{snapshot_path} is not a lexicon snapshot")
+        self.count = int(header["count"])
+        self.csv_bytes = int(header["csv_bytes"])
+        self.max_id = int(header["max_id"])
+
+        offset = SNAPSHOT_HEADER.itemsize
+        self.ends = np.frombuffer(self.mm, dtype="<u8", count=self.count, offset=offset)
+        offset += 8 * self.count
+        self.ids = np.frombuffer(self.mm, dtype="<u4", count=self.count, offset=offset)
+        self.blob_start = offset + 4 * self.count
+        self.added = {}
+        # Bytes of lexicon.csv read so far, the snapshot's and those of the words added from its tail
+        self.csv_read = self.csv_bytes
+
+    def __len__(self):
+        return self.count + len(self.added)
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def word_bytes(self, index):
+        start = int(self.ends[index - 1]) if index else 0
+        return self.mm[self.blob_start + start:self.blob_start + int(self.ends[index])]
+
+    def find(self, key):
+        """
+        Index of the first snapshot word >= key (utf-8 bytes).
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.word_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, word, default=None):
+        word_id = self.added.get(word)
+        if word_id is not None:
+            return word_id
+        key = word.encode("utf-8")
+        index = self.find(key)
+        if index < self.count and self.word_bytes(index) == key:
+            return int(self.ids[index])
+        return default
+
+    def update(self, words):
+        self.added.update(words)
+        if words:
+            self.max_id = max(self.max_id, max(words.values()))
+
+    def follow(self, csv_path):
+        """
+        Add the words another process appended to lexicon.csv since it was last read, and return them.
+        """
+        if os.path.getsize(csv_path) <= self.csv_read:
+            return {}
+        words, self.csv_read = read_csv_tail(csv_path, self.csv_read)
+        self.update(words)
+        return words
+
+    def items(self):
+        words, ids = self.arrays()
+        return zip(words, ids.tolist())
+
+    def words(self):
+        return self.arrays()[0]
+
+    def arrays(self):
+        """
+        All words as a list and their ids as a parallel uint32 array.
+        """
+        blob = self.mm[self.blob_start:self.blob_start + (int(self.ends[-1]) if self.count else 0)]
+        starts = np.concatenate((np.zeros(1, dtype=np.uint64), self.ends[:-1])).tolist()
+        words = [blob[start:end].decode("utf-8") for start, end in zip(starts, self.ends.tolist())]
+        words.extend(self.added)
+        ids = np.concatenate((self.ids, np.fromiter(self.added.values(), dtype=np.uint32, count=len(self.added))))
+        return words, ids
+
+
+def build_snapshot(csv_path, snapshot_path):
+    """
+    Write the snapshot of lexicon.csv.
+    """
+    with open(csv_path, "rb") as f:
+        data = f.read()
+    # Leave out a row torn by a crash mid-append
+    csv_bytes = data.rfind(b"\n") + 1
+    # keep_default_na stops words like "null" and "nan" from being read as missing values
+    lexicon_df = pd.read_csv(io.BytesIO(data[:csv_bytes]), keep_default_na=False, dtype={"Word": str})
+    encoded = np.array([word.encode("utf-8") for word in lexicon_df["Word"]], dtype=object)
+    ids = lexicon_df["WordId"].to_numpy(dtype=np.uint32)
+    order = np.argsort(encoded, kind="stable")
+    encoded, ids = encoded[order], ids[order]
+
+    header = np.zeros(1, dtype=SNAPSHOT_HEADER)
+    header["magic"] = SNAPSHOT_MAGIC
+    header["count"] = len(encoded)
+    header["csv_bytes"] = csv_bytes
+    header["max_id"] = ids.max() if len(ids) else 0
+    ends = np.cumsum([len(word) for word in encoded], dtype=np.uint64)
+    header["blob_size"] = ends[-1] if len(ends) else 0
+
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(ends.astype("<u8").tobytes())
+        f.write(ids.astype("<u4").tobytes())
+        f.write(b"".join(encoded))
+    os.replace(tmp_path, snapshot_path)
+
+
+def read_csv_tail(csv_path, start):
+    """
+    Words appended to lexicon.csv after byte start, and the offset after the last of them.
+    """
+    with open(csv_path, "rb") as f:
+        f.seek(start)
+        tail = f.read()
+    # A row torn by a crash mid-append was never acknowledged, or is still being written
+    end = tail.rfind(b"\n") + 1
+    return {word: int(word_id) for word, word_id in csv.reader(io.StringIO(tail[:end].decode("utf-8")))}, start + end
+
+
+def load_lexicon(csv_path, snapshot_path, max_tail_words=MAX_TAIL_WORDS):
+    """
+    Open the lexicon snapshot, rebuilding it when it is missing, belongs to another
+    lexicon.csv, or too many words were appended since it was written.
+    """
+    csv_bytes = os.path.getsize(csv_path)
+    if os.path.exists(snapshot_path):
+        lexicon = Lexicon(snapshot_path)
+        if lexicon.csv_bytes <= csv_bytes:
+            tail, csv_read = read_csv_tail(csv_path, lexicon.csv_bytes)
+            if len(tail) <= max_tail_words:
+                lexicon.update(tail)
+                lexicon.csv_read = csv_read
+                return lexicon
+        # Drop the mapping first, the file can't be replaced while mapped on Windows
+        del lexicon
+
+    print(f"Rebuilding lexicon snapshot {snapshot_path}")
+    build_snapshot(csv_path, snapshot_path)
+    return Lexicon(snapshot_path)
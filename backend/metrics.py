@@ -0,0 +1,355 @@
+import bisect
+import glob
+import os
+import threading
+import time
+from collections import deque
+import orjson
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Recent quantiles are estimated over the last WINDOW_SECONDS, kept as WINDOW_SLOTS slices
+# so old observations age out a slice at a time
+WINDOW_SECONDS = 300
+WINDOW_SLOTS = 10
+RECENT_QUANTILES = (0.5, 0.95, 0.99)
+# Requests slower than this have their stage timings printed
+SLOW_REQUEST_SECONDS = 1.0
+PREFIX = "research_"
+# Worker processes of serve.py each write a snapshot of their metrics this often, and whichever
+# of them answers a scrape merges every snapshot, so counters don't depend on which one it is
+SNAPSHOT_SECONDS = 1.0
+# Gauges of a worker whose snapshot is older than this are left out, as it has exited
+STALE_SECONDS = 5 * SNAPSHOT_SECONDS
+# Metrics of each cache, from the stats() every cache has: (key, metric suffix, type, help)
+CACHE_METRICS = [
+    ("hits", "hits_total", "counter", "Lookups that hit the {}."),
+    ("misses", "misses_total", "counter", "Lookups that missed the {}."),
+    ("evictions", "evictions_total", "counter", "Entries evicted from the {}."),
+    ("entries", "entries", "gauge", "Entries in the {}."),
+    ("bytes", "bytes", "gauge", "Bytes held by the {}."),
+]
+
+
+class Histogram:
+    """
+    Latency histogram with cumulative buckets, as Prometheus reads them, and a rolling window
+    of the same buckets for quantiles of recent requests.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=WINDOW_SECONDS, slots=WINDOW_SLOTS):
+        self.buckets = buckets
+        self.slots = slots
+        self.slot_seconds = window / slots
+        self.lock = threading.Lock()
+        # The last count is of observations above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.recent = deque()  # (slot number, bucket counts) of the slots in the window
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        slot = int(time.monotonic() // self.slot_seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            if not self.recent or self.recent[-1][0] != slot:
+                self.recent.append((slot, [0] * len(self.counts)))
+                self._expire(slot)
+            self.recent[-1][1][index] += 1
+
+    def _expire(self, slot):
+        while self.recent and self.recent[0][0] <= slot - self.slots:
+            self.recent.popleft()
+
+    def snapshot(self):
+        """
+        (bucket counts, sum, bucket counts of the window).
+        """
+        with self.lock:
+            self._expire(int(time.monotonic() // self.slot_seconds))
+            recent = [sum(counts) for counts in zip(*(counts for _, counts in self.recent))]
+            return list(self.counts), self.sum, recent or [0] * len(self.counts)
+
+
+def estimate_quantiles(counts, buckets=LATENCY_BUCKETS, quantiles=RECENT_QUANTILES):
+    """
+    Quantiles estimated from histogram bucket counts, interpolating linearly within a bucket.
+    None when there are no observations.
+    """
+    total = sum(counts)
+    if not total:
+        return [None] * len(quantiles)
+    results = []
+    for quantile in quantiles:
+        rank = quantile * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if index == len(buckets):
+                    # Above the last bucket there is no upper bound to interpolate to
+                    results.append(buckets[-1])
+                else:
+                    low = buckets[index - 1] if index else 0.0
+                    results.append(low + (buckets[index] - low) * (rank - seen) / count)
+                break
+            seen += count
+    return results
+
+
+class Trace:
+    """
+    Time spent in each stage during one request. A stage entered several times, such as
+    reading the postings of each query term, adds up.
+    """
+    __slots__ = ("start", "stages")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def breakdown(self):
+        """
+        Milliseconds per stage and in total so far. Stages can nest, so they need not add up.
+        """
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.start) * 1000, 3)
+        return timings
+
+
+class stage:
+    """
+    Context manager timing a stage of the query or ingest path:
+        with stage("postings"):
+            ...
+    Inside a traced request the time goes to the request's trace and is recorded once the
+    request finishes; otherwise it is recorded straight away.
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        trace = getattr(local, "trace", None)
+        if trace is None:
+            stage_histogram(self.name).observe(seconds)
+        else:
+            trace.stages[self.name] = trace.stages.get(self.name, 0.0) + seconds
+        return False
+
+
+# The trace of the request the current thread is handling
+local = threading.local()
+histograms_lock = threading.Lock()
+stage_histograms = {}
+request_histograms = {}
+request_errors = {}
+# Set by share_metrics in the worker processes of serve.py: the directory of the workers'
+# snapshots, this worker's name, and whether its requests are counted
+shared_path = None
+worker_name = None
+shares_requests = True
+snapshot_lock = threading.Lock()
+
+
+def get_histogram(histograms, name):
+    histogram = histograms.get(name)
+    if histogram is None:
+        with histograms_lock:
+            histogram = histograms.setdefault(name, Histogram())
+    return histogram
+
+
+def stage_histogram(name):
+    return get_histogram(stage_histograms, name)
+
+
+def start_trace():
+    local.trace = Trace()
+    return local.trace
+
+
+def current_trace():
+    return getattr(local, "trace", None)
+
+
+def finish_trace(route, failed=False):
+    """
+    End the current thread's trace: record the request's latency and its stage totals, and
+    print the breakdown of a slow request. Returns the trace, or None if none was started.
+    """
+    trace = getattr(local, "trace", None)
+    if trace is None:
+        return None
+    local.trace = None
+    seconds = time.perf_counter() - trace.start
+    get_histogram(request_histograms, route).observe(seconds)
+    for name, stage_seconds in trace.stages.items():
+        stage_histogram(name).observe(stage_seconds)
+    if failed:
+        with histograms_lock:
+            request_errors[route] = request_errors.get(route, 0) + 1
+    if seconds >= SLOW_REQUEST_SECONDS:
+        stages = ", ".join(f"{name} {milliseconds} ms" for name, milliseconds in trace.breakdown().items())
+        print(f"Slow request {route}: {stages}")
+    return trace
+
+
+def cache_metrics(name, stats, labels):
+    """
+    Metrics of a kind of cache for render_metrics, given the stats() of each cache of that
+    kind and the labels of its series.
+    """
+    description = name.replace("_", " ")
+    return [
+        (f"{name}_{suffix}", kind, help_text.format(description), [(label, cache[key]) for label, cache in zip(labels, stats)])
+        for key, suffix, kind, help_text in CACHE_METRICS
+    ]
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def format_value(value):
+    if value is None:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_histograms(lines, name, help_text, label, snapshots):
+    """
+    Histograms given as {label value: (bucket counts, sum, bucket counts of the window)}.
+    """
+    lines.append(f"# HELP {PREFIX}{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}{name} histogram")
+    recent_lines = []
+    for key, (counts, total, recent) in sorted(snapshots.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f"{PREFIX}{name}_bucket{format_labels({label: key, 'le': bound})} {cumulative}")
+        lines.append(f"{PREFIX}{name}_sum{format_labels({label: key})} {format_value(total)}")
+        lines.append(f"{PREFIX}{name}_count{format_labels({label: key})} {cumulative}")
+        for quantile, value in zip(RECENT_QUANTILES, estimate_quantiles(recent)):
+            recent_lines.append(f"{PREFIX}{name}_recent{format_labels({label: key, 'quantile': quantile})} {format_value(value)}")
+    lines.append(f"# HELP {PREFIX}{name}_recent Estimated quantiles of {name} over the last {WINDOW_SECONDS} seconds.")
+    lines.append(f"# TYPE {PREFIX}{name}_recent gauge")
+    lines.extend(recent_lines)
+
+
+def local_metrics(extra=()):
+    """
+    Metrics of this process: (request histograms, stage histograms, failed requests per route,
+    extra), the histograms as render_histograms takes them.
+    """
+    requests = {route: histogram.snapshot() for route, histogram in list(request_histograms.items())}
+    stages = {name: histogram.snapshot() for name, histogram in list(stage_histograms.items())}
+    with histograms_lock:
+        errors = dict(request_errors)
+    return requests, stages, errors, list(extra)
+
+
+def render_metrics(extra=()):
+    """
+    Every metric in the Prometheus text exposition format. extra holds more metrics as
+    (name, type, help, [(labels, value), ...]). In a worker of serve.py they are those of every
+    worker, merged from their snapshots.
+    """
+    if shared_path is None:
+        requests, stages, errors, extra = local_metrics(extra)
+    else:
+        write_snapshot(extra)
+        requests, stages, errors, extra = merge_snapshots()
+    lines = []
+    render_histograms(lines, "request_seconds", "Latency of API requests.", "route", requests)
+    render_histograms(lines, "stage_seconds", "Time per request spent in each stage of the query and ingest paths.", "stage", stages)
+    errors = [({"route": route}, count) for route, count in sorted(errors.items())]
+    extra = [("request_errors_total", "counter", "API requests that failed.", errors)] + list(extra)
+    for name, kind, help_text, samples in extra:
+        lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        lines.extend(f"{PREFIX}{name}{format_labels(labels)} {format_value(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+def share_metrics(path, worker, collect_extra, count_requests=True):
+    """
+    Share this worker process's metrics with the others through a snapshot in path, written
+    every SNAPSHOT_SECONDS and on every scrape. collect_extra returns the process's extra
+    metrics as render_metrics takes them. count_requests=False leaves out the request
+    histograms and failures, for the writer, whose requests the readers count as they pass them on.
+    """
+    global shared_path, worker_name, shares_requests
+    # Observations inherited from the master are its own, not this worker's
+    with histograms_lock:
+        stage_histograms.clear()
+        request_histograms.clear()
+        request_errors.clear()
+    shared_path, worker_name, shares_requests = path, worker, count_requests
+    threading.Thread(target=write_snapshots, args=(collect_extra,), daemon=True).start()
+
+
+def write_snapshots(collect_extra):
+    while True:
+        time.sleep(SNAPSHOT_SECONDS)
+        try:
+            write_snapshot(collect_extra())
+        except Exception as e:
+            print(f"Error writing metrics snapshot: {str(e)}")
+
+
+def write_snapshot(extra):
+    requests, stages, errors, extra = local_metrics(extra)
+    if not shares_requests:
+        requests, errors = {}, {}
+    snapshot = {"worker": worker_name, "time": time.time(), "requests": requests, "stages": stages, "errors": errors, "extra": extra}
+    # One file per process, so a worker started again doesn't take over the counts of the one before it
+    path = os.path.join(shared_path, f"{worker_name}-{os.getpid()}.json")
+    with snapshot_lock:
+        with open(path + ".tmp", "wb") as f:
+            f.write(orjson.dumps(snapshot, option=orjson.OPT_SERIALIZE_NUMPY))
+        os.replace(path + ".tmp", path)
+
+
+def merge_snapshots():
+    """
+    Metrics of every worker, as local_metrics returns them. Histograms and counters add up,
+    including those of workers that have exited, so they never go down; recent windows only
+    count snapshots from within the window. Gauges are labelled with their worker, and left out
+    for workers that have exited.
+    """
+    requests, stages, errors, extra = {}, {}, {}, {}
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(shared_path, "*.json"))):
+        with open(path, "rb") as f:
+            snapshot = orjson.loads(f.read())
+        age = now - snapshot["time"]
+        for merged, histograms in ((requests, snapshot["requests"]), (stages, snapshot["stages"])):
+            for key, (counts, total, recent) in histograms.items():
+                merged_counts, merged_total, merged_recent = merged.get(key, ([0] * len(counts), 0.0, [0] * len(counts)))
+                if age < WINDOW_SECONDS:
+                    merged_recent = [a + b for a, b in zip(merged_recent, recent)]
+                merged[key] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total, merged_recent)
+        for route, count in snapshot["errors"].items():
+            errors[route] = errors.get(route, 0) + count
+        for name, kind, help_text, samples in snapshot["extra"]:
+            merged_samples = extra.setdefault(name, (kind, help_text, {}))[2]
+            for labels, value in samples:
+                if kind == "counter":
+                    key = tuple(labels.items())
+                    merged_samples[key] = (labels, merged_samples.get(key, (labels, 0))[1] + value)
+                elif age < STALE_SECONDS:
+                    labels = dict(labels, worker=snapshot["worker"])
+                    merged_samples[tuple(labels.items())] = (labels, value)
+    extra = [(name, kind, help_text, list(samples.values())) for name, (kind, help_text, samples) in extra.items()]
+    return requests, stages, errors, extra
@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from nltk.stem import WordNetLemmatizer
+from nltk import pos_tag_sents
+from nltk.corpus import stopwords
+
+
+def get_wordnet_pos(treebank_tag):
+    # adjective
+    if treebank_tag.startswith('J'):
+        return 'a'
+    # verb
+    elif treebank_tag.startswith('V'):
+        return 'v'
+    # noun
+    elif treebank_tag.startswith('N'):
+        return 'n'
+    # adverb
+    elif treebank_tag.startswith('R'):
+        return 'r'
+    # for unknown or other tags
+    else:
+        return None
+
+
+class Normalizer:
+    """
+    Stopword removal and POS-aware lemmatization shared by the offline pipeline and the backend.
+    Stopwords are loaded once and lemmas are memoized per lowercased token, up to cache_size entries.
+    """
+
+    def __init__(self, cache_size=200000):
+        self.cache_size = cache_size
+        self.lemmatizer = WordNetLemmatizer()
+        self.stop_words = None
+        self.lemmas = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load_stop_words(self):
+        if self.stop_words is None:
+            self.stop_words = frozenset(stopwords.words('english'))
+        return self.stop_words
+
+    def keep(self, word, alnum_only):
+        # Checks if the word is (optionally) alphanumeric, not a stopword, and greater than 2 characters
+        return (not alnum_only or word.isalnum()) and word not in self.stop_words and len(word) > 2
+
+    def lemmatize_tagged(self, word, treebank_tag):
+        wordnet_pos = get_wordnet_pos(treebank_tag)
+        if wordnet_pos:
+            lemma = self.lemmatizer.lemmatize(word, wordnet_pos)
+        else:
+            # Default to noun if no valid POS
+            lemma = self.lemmatizer.lemmatize(word)
+        return lemma.lower()
+
+    def lemmatize_words(self, words):
+        """
+        Lemmas of lowercased words. Words missing from the cache are POS tagged in a single call.
+        """
+        with self.lock:
+            missing = list(dict.fromkeys(word for word in words if word not in self.lemmas))
+
+        new_lemmas = {}
+        if missing:
+            # Each word is tagged as its own one-word sentence, the same context it always had,
+            # so the lemmas match tagging the words one at a time
+            tagged = pos_tag_sents([[word] for word in missing])
+            for word, tags in zip(missing, tagged):
+                new_lemmas[word] = self.lemmatize_tagged(word, tags[0][1])
+
+        with self.lock:
+            result = []
+            for word in words:
+                lemma = new_lemmas.get(word)
+                if lemma is None:
+                    lemma = self.lemmas.get(word)
+                if lemma is None:
+                    # Evicted by another thread since the first lookup
+                    lemma = self.lemmatize_tagged(word, pos_tag_sents([[word]])[0][0][1])
+                self.lemmas[word] = lemma
+                self.lemmas.move_to_end(word)
+                result.append(lemma)
+            while len(self.lemmas) > self.cache_size:
+                self.lemmas.popitem(last=False)
+        return result
+
+    def normalize(self, tokens, alnum_only=True):
+        """
+        Lowercase, filter and lemmatize a sequence of tokens.
+        """
+        return self.normalize_batch([tokens], alnum_only)[0]
+
+    def normalize_batch(self, token_lists, alnum_only=True):
+        """
+        Normalize many token sequences at once, tagging all of their uncached words together.
+        """
+        self.load_stop_words()
+        kept = [
+            [word for word in (token.lower() for token in tokens) if self.keep(word, alnum_only)]
+            for tokens in token_lists
+        ]
+        lemmas = iter(self.lemmatize_words([word for words in kept for word in words]))
+        return [[next(lemmas) for _ in words] for words in kept]
+
+
+# One shared instance so every caller reuses the same stopwords and lemma cache
+normalizer = Normalizer()
@@ -0,0 +1,442 @@
+import numpy as np
+
+# A term's postings are stored compressed, in blocks of BLOCK_SIZE postings:
+#   header       uint32 x 3         posting count, block count, bytes of the doc id section
+#   skip table   uint32 x blocks x 3  last doc id of the block, where the block starts in the
+#                                   doc id section and in the frequency section
+#   doc ids      variable-byte gaps between consecutive doc ids (the first from 0)
+#   frequencies  variable-byte (title, abstract, keywords) frequencies, 3 per posting
+# Byte offsets and field lengths are per document, so they live in the DocTable instead
+# of being repeated in every posting. Decoded postings take POSTING_SIZE bytes each.
+POSTING_SIZE = 8 + 4 + 2 * 3 + 2 * 3
+FIELD_MAX = np.iinfo(np.uint16).max
+BLOCK_SIZE = 128
+HEADER_SIZE = 3 * 4
+
+
+class PostingList:
+    """
+    Typed, read-only view over one term's postings.
+    """
+    __slots__ = ("doc_ids", "byte_offsets", "frequencies", "lengths", "nbytes")
+
+    def __init__(self, doc_ids, byte_offsets, frequencies, lengths, nbytes):
+        self.doc_ids = doc_ids
+        self.byte_offsets = byte_offsets
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.nbytes = nbytes
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def select(self, indices):
+        """
+        Postings at the given positions, copied out of the underlying buffer.
+        """
+        return PostingList(
+            self.doc_ids[indices], self.byte_offsets[indices],
+            self.frequencies[indices], self.lengths[indices], len(indices) * POSTING_SIZE,
+        )
+
+
+def varbyte_encode(values):
+    """
+    Variable-byte encode non-negative integers, 7 bits per byte, low bits first.
+    The high bit of a byte is set when more bytes of the same value follow.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        sizes += values >= (1 << shift)
+    starts = np.cumsum(sizes) - sizes
+    value_index = np.repeat(np.arange(len(values)), sizes)
+    byte_index = np.arange(int(sizes.sum())) - starts[value_index]
+    groups = (values[value_index] >> (7 * byte_index).astype(np.uint64)) & np.uint64(0x7F)
+    more = byte_index < sizes[value_index] - 1
+    return (groups | (more.astype(np.uint64) << np.uint64(7))).astype(np.uint8), starts
+
+
+def varbyte_decode(data):
+    """
+    Decode a whole run of variable-byte integers at once.
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = (data & 0x80) == 0
+    if last.all():
+        # Every value fits in one byte, as most frequencies do
+        return data.astype(np.uint64)
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    value_index = np.cumsum(np.concatenate(([0], last[:-1])))
+    byte_index = np.arange(len(data)) - starts[value_index]
+    groups = (data & 0x7F).astype(np.uint64) << (7 * byte_index).astype(np.uint64)
+    return np.add.reduceat(groups, starts)
+
+
+def encode_postings(doc_ids, frequencies):
+    """
+    Compress a term's postings, sorted by doc id. Frequencies is an (n, 3) array.
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    frequencies = np.clip(np.asarray(frequencies).reshape(-1, 3), 0, FIELD_MAX)
+    gaps = np.diff(doc_ids, prepend=0)
+    doc_bytes, doc_starts = varbyte_encode(gaps)
+    freq_bytes, freq_starts = varbyte_encode(frequencies.ravel())
+
+    # Skip pointers: a reader can find the block holding a doc id and decode only that block
+    block_starts = np.arange(0, len(doc_ids), BLOCK_SIZE)
+    block_ends = np.minimum(block_starts + BLOCK_SIZE, len(doc_ids)) - 1
+    skips = np.stack([doc_ids[block_ends], doc_starts[block_starts], freq_starts[3 * block_starts]], axis=1)
+    header = np.array([len(doc_ids), len(block_starts), len(doc_bytes)], dtype="<u4")
+    return b"".join([header.tobytes(), skips.astype("<u4").tobytes(), doc_bytes.tobytes(), freq_bytes.tobytes()])
+
+
+def write_postings(f, count, pieces):
+    """
+    Write count postings to f as encode_postings lays them out, one piece at a time, so memory
+    follows the piece size rather than the length of the list. pieces() returns a fresh iterator
+    of (doc_ids, frequencies) pieces in doc id order; it is read once per column. The header and
+    skip table go in last, over the space left for them. Returns the number of bytes written.
+    """
+    start = f.tell()
+    skips = np.zeros((-(-count // BLOCK_SIZE), 3), dtype="<u4")
+    f.seek(start + HEADER_SIZE + skips.nbytes)
+
+    # Doc ids first: gaps carry on from the last doc id of the previous piece
+    first, last, doc_size = 0, 0, 0
+    for doc_ids, _ in pieces():
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if not len(doc_ids):
+            continue
+        data, starts = varbyte_encode(np.diff(doc_ids, prepend=last))
+        index = np.arange(first, first + len(doc_ids))
+        block_start = index % BLOCK_SIZE == 0
+        skips[index[block_start] // BLOCK_SIZE, 1] = doc_size + starts[block_start]
+        block_end = (index % BLOCK_SIZE == BLOCK_SIZE - 1) | (index == count - 1)
+        skips[index[block_end] // BLOCK_SIZE, 0] = doc_ids[block_end]
+        f.write(data.tobytes())
+        first, last, doc_size = first + len(doc_ids), int(doc_ids[-1]), doc_size + len(data)
+
+    first, freq_size = 0, 0
+    for _, frequencies in pieces():
+        frequencies = np.clip(np.asarray(frequencies).reshape(-1, 3), 0, FIELD_MAX)
+        if not len(frequencies):
+            continue
+        data, starts = varbyte_encode(frequencies.ravel())
+        index = np.arange(first, first + len(frequencies))
+        block_start = index % BLOCK_SIZE == 0
+        skips[index[block_start] // BLOCK_SIZE, 2] = freq_size + starts[3 * np.flatnonzero(block_start)]
+        f.write(data.tobytes())
+        first, freq_size = first + len(frequencies), freq_size + len(data)
+
+    end = f.tell()
+    f.seek(start)
+    f.write(np.array([count, len(skips), doc_size], dtype="<u4").tobytes() + skips.tobytes())
+    f.seek(end)
+    return end - start
+
+
+def read_header(buffer):
+    count, num_blocks, doc_size = np.frombuffer(buffer, dtype="<u4", count=3).tolist()
+    skips = np.frombuffer(buffer, dtype="<u4", count=3 * num_blocks, offset=HEADER_SIZE).reshape(num_blocks, 3)
+    doc_start = HEADER_SIZE + skips.nbytes
+    return count, skips, doc_start, doc_start + doc_size
+
+
+def last_doc_id(buffer):
+    """
+    Highest doc id of an encoded posting list, read from its skip table.
+    """
+    count, skips, _, _ = read_header(buffer)
+    return int(skips[-1, 0]) if count else None
+
+
+def find_block(buffer, doc_id):
+    """
+    Index of the block that holds doc_id if the list has it, using the skip table.
+    Returns None past the end of the list.
+    """
+    _, skips, _, _ = read_header(buffer)
+    block = int(np.searchsorted(skips[:, 0], doc_id))
+    return block if block < len(skips) else None
+
+
+def candidate_blocks(buffer, doc_ids):
+    """
+    Blocks that can hold any of the sorted doc_ids, found from the skip table alone.
+    """
+    _, skips, _, _ = read_header(buffer)
+    blocks = np.searchsorted(skips[:, 0], doc_ids)
+    return np.unique(blocks[blocks < len(skips)]).tolist()
+
+
+def intersect_sorted(a, b):
+    """
+    Values present in both sorted, duplicate-free arrays. The shorter array gallops through
+    the longer: each of its values is binary searched within the part of the longer array
+    that overlaps it, so the cost follows the shorter list rather than the sum of both.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a) or not len(b):
+        return a[:0]
+    # Skip the parts of the longer array outside the shorter one's range
+    b = b[np.searchsorted(b, a[0]):np.searchsorted(b, a[-1], side="right")]
+    indices = np.searchsorted(b, a)
+    found = indices < len(b)
+    found[found] = b[indices[found]] == a[found]
+    return a[found]
+
+
+def decode_columns(buffer, blocks=None):
+    """
+    Doc ids and (n, 3) frequencies of the whole list, or of only the given blocks.
+    """
+    count, skips, doc_start, freq_start = read_header(buffer)
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if blocks is None:
+        doc_ids = np.cumsum(varbyte_decode(data[doc_start:freq_start])).astype(np.uint32)
+        frequencies = varbyte_decode(data[freq_start:]).astype(np.uint16).reshape(-1, 3)
+        return doc_ids, frequencies
+
+    doc_parts, freq_parts = [], []
+    for block in blocks:
+        doc_end = doc_start + int(skips[block + 1, 1]) if block + 1 < len(skips) else freq_start
+        freq_end = freq_start + int(skips[block + 1, 2]) if block + 1 < len(skips) else len(data)
+        # Gaps restart from the last doc id of the previous block
+        base = int(skips[block - 1, 0]) if block else 0
+        doc_parts.append(base + np.cumsum(varbyte_decode(data[doc_start + int(skips[block, 1]):doc_end])))
+        freq_parts.append(varbyte_decode(data[freq_start + int(skips[block, 2]):freq_end]))
+    if not doc_parts:
+        return np.zeros(0, dtype=np.uint32), np.zeros((0, 3), dtype=np.uint16)
+    return (
+        np.concatenate(doc_parts).astype(np.uint32),
+        np.concatenate(freq_parts).astype(np.uint16).reshape(-1, 3),
+    )
+
+
+def decode_postings(buffer, doc_table, blocks=None):
+    """
+    Decode an encoded posting list, filling in byte offsets and lengths from the doc table.
+    """
+    doc_ids, frequencies = decode_columns(buffer, blocks)
+    byte_offsets, lengths = doc_table.lookup(doc_ids)
+    return PostingList(doc_ids, byte_offsets, frequencies, lengths, len(doc_ids) * POSTING_SIZE)
+
+
+def concat_postings(postings_lists):
+    """
+    Join posting lists that cover increasing doc id ranges. Returns None for an empty list.
+    """
+    if not postings_lists:
+        return None
+    if len(postings_lists) == 1:
+        return postings_lists[0]
+    return PostingList(
+        np.concatenate([p.doc_ids for p in postings_lists]),
+        np.concatenate([p.byte_offsets for p in postings_lists]),
+        np.concatenate([p.frequencies for p in postings_lists]),
+        np.concatenate([p.lengths for p in postings_lists]),
+        sum(p.nbytes for p in postings_lists),
+    )
+
+
+def encode_positions(counts, positions):
+    """
+    Compress the positions of a term's postings. counts[i] positions of posting i come next in
+    positions, ascending. Layout: uint32 posting count, uint32 x (n + 1) byte starts of each
+    posting's positions, then variable-byte gaps restarting at every posting, so the positions
+    of any one posting can be decoded on their own.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    gaps = np.diff(positions, prepend=0)
+    posting_starts = np.cumsum(counts) - counts
+    nonempty = posting_starts[counts > 0]
+    gaps[nonempty] = positions[nonempty]
+    data, value_starts = varbyte_encode(gaps)
+    byte_starts = np.append(value_starts, len(data))[np.append(posting_starts, len(positions))]
+    return b"".join([np.array([len(counts)], dtype="<u4").tobytes(), byte_starts.astype("<u4").tobytes(), data.tobytes()])
+
+
+def write_positions(f, count, pieces):
+    """
+    Write the positions of count postings to f as encode_positions lays them out, one piece at a
+    time. pieces() returns an iterator of (counts, positions) pieces in posting order. Byte starts
+    are written into the space left for them as each piece is encoded. Returns the number of
+    bytes written.
+    """
+    start = f.tell()
+    data_start = start + 4 * (count + 2)
+    f.write(np.array([count], dtype="<u4").tobytes())
+    first, data_size = 0, 0
+    for counts, positions in pieces():
+        counts = np.asarray(counts, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(counts):
+            continue
+        # Pieces hold whole postings, so gaps restart at every posting within the piece alone
+        gaps = np.diff(positions, prepend=0)
+        posting_starts = np.cumsum(counts) - counts
+        nonempty = posting_starts[counts > 0]
+        gaps[nonempty] = positions[nonempty]
+        data, value_starts = varbyte_encode(gaps)
+        byte_starts = data_size + np.append(value_starts, len(data))[posting_starts]
+        f.seek(start + 4 * (first + 1))
+        f.write(byte_starts.astype("<u4").tobytes())
+        f.seek(data_start + data_size)
+        f.write(data.tobytes())
+        first, data_size = first + len(counts), data_size + len(data)
+    f.seek(start + 4 * (count + 1))
+    f.write(np.array([data_size], dtype="<u4").tobytes())
+    f.seek(data_start + data_size)
+    return data_start + data_size - start
+
+
+def decode_positions(buffer, indices=None):
+    """
+    Positions of the postings at the given indices (all postings by default), one array each.
+    """
+    n = int(np.frombuffer(buffer, dtype="<u4", count=1)[0])
+    byte_starts = np.frombuffer(buffer, dtype="<u4", count=n + 1, offset=4)
+    data = np.frombuffer(buffer, dtype=np.uint8, offset=4 * (n + 2))
+    indices = range(n) if indices is None else indices
+    return [
+        np.cumsum(varbyte_decode(data[byte_starts[i]:byte_starts[i + 1]])).astype(np.uint32)
+        for i in indices
+    ]
+
+
+def decode_all_positions(buffer):
+    """
+    (counts, positions) of every posting, flat as encode_positions takes them.
+    """
+    n = int(np.frombuffer(buffer, dtype="<u4", count=1)[0])
+    byte_starts = np.frombuffer(buffer, dtype="<u4", count=n + 1, offset=4).astype(np.int64)
+    data = np.frombuffer(buffer, dtype=np.uint8, offset=4 * (n + 2))
+    gaps = varbyte_decode(data).astype(np.int64)
+    # A value ends at every byte without the continuation bit
+    ended = np.concatenate(([0], np.cumsum((data & 0x80) == 0)))
+    counts = ended[byte_starts[1:]] - ended[byte_starts[:-1]]
+    # Running sums restart at each posting
+    totals = np.cumsum(gaps)
+    posting_starts = np.cumsum(counts) - counts
+    restart = np.concatenate(([0], totals))[posting_starts]
+    return counts, (totals - np.repeat(restart, counts)).astype(np.uint32)
+
+
+def encode_impacts(doc_ids, impacts):
+    """
+    Impact-ordered copy of a term's postings, for score-at-a-time queries: its doc ids grouped
+    into segments of equal quantized impact, highest impact first. Layout: uint32 segment
+    count n, posting count and highest doc id, uint32 x n impact of each segment,
+    uint32 x (n + 1) byte starts of each segment's doc ids, then variable-byte gaps between
+    ascending doc ids, restarting at every segment.
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    impacts = np.asarray(impacts, dtype=np.int64)
+    order = np.lexsort((doc_ids, -impacts))
+    doc_ids, impacts = doc_ids[order], impacts[order]
+    segment_starts = np.flatnonzero(np.diff(impacts, prepend=-1))
+    gaps = np.diff(doc_ids, prepend=0)
+    gaps[segment_starts] = doc_ids[segment_starts]
+    data, value_starts = varbyte_encode(gaps)
+    byte_starts = np.append(value_starts, len(data))[np.append(segment_starts, len(doc_ids))]
+    header = np.array([len(segment_starts), len(doc_ids), int(doc_ids.max()) if len(doc_ids) else 0], dtype="<u4")
+    return b"".join([header.tobytes(), impacts[segment_starts].astype("<u4").tobytes(), byte_starts.astype("<u4").tobytes(), data.tobytes()])
+
+
+def impact_segments(doc_ids, impacts, last):
+    """
+    A piece of postings in doc id order regrouped by impact, with gaps from last[impact], the
+    previous doc id of each impact, which is then moved on past the piece. Returns the doc ids,
+    impacts and gaps in the new order, and where each impact's group starts.
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    impacts = np.asarray(impacts, dtype=np.int64)
+    order = np.argsort(impacts, kind="stable")
+    doc_ids, impacts = doc_ids[order], impacts[order]
+    previous = np.roll(doc_ids, 1)
+    level_starts = np.flatnonzero(np.diff(impacts, prepend=-1))
+    previous[level_starts] = last[impacts[level_starts]]
+    last[impacts[level_starts]] = doc_ids[np.append(level_starts[1:], len(doc_ids)) - 1]
+    return doc_ids, impacts, doc_ids - previous, level_starts
+
+
+def write_impacts(f, pieces):
+    """
+    Write a term's postings to f as encode_impacts lays them out, one piece at a time.
+    pieces() returns a fresh iterator of (doc_ids, impacts) pieces in doc id order, impacts
+    from 0 to 255. A first pass sizes every segment, so the second can write each piece's doc ids
+    straight to their segments. Returns the number of bytes written.
+    """
+    counts = np.zeros(256, dtype=np.int64)
+    sizes = np.zeros(256, dtype=np.int64)
+    last = np.zeros(256, dtype=np.int64)
+    for doc_ids, impacts in pieces():
+        if not len(doc_ids):
+            continue
+        _, impacts, gaps, _ = impact_segments(doc_ids, impacts, last)
+        data, value_starts = varbyte_encode(gaps)
+        counts += np.bincount(impacts, minlength=256)
+        sizes += np.bincount(impacts, weights=np.diff(np.append(value_starts, len(data))), minlength=256).astype(np.int64)
+
+    # Segments go highest impact first
+    levels = np.flatnonzero(counts)[::-1]
+    byte_starts = np.concatenate(([0], np.cumsum(sizes[levels])))
+    start = f.tell()
+    data_start = start + 4 * (3 + 2 * len(levels) + 1)
+    header = np.array([len(levels), int(counts.sum()), int(last.max())], dtype="<u4")
+    f.write(header.tobytes() + levels.astype("<u4").tobytes() + byte_starts.astype("<u4").tobytes())
+
+    cursors = np.zeros(256, dtype=np.int64)
+    cursors[levels] = data_start + byte_starts[:-1]
+    last[:] = 0
+    for doc_ids, impacts in pieces():
+        if not len(doc_ids):
+            continue
+        _, impacts, gaps, level_starts = impact_segments(doc_ids, impacts, last)
+        data, value_starts = varbyte_encode(gaps)
+        byte_bounds = np.append(value_starts, len(data))[np.append(level_starts, len(impacts))]
+        for level, begin, end in zip(impacts[level_starts].tolist(), byte_bounds[:-1].tolist(), byte_bounds[1:].tolist()):
+            f.seek(cursors[level])
+            f.write(data[begin:end].tobytes())
+            cursors[level] += end - begin
+    f.seek(data_start + byte_starts[-1])
+    return int(data_start + byte_starts[-1] - start)
+
+
+class ImpactList:
+    """
+    Read-only view over a term's encoded impact-ordered postings. Segments are decoded in
+    ranges, so a query that stops early never decodes the low impact ones.
+    """
+    __slots__ = ("impacts", "starts", "data", "count", "last_doc_id")
+
+    def __init__(self, buffer):
+        num_segments, self.count, self.last_doc_id = np.frombuffer(buffer, dtype="<u4", count=3).tolist()
+        self.impacts = np.frombuffer(buffer, dtype="<u4", count=num_segments, offset=12)
+        self.starts = np.frombuffer(buffer, dtype="<u4", count=num_segments + 1, offset=12 + 4 * num_segments)
+        self.data = np.frombuffer(buffer, dtype=np.uint8, offset=16 + 8 * num_segments)
+
+    def __len__(self):
+        return len(self.impacts)
+
+    def decode(self, first, last):
+        """
+        Doc ids and impacts of the postings in segments first..last-1, decoded in one pass.
+        """
+        begin = int(self.starts[first])
+        starts = self.starts[first:last + 1].astype(np.int64) - begin
+        data = self.data[begin:begin + int(starts[-1])]
+        gaps = varbyte_decode(data).astype(np.int64)
+        # A value ends at every byte without the continuation bit
+        ended = np.concatenate(([0], np.cumsum((data & 0x80) == 0)))
+        counts = ended[starts[1:]] - ended[starts[:-1]]
+        # Running sums restart at each segment
+        totals = np.cumsum(gaps)
+        segment_starts = np.cumsum(counts) - counts
+        restart = np.concatenate(([0], totals))[segment_starts]
+        return (totals - np.repeat(restart, counts)).astype(np.uint32), np.repeat(self.impacts[first:last], counts)
@@ -0,0 +1,103 @@
+import re
+
+# Words, quoted phrases and parentheses
+TOKEN_PATTERN = re.compile(r'"[^"]*"|\(|\)|[^\s()"]+')
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+def is_boolean(query):
+    """
+    Whether a query uses the boolean syntax: AND, OR, NOT (in capitals) or parentheses.
+    """
+    return any(token in OPERATORS or token in "()" for token in TOKEN_PATTERN.findall(query))
+
+
+def parse_boolean(query, normalise):
+    """
+    Parse a boolean query into a tree of tuples:
+        ("term", word)  ("phrase", (word, ...))  ("and", (node, ...))  ("or", (node, ...))  ("not", node)
+    NOT binds tightest, then AND, then OR. Operands next to each other without an operator
+    are ORed, as in plain queries, except that a NOT operand is always ANDed with what precedes it:
+    neural AND (network OR net) NOT "spiking network"
+    normalise turns query text into index terms; words it drops (stop words) are left out.
+    Raises ValueError on malformed queries.
+    """
+    tokens = TOKEN_PATTERN.findall(query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() is not None and peek() != ")":
+            if peek() == "OR":
+                take()
+            children.append(parse_and())
+        return combine("or", children)
+
+    def parse_and():
+        children = [parse_unary()]
+        while peek() in ("AND", "NOT"):
+            if peek() == "AND":
+                take()
+            children.append(parse_unary())
+        return combine("and", children)
+
+    def parse_unary():
+        token = peek()
+        if token is None or token in (")", "AND", "OR"):
+            raise ValueError(f"Expected a term at position {position} of the query")
+        take()
+        if token == "NOT":
+            child = parse_unary()
+            return None if child is None else ("not", child)
+        if token == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Unbalanced parentheses in query")
+            take()
+            return node
+        if token.startswith('"'):
+            words = tuple(normalise(token.strip('"')))
+            if len(words) > 1:
+                return ("phrase", words)
+            return ("term", words[0]) if words else None
+        # One query word can normalise to several terms or to none
+        return combine("or", [("term", word) for word in normalise(token)])
+
+    expression = parse_or()
+    if peek() is not None:
+        raise ValueError("Unbalanced parentheses in query")
+    return expression
+
+
+def combine(operator, children):
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return (operator, tuple(children))
+
+
+def expression_terms(expression, negated=False):
+    """
+    Terms of an expression, in query order. With negated False only the terms that can
+    contribute to a match (not under a NOT) are returned, otherwise every term.
+    """
+    if expression is None:
+        return []
+    kind, value = expression
+    if kind == "term":
+        return [value]
+    if kind == "phrase":
+        return list(value)
+    if kind == "not":
+        return expression_terms(value, negated) if negated else []
+    return [term for child in value for term in expression_terms(child, negated)]
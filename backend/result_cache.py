@@ -0,0 +1,94 @@
+import time
+import threading
+from collections import OrderedDict, defaultdict
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of ranked search results keyed by the normalised query.
+    Entries expire after ttl seconds and the least recently used ones are evicted
+    once their estimated size passes max_bytes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, size, expires_at, terms)
+        self.keys_by_term = defaultdict(set)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, terms, size):
+        """
+        Cache a value computed from the given terms. size is its estimated size in bytes.
+        """
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            terms = frozenset(terms)
+            self.entries[key] = (value, size, time.monotonic() + self.ttl, terms)
+            self.current_bytes += size
+            for term in terms:
+                self.keys_by_term[term].add(key)
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_terms(self, terms):
+        """
+        Drop every cached query that uses any of the given terms.
+        """
+        with self.lock:
+            for term in terms:
+                for key in list(self.keys_by_term.get(term, ())):
+                    self._remove(key)
+
+    def invalidate_all(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_term.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.current_bytes -= entry[1]
+        for term in entry[3]:
+            keys = self.keys_by_term.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_term[term]
@@ -0,0 +1,314 @@
+import math
+import time
+import numpy as np
+from forward_store import FIELD_POSITION_GAP
+
+# Title matches count 5x, keyword matches 3/5x and abstract matches 1x, each relative to the field length
+FIELD_WEIGHTS = np.array([5.0, 1.0, 0.6], dtype=np.float32)
+# Corpus statistics of the original 200,000 paper corpus, replaced by set_corpus_stats
+# with those an index was built with, so every shard scores against the whole corpus
+AVG_DOC_LENGTH = 112.766185
+NUM_DOCS = 200000
+# Impacts are saturations (BM25 scores without idf) quantized to 8 bits against each term's own
+# highest saturation, kept in the term dictionary as its impact scale, so a posting adds
+# idf * impact * scale to its document's score
+IMPACT_LEVELS = 255
+# Score-at-a-time queries check their budget after every this many bytes of impact postings
+IMPACT_BATCH_BYTES = 16 * 1024
+
+
+def set_corpus_stats(num_docs, avg_doc_length):
+    global NUM_DOCS, AVG_DOC_LENGTH
+    NUM_DOCS = num_docs
+    AVG_DOC_LENGTH = avg_doc_length
+
+
+def bm25_idf(doc_freq, num_docs=None):
+    num_docs = num_docs or NUM_DOCS
+    return math.log((num_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
+
+
+def weighted_term_frequency(frequencies, lengths):
+    """
+    Field-weighted, length-normalised term frequency for every posting at once.
+    Fields with zero length contribute nothing.
+    """
+    frequencies = frequencies.astype(np.float32)
+    lengths = lengths.astype(np.float32)
+    per_field = np.divide(frequencies, lengths, out=np.zeros_like(frequencies), where=lengths > 0)
+    # Summed element-wise rather than with a matrix product, whose rounding depends on where a
+    # posting falls in the array; a document must score the same in any list, shard or delta
+    return per_field[:, 0] * FIELD_WEIGHTS[0] + per_field[:, 1] * FIELD_WEIGHTS[1] + per_field[:, 2] * FIELD_WEIGHTS[2]
+
+
+def term_scores(postings, idf, k1=1.5, b=0.75, avg_doc_length=None):
+    """
+    BM25 contribution of one term to each document in its posting list.
+    """
+    avg_doc_length = avg_doc_length or AVG_DOC_LENGTH
+    term_freq = weighted_term_frequency(postings.frequencies, postings.lengths)
+    doc_length = postings.lengths.sum(axis=1, dtype=np.float32)
+    denominator = term_freq + np.float32(k1) * (np.float32(1 - b) + np.float32(b) * (doc_length / np.float32(avg_doc_length)))
+    return np.float32(idf) * (term_freq * np.float32(k1 + 1)) / denominator
+
+
+def score_postings(postings_lists, idfs, k1=1.5, b=0.75, avg_doc_length=None):
+    """
+    Accumulate the BM25 scores of several terms into a dense float32 array indexed by doc id.
+    Also returns a dense array of byte offsets so matches can be read back from the data file.
+    """
+    num_slots = 1 + max((int(p.doc_ids.max()) for p in postings_lists if len(p)), default=0)
+    scores = np.zeros(num_slots, dtype=np.float32)
+    byte_offsets = np.zeros(num_slots, dtype=np.uint64)
+
+    for postings, idf in zip(postings_lists, idfs):
+        if not len(postings):
+            continue
+        # Doc ids are unique within a posting list, so a plain fancy-index add is safe
+        scores[postings.doc_ids] += term_scores(postings, idf, k1, b, avg_doc_length)
+        byte_offsets[postings.doc_ids] = postings.byte_offsets
+
+    return scores, byte_offsets
+
+
+def rank(scores):
+    """
+    Doc ids with a non-zero score, best first.
+    """
+    doc_ids = np.flatnonzero(scores)
+    order = np.argsort(-scores[doc_ids], kind="stable")
+    return doc_ids[order]
+
+
+def impact_scale(max_saturation):
+    """
+    Impact scale of a term whose highest saturation is max_saturation. Kept as float32 in the
+    dictionary, so it is rounded to the value queries will read back.
+    """
+    return float(np.float32(max(max_saturation, np.finfo(np.float32).tiny) / IMPACT_LEVELS))
+
+
+def quantize_impacts(saturations, scale=None):
+    """
+    8-bit impacts of a term's postings, and the scale they are on: the term's highest
+    saturation is level IMPACT_LEVELS. Every posting gets at least 1, so no match is lost to
+    rounding, and no impact is more than one scale step from its saturation. Pass the scale
+    to quantize part of a term's postings at a time.
+    """
+    saturations = np.asarray(saturations, dtype=np.float64)
+    scale = impact_scale(saturations.max()) if scale is None else scale
+    levels = np.rint(saturations / scale)
+    return np.clip(levels, 1, IMPACT_LEVELS).astype(np.uint8), scale
+
+
+def impact_unit(idf, scale, k1=1.5):
+    """
+    Score one impact level of a term adds. Indexes from before impacts were scaled per term
+    store no scale; theirs is the single (k1 + 1) / IMPACT_LEVELS.
+    """
+    return idf * (scale if scale > 0 else (k1 + 1) / IMPACT_LEVELS)
+
+
+def accumulate_impacts(impact_lists, weights, accumulators, deadline=None, max_postings=None):
+    """
+    Score-at-a-time accumulation: the impact segments of every term are added to the dense
+    accumulators in decreasing order of what they add (weight x impact), whatever term they
+    belong to. Once the deadline (a time.perf_counter() value) passes or max_postings have been
+    added, the rest are skipped; they are the smallest contributions, so the scores so far
+    are the best available approximation. Both are checked every IMPACT_BATCH_BYTES of
+    postings. Returns (postings added, whether every segment was).
+    """
+    if not impact_lists:
+        return 0, True
+    contributions = np.concatenate([weight * impact_list.impacts for impact_list, weight in zip(impact_lists, weights)])
+    terms = np.concatenate([np.full(len(impact_list), term) for term, impact_list in enumerate(impact_lists)])
+    segments = np.concatenate([np.arange(len(impact_list)) for impact_list in impact_lists])
+    sizes = np.concatenate([np.diff(impact_list.starts) for impact_list in impact_lists])
+    # Stable, so equal contributions keep term order. A term's segments come up highest impact
+    # first, which is their order in its list, so what is done of a term is always a prefix.
+    order = np.argsort(-contributions, kind="stable")
+    ends = np.cumsum(sizes[order])
+    done = np.zeros(len(impact_lists), dtype=np.int64)
+    added = 0
+    position = 0
+    while position < len(order):
+        if added and ((deadline is not None and time.perf_counter() >= deadline) or (max_postings is not None and added >= max_postings)):
+            return added, False
+        already = ends[position - 1] if position else 0
+        end = max(int(np.searchsorted(ends, already + IMPACT_BATCH_BYTES, side="right")), position + 1)
+        upto = done.copy()
+        np.maximum.at(upto, terms[order[position:end]], segments[order[position:end]] + 1)
+        for term in np.flatnonzero(upto > done).tolist():
+            doc_ids, impacts = impact_lists[term].decode(int(done[term]), int(upto[term]))
+            # A document is in a term's list once, so its doc ids are unique
+            accumulators[doc_ids] += np.float32(weights[term]) * impacts.astype(np.float32)
+            added += len(doc_ids)
+        done = upto
+        position = end
+    return added, True
+
+
+def impact_candidates(accumulators, error, k):
+    """
+    Doc ids that can still be in the exact top k after score-at-a-time accumulation, where no
+    accumulated score is more than error from the exact one: those within 2 x error of the
+    k-th best. Every other document scores below the k-th exact score.
+    """
+    scored = np.flatnonzero(accumulators)
+    if len(scored) <= k:
+        return scored
+    # Margin for float32 rounding in the accumulators
+    threshold = kth_largest(accumulators[scored], k) * (1 - 1e-5) - 2 * error * 1.0001
+    return scored[accumulators[scored] >= threshold]
+
+
+def rescore(postings_lists, idfs, upper_bounds, candidates, num_slots, k1=1.5, b=0.75, avg_doc_length=None):
+    """
+    Exact BM25 scores of the candidates (sorted doc ids) in a dense array. Terms are added in
+    the order score_top_k adds them, so the scores are identical to its own.
+    """
+    scores = np.zeros(num_slots, dtype=np.float32)
+    for i in sorted(range(len(postings_lists)), key=lambda i: upper_bounds[i], reverse=True):
+        postings = postings_lists[i]
+        if postings is None or not len(postings) or not len(candidates):
+            continue
+        found = np.minimum(np.searchsorted(postings.doc_ids, candidates), len(postings) - 1)
+        hits = postings.doc_ids[found] == candidates
+        if np.any(hits):
+            matched = postings.select(found[hits])
+            scores[matched.doc_ids] += term_scores(matched, idfs[i], k1, b, avg_doc_length)
+    return scores
+
+
+def upper_bound(max_score, idf, k1=1.5):
+    """
+    Highest score a term can add to any document. Saturation never reaches k1 + 1,
+    which is the fallback for terms indexed without a stored max score.
+    """
+    # Small margin so float32 rounding in the kernel never exceeds the bound
+    return idf * (max_score if max_score > 0 else k1 + 1) * 1.0001
+
+
+def estimate_total_hits(doc_freqs, num_docs=None):
+    """
+    Expected number of documents matching any of the terms, assuming they occur independently.
+    """
+    num_docs = num_docs or NUM_DOCS
+    miss_probability = 1.0
+    for doc_freq in doc_freqs:
+        miss_probability *= 1 - min(doc_freq, num_docs) / num_docs
+    estimate = round(num_docs * (1 - miss_probability))
+    return max(estimate, max(doc_freqs, default=0))
+
+
+def kth_largest(scores, k):
+    if len(scores) < k:
+        return np.float32(0)
+    return np.partition(scores, len(scores) - k)[len(scores) - k]
+
+
+def score_top_k(postings_lists, idfs, upper_bounds, k, k1=1.5, b=0.75, avg_doc_length=None):
+    """
+    MaxScore top-k retrieval. Terms are scored from the highest upper bound down; once the
+    bounds of the remaining terms add up to less than the current k-th best score, no unseen
+    document can enter the top k, so the remaining terms are only looked up for the candidates
+    that still can.
+    Returns (doc ids best first, their scores, byte offsets, number of documents scored,
+    whether any term was pruned). Without pruning the number scored is the exact hit count.
+    """
+    order = sorted(range(len(postings_lists)), key=lambda i: upper_bounds[i], reverse=True)
+    remaining = [0.0] * (len(order) + 1)
+    for position in range(len(order) - 1, -1, -1):
+        remaining[position] = remaining[position + 1] + upper_bounds[order[position]]
+
+    num_slots = 1 + max((int(p.doc_ids.max()) for p in postings_lists if len(p)), default=0)
+    scores = np.zeros(num_slots, dtype=np.float32)
+    byte_offsets = np.zeros(num_slots, dtype=np.uint64)
+    candidates = None
+
+    for position, i in enumerate(order):
+        postings = postings_lists[i]
+        if not len(postings):
+            continue
+
+        if candidates is None:
+            threshold = kth_largest(scores[scores > 0], k)
+            if remaining[position] > threshold:
+                # Essential term: any of its documents could still make the top k
+                scores[postings.doc_ids] += term_scores(postings, idfs[i], k1, b, avg_doc_length)
+                byte_offsets[postings.doc_ids] = postings.byte_offsets
+                continue
+            candidates = np.flatnonzero(scores)
+
+        # Non-essential term: drop candidates that cannot reach the k-th score, then
+        # look the survivors up in the doc id sorted posting list instead of scoring it all
+        threshold = kth_largest(scores[candidates], k)
+        candidates = candidates[scores[candidates] + np.float32(remaining[position]) >= threshold]
+        found = np.searchsorted(postings.doc_ids, candidates)
+        found = np.minimum(found, len(postings) - 1)
+        hits = postings.doc_ids[found] == candidates
+        if np.any(hits):
+            matched = postings.select(found[hits])
+            scores[matched.doc_ids] += term_scores(matched, idfs[i], k1, b, avg_doc_length)
+
+    top = select_top_k(scores, k)
+    num_scored = int(np.count_nonzero(scores))
+    return top, scores[top], byte_offsets[top], num_scored, candidates is not None
+
+
+def select_top_k(scores, k):
+    """
+    Doc ids of the k best non-zero scores of a dense score array, best first.
+    """
+    scored = np.flatnonzero(scores)
+    if len(scored) > k:
+        # Documents tied with the k-th score are taken lowest doc id first, so the top k
+        # is the same however the postings are split up, and equal scores rank by doc id as in rank()
+        kth = kth_largest(scores[scored], k)
+        above = scored[scores[scored] > kth]
+        scored = np.concatenate([above, scored[scores[scored] == kth][:k - len(above)]])
+        scored.sort()
+    return scored[np.argsort(-scores[scored], kind="stable")]
+
+
+def phrase_match(position_lists):
+    """
+    Whether the terms occur next to each other in order. position_lists holds the
+    sorted positions of each phrase term in one document.
+    """
+    starts = position_lists[0]
+    for offset, positions in enumerate(position_lists[1:], 1):
+        starts = starts[np.isin(starts + offset, positions)]
+        if not len(starts):
+            return False
+    return len(starts) > 0
+
+
+def min_distance(a, b):
+    """
+    Smallest distance between a position in a and one in b, both sorted. None if either is empty.
+    """
+    if not len(a) or not len(b):
+        return None
+    a = a.astype(np.int64)
+    b = b.astype(np.int64)
+    after = np.searchsorted(b, a).clip(max=len(b) - 1)
+    before = (after - 1).clip(min=0)
+    return int(np.minimum(np.abs(b[after] - a), np.abs(b[before] - a)).min())
+
+
+def proximity_score(position_lists):
+    """
+    Mean of 1 / distance over pairs of consecutive query terms, from 0 to 1 when every pair
+    is adjacent, so documents where the terms appear close together rank higher. Only pairs
+    within one field count; missing terms add nothing.
+    """
+    if len(position_lists) < 2:
+        return 0.0
+    score = 0.0
+    for a, b in zip(position_lists, position_lists[1:]):
+        distance = min_distance(a, b)
+        # Positions of different fields are further apart than any two of the same field
+        if distance and distance < FIELD_POSITION_GAP:
+            score += 1.0 / distance
+    return score / (len(position_lists) - 1)
@@ -0,0 +1,123 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+from werkzeug.serving import make_server
+import app
+from metrics import share_metrics
+from result_cache import ResultCache
+
+# Serving with several processes. The master opens the memory-mapped index once and pre-forks
+# the workers: readers take queries off the shared listening socket, one request at a time each,
+# and forward writes to the one writer process over a loopback socket. Readers follow the
+# writer's write-ahead log, and open a newly published generation, between requests.
+# Where fork isn't available, as on Windows, workers are spawned and open the index themselves;
+# the mapped files are still shared through the page cache.
+# Each worker keeps its own metrics and snapshots them into app.metrics_path, so a scrape of
+# /api/metrics, answered by any reader, reports the counters of all of them added up.
+
+# How often the master checks for workers that died, to start them again
+WORKER_CHECK_SECONDS = 1.0
+LISTEN_BACKLOG = 128
+
+
+def serve_socket(listener, threaded):
+    host, port = listener.getsockname()[:2]
+    make_server(host, port, app.app, threaded=threaded, fd=listener.fileno()).serve_forever()
+
+
+def open_shared():
+    """
+    Open what every worker serves from, unless it was inherited from the master already open and
+    still of the current generation.
+    """
+    if app.doc_store is None:
+        app.open_documents()
+    if app.shard_set is None or app.generation_changed():
+        app.open_index()
+
+
+def run_writer(listener, postings_cache_bytes):
+    app.postings_cache_bytes = postings_cache_bytes
+    app.publishes_generations = True
+    # The readers count the requests they pass on, so the writer shares only its stages and caches
+    share_metrics(app.metrics_path, "writer", app.process_metrics, count_requests=False)
+    open_shared()
+    app.open_write_path()
+    # Threaded, so documents are analysed concurrently; the write lock orders the writes
+    serve_socket(listener, threaded=True)
+
+
+def run_reader(name, listener, writer_url, postings_cache_bytes, result_cache_bytes):
+    app.postings_cache_bytes = postings_cache_bytes
+    app.writer_url = writer_url
+    app.result_cache = ResultCache(max_bytes=result_cache_bytes, ttl=600)
+    share_metrics(app.metrics_path, name, app.process_metrics)
+    open_shared()
+    app.open_replica()
+    serve_socket(listener, threaded=False)
+
+
+def serve(host, port, workers, postings_cache_mb=512, result_cache_mb=256):
+    """
+    Serve on host:port with workers reader processes and a writer, restarting any that die.
+    The cache budgets are split between the readers, so more workers don't take more memory.
+    """
+    listener = socket.create_server((host, port), backlog=LISTEN_BACKLOG)
+    writer_listener = socket.create_server(("127.0.0.1", 0), backlog=LISTEN_BACKLOG)
+    writer_url = f"http://127.0.0.1:{writer_listener.getsockname()[1]}"
+    postings_cache_bytes = postings_cache_mb * 1024 * 1024 // workers
+    result_cache_bytes = result_cache_mb * 1024 * 1024 // workers
+    # Counters start from zero with the server, as they would in a single process
+    shutil.rmtree(app.metrics_path, ignore_errors=True)
+    os.makedirs(app.metrics_path)
+
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    if context.get_start_method() == "fork":
+        # Opened once here, so the workers share the lexicon, autocomplete and warmed postings
+        app.postings_cache_bytes = postings_cache_bytes
+        app.open_documents()
+        app.open_index()
+
+    processes = {}
+
+    def launch(name):
+        if name == "writer":
+            target, args = run_writer, (writer_listener, postings_cache_bytes)
+        else:
+            target, args = run_reader, (name, listener, writer_url, postings_cache_bytes, result_cache_bytes)
+        process = context.Process(target=target, args=args, name=name, daemon=True)
+        process.start()
+        processes[name] = process
+
+    launch("writer")
+    for worker in range(workers):
+        launch(f"reader-{worker}")
+    print(f"Serving on http://{host}:{port} with {workers} readers and a writer")
+    try:
+        while True:
+            time.sleep(WORKER_CHECK_SECONDS)
+            for name, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f"{name} exited with code {process.exitcode}, starting it again")
+                    launch(name)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the search API from several worker processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="reader processes serving queries")
+    parser.add_argument("--postings-cache-mb", type=int, default=512, help="postings cache budget shared by the readers")
+    parser.add_argument("--result-cache-mb", type=int, default=256, help="result cache budget shared by the readers")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.postings_cache_mb, args.result_cache_mb)
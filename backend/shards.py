@@ -0,0 +1,177 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import orjson
+from term_dictionary import SegmentStore
+from barrel_cache import BarrelCache
+from scoring import set_corpus_stats, score_top_k
+
+# Written next to the barrels by inverted_index.py: statistics of the whole corpus, which every
+# shard scores with so sharded and unsharded scores are identical, and the first and last doc
+# id of each shard. An index with more than one shard keeps shard i in the shard_<i> directory.
+CORPUS_STATS_FILE = "corpus_stats.json"
+
+
+def shard_dir(shard):
+    return f"shard_{shard}"
+
+
+def write_corpus_stats(base_path, num_docs, avg_doc_length, shard_ranges):
+    stats = {
+        "num_docs": int(num_docs),
+        "avg_doc_length": float(avg_doc_length),
+        "shards": [[int(first), int(last)] for first, last in shard_ranges],
+    }
+    path = os.path.join(base_path, CORPUS_STATS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, path)
+
+
+def load_corpus_stats(base_path):
+    """
+    Corpus statistics of an index, or None for indexes built before they were recorded.
+    """
+    path = os.path.join(base_path, CORPUS_STATS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def open_shards(base_path):
+    """
+    Segment stores of every shard of an index, in doc id order. Also makes the scoring
+    functions use the index's corpus statistics.
+    """
+    stats = load_corpus_stats(base_path)
+    if stats is None:
+        return [SegmentStore(base_path)]
+    set_corpus_stats(stats["num_docs"], stats["avg_doc_length"])
+    if len(stats["shards"]) == 1:
+        return [SegmentStore(base_path)]
+    return [
+        SegmentStore(os.path.join(base_path, shard_dir(shard)), first_doc_id=first)
+        for shard, (first, _) in enumerate(stats["shards"])
+    ]
+
+
+class ShardSet:
+    """
+    The shards of an index searched as one. Shards hold increasing doc id ranges, so a term's
+    postings are its shards' postings concatenated in order, and its statistics add up.
+    Documents added later are compacted into the last shard.
+    """
+
+    def __init__(self, base_path, cache_bytes=512 * 1024 * 1024):
+        self.stores = open_shards(base_path)
+        # Decoded postings shared by every request, split evenly between shards
+        self.caches = [BarrelCache(store, max_bytes=cache_bytes // len(self.stores)) for store in self.stores]
+
+    def __len__(self):
+        return len(self.stores)
+
+    @property
+    def writable(self):
+        return self.stores[-1]
+
+    @property
+    def has_impacts(self):
+        """
+        Whether every shard was built with impact-ordered postings.
+        """
+        return all(store.has_impacts for store in self.stores)
+
+    def doc_freq(self, term_id):
+        return sum(store.doc_freq(term_id) for store in self.stores)
+
+    def max_score(self, term_id):
+        return max(store.max_score(term_id) for store in self.stores)
+
+    def doc_freqs(self):
+        """
+        Document frequency of every term id, summed over the shards.
+        """
+        doc_freqs = np.zeros(max(len(store.dictionary.entries) for store in self.stores), dtype=np.int64)
+        for store in self.stores:
+            entries = store.dictionary.entries["doc_freq"]
+            doc_freqs[:len(entries)] += entries
+        return doc_freqs
+
+    def warm_up(self, term_ids):
+        return sum(cache.warm_up(term_ids) for cache in self.caches)
+
+    def invalidate(self, term_id):
+        for cache in self.caches:
+            cache.invalidate(term_id)
+
+
+# Shards of the worker process, set by init_shard_worker
+worker_shards = None
+
+
+def init_shard_worker(base_path, cache_bytes):
+    global worker_shards
+    worker_shards = ShardSet(base_path, cache_bytes)
+
+
+def search_shard(shard, term_ids, idfs, upper_bounds, k, k1, b):
+    """
+    MaxScore top k of one shard, run in a worker process. idfs and upper bounds are those of
+    the whole corpus. Returns (doc ids, scores, byte offsets, number scored, whether pruned).
+    """
+    store = worker_shards.stores[shard]
+    # Compaction in the serving process may have published a new segment
+    store.refresh()
+    cache = worker_shards.caches[shard]
+    found = [(postings, idf, bound) for postings, idf, bound in zip(map(cache.get, term_ids), idfs, upper_bounds) if postings is not None]
+    if not found:
+        empty = np.zeros(0, dtype=np.uint32)
+        return empty, np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.uint64), 0, False
+    postings_lists, shard_idfs, shard_bounds = zip(*found)
+    return score_top_k(list(postings_lists), list(shard_idfs), list(shard_bounds), k, k1, b)
+
+
+class ShardSearcher:
+    """
+    Searches every shard at once on a process pool. Each worker maps all shards read-only,
+    so any worker can serve any shard, and query throughput is not bound to one core.
+    """
+
+    def __init__(self, base_path, num_shards, workers=None, cache_bytes=512 * 1024 * 1024):
+        self.num_shards = num_shards
+        workers = workers or min(num_shards, os.cpu_count() or 1)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_shard_worker, initargs=(base_path, cache_bytes // workers),
+        )
+
+    def top_k(self, term_ids, idfs, upper_bounds, k, k1=1.5, b=0.75):
+        """
+        Scatter a query to every shard and return each shard's search_shard result.
+        """
+        futures = [
+            self.pool.submit(search_shard, shard, term_ids, idfs, upper_bounds, k, k1, b)
+            for shard in range(self.num_shards)
+        ]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def merge_top_k(parts, k):
+    """
+    Gather per-shard (doc ids, scores, byte offsets) top-k lists into the overall top k,
+    best first, equal scores by doc id. A document found twice, as can happen while a
+    compaction moves it from the delta into the last shard, is kept once.
+    """
+    if not parts:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.uint64)
+    doc_ids = np.concatenate([part[0] for part in parts]).astype(np.uint32)
+    scores = np.concatenate([part[1] for part in parts]).astype(np.float32)
+    byte_offsets = np.concatenate([part[2] for part in parts]).astype(np.uint64)
+    _, first = np.unique(doc_ids, return_index=True)
+    doc_ids, scores, byte_offsets = doc_ids[first], scores[first], byte_offsets[first]
+    order = np.lexsort((doc_ids, -scores))[:k]
+    return doc_ids[order], scores[order], byte_offsets[order]
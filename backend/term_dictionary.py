@@ -0,0 +1,274 @@
+import os
+import re
+import mmap
+import threading
+import numpy as np
+from doc_table import DocTable, DOC_TABLE_FILE
+
+# One fixed-width entry per term id: where its postings live, how many documents contain it,
+# the highest BM25 saturation (score without idf) of any of its postings, where its
+# positions live in the segment's positions file and, in indexes built with impacts, where its
+# impact-ordered postings live in the segment's impacts file and the saturation one impact
+# level stands for. A zero length marks a term with no postings.
+TERM_DTYPE = np.dtype([
+    ("segment", "<u2"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("doc_freq", "<u4"),
+    ("max_score", "<f4"),
+    ("positions_offset", "<u8"),
+    ("positions_length", "<u4"),
+    ("impacts_offset", "<u8"),
+    ("impacts_length", "<u4"),
+    ("impact_scale", "<f4"),
+])
+DICTIONARY_FILE = "term_dictionary.npy"
+SEGMENT_NAME = re.compile(r"barrel_(\d+)\.postings$")
+
+
+def file_stamp(path):
+    """
+    Changes whenever the file at path is replaced, even within one tick of a coarse mtime.
+    """
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def segment_file(segment):
+    return f"barrel_{segment}.postings"
+
+
+def positions_file(segment):
+    return f"barrel_{segment}.positions"
+
+
+def impacts_file(segment):
+    return f"barrel_{segment}.impacts"
+
+
+class TermDictionary:
+    """
+    Maps a term id to (segment, byte offset, byte length, document frequency, max score,
+    positions byte offset, positions byte length, impacts byte offset, impacts byte length,
+    impact scale).
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else np.zeros(1, dtype=TERM_DTYPE)
+
+    @classmethod
+    def load(cls, path):
+        entries = np.load(path)
+        if entries.dtype != TERM_DTYPE:
+            # Dictionaries written before a field was added get it zero filled
+            upgraded = np.zeros(len(entries), dtype=TERM_DTYPE)
+            for name in entries.dtype.names:
+                upgraded[name] = entries[name]
+            entries = upgraded
+        return cls(entries)
+
+    def save(self, path):
+        # Write to a temporary file first so a crash never leaves a half written dictionary
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.entries)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.entries["length"]))
+
+    def get(self, term_id):
+        term_id = int(term_id)
+        if term_id < 0 or term_id >= len(self.entries):
+            return None
+        entry = self.entries[term_id]
+        if entry["length"] == 0:
+            return None
+        return entry
+
+    def doc_freq(self, term_id):
+        entry = self.get(term_id)
+        return 0 if entry is None else int(entry["doc_freq"])
+
+    def max_score(self, term_id):
+        entry = self.get(term_id)
+        return 0.0 if entry is None else float(entry["max_score"])
+
+    def has_impacts(self):
+        """
+        Whether the index was built with impact-ordered postings.
+        """
+        return bool(self.entries["impacts_length"].any())
+
+    def set(self, term_id, segment, offset, length, doc_freq, max_score=0.0, positions_offset=0, positions_length=0,
+            impacts_offset=0, impacts_length=0, impact_scale=0.0):
+        term_id = int(term_id)
+        if term_id >= len(self.entries):
+            # Grow geometrically so adding terms one at a time stays cheap
+            grown = np.zeros(max(term_id + 1, 2 * len(self.entries)), dtype=TERM_DTYPE)
+            grown[:len(self.entries)] = self.entries
+            self.entries = grown
+        self.entries[term_id] = (
+            segment, offset, length, doc_freq, max_score, positions_offset, positions_length, impacts_offset, impacts_length,
+            impact_scale,
+        )
+
+
+class SegmentStore:
+    """
+    Reads term postings from segment files through the term dictionary.
+    Each read is a single slice of the memory-mapped segment. Segments are never modified;
+    compaction writes new ones, repoints the dictionary and removes those nothing points at
+    any more. The per-document table that
+    decoding fills postings in from is kept alongside. A shard's store holds the documents
+    from first_doc_id on.
+    """
+
+    def __init__(self, base_path, num_segments=120, first_doc_id=0):
+        self.base_path = base_path
+        self.num_segments = num_segments
+        dictionary_path = os.path.join(base_path, DICTIONARY_FILE)
+        self.dictionary = TermDictionary.load(dictionary_path)
+        self.dictionary_stamp = file_stamp(dictionary_path)
+        doc_table_path = os.path.join(base_path, DOC_TABLE_FILE)
+        if not os.path.exists(doc_table_path):
+            raise FileNotFoundError(f"{doc_table_path} is missing, barrels from before compressed postings must be rebuilt with inverted_index.py")
+        self.doc_table = DocTable(doc_table_path, first_doc_id)
+        self.has_impacts = self.dictionary.has_impacts()
+        self.maps = {}
+        self.lock = threading.Lock()
+
+    def doc_freq(self, term_id):
+        return self.dictionary.doc_freq(term_id)
+
+    def max_score(self, term_id):
+        return self.dictionary.max_score(term_id)
+
+    def read(self, term_id):
+        """
+        Return the encoded postings of a term, or None if it has none.
+        """
+        entry = self.dictionary.get(term_id)
+        if entry is None:
+            return None
+        offset = int(entry["offset"])
+        end = offset + int(entry["length"])
+        segment_map = self._map(segment_file(int(entry["segment"])), end)
+        return segment_map[offset:end]
+
+    def read_positions(self, term_id):
+        """
+        Return the encoded positions of a term, or None if it has none.
+        """
+        entry = self.dictionary.get(term_id)
+        if entry is None or entry["positions_length"] == 0:
+            return None
+        offset = int(entry["positions_offset"])
+        end = offset + int(entry["positions_length"])
+        return self._map(positions_file(int(entry["segment"])), end)[offset:end]
+
+    def read_impacts(self, term_id):
+        """
+        Return the encoded impact-ordered postings of a term and their impact scale, or None if
+        it has none.
+        """
+        entry = self.dictionary.get(term_id)
+        if entry is None or entry["impacts_length"] == 0:
+            return None
+        offset = int(entry["impacts_offset"])
+        end = offset + int(entry["impacts_length"])
+        return self._map(impacts_file(int(entry["segment"])), end)[offset:end], float(entry["impact_scale"])
+
+    def location(self, term_id):
+        """
+        (segment, offset) of a term's current postings, used to tell if a cached copy is stale.
+        """
+        entry = self.dictionary.get(term_id)
+        if entry is None:
+            return None
+        return int(entry["segment"]), int(entry["offset"])
+
+    def new_segment(self):
+        """
+        Id and paths of the postings, positions and impacts files of the next immutable segment
+        written by compaction.
+        """
+        with self.lock:
+            segment = max([self.num_segments, int(self.dictionary.entries["segment"].max()) + 1] + [s + 1 for s in self.segments_on_disk()])
+        return segment, *self.segment_paths(segment)
+
+    def segment_paths(self, segment):
+        return [os.path.join(self.base_path, name(segment)) for name in (segment_file, positions_file, impacts_file)]
+
+    def segments_on_disk(self):
+        return sorted(int(match.group(1)) for match in map(SEGMENT_NAME.match, os.listdir(self.base_path)) if match)
+
+    def segment_usage(self):
+        """
+        {segment: (live bytes, file bytes)} of every segment on disk. Live bytes are those a
+        dictionary entry still points at; the rest belong to postings compaction replaced.
+        """
+        with self.lock:
+            entries = self.dictionary.entries
+            live = np.bincount(entries["segment"], minlength=1, weights=(
+                entries["length"].astype(np.int64) + entries["positions_length"] + entries["impacts_length"]
+            ))
+        usage = {}
+        for segment in self.segments_on_disk():
+            file_bytes = sum(os.path.getsize(path) for path in self.segment_paths(segment) if os.path.exists(path))
+            usage[segment] = (int(live[segment]) if segment < len(live) else 0, file_bytes)
+        return usage
+
+    def remove_segments(self, segments):
+        """
+        Delete the files of segments no dictionary entry points at.
+        """
+        with self.lock:
+            for segment in segments:
+                for path in self.segment_paths(segment):
+                    # Slices already read are copies, so dropping the map is safe
+                    self.maps.pop(os.path.basename(path), None)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def publish_segment(self, segment, entries):
+        """
+        Point the given terms at a fully written segment and persist the dictionary.
+        entries are (term_id, offset, length, doc_freq, max_score, positions_offset, positions_length,
+        impacts_offset, impacts_length, impact_scale) tuples, the last three only in indexes with impacts.
+        """
+        with self.lock:
+            for entry in entries:
+                self.dictionary.set(entry[0], segment, *entry[1:])
+            self.dictionary.save(os.path.join(self.base_path, DICTIONARY_FILE))
+
+    def refresh(self):
+        """
+        Pick up a compaction published by another process: reload the dictionary if it was
+        replaced and remap the doc table if it grew. The doc table is remapped first, so the
+        new dictionary never points at documents this process can't look up.
+        """
+        dictionary_path = os.path.join(self.base_path, DICTIONARY_FILE)
+        stamp = file_stamp(dictionary_path)
+        if stamp != self.dictionary_stamp:
+            self.doc_table.refresh()
+            with self.lock:
+                self.dictionary = TermDictionary.load(dictionary_path)
+                self.dictionary_stamp = stamp
+                self.has_impacts = self.dictionary.has_impacts()
+
+    def save_dictionary(self):
+        with self.lock:
+            self.dictionary.save(os.path.join(self.base_path, DICTIONARY_FILE))
+
+    def _map(self, name, end):
+        segment_map = self.maps.get(name)
+        if segment_map is None or len(segment_map) < end:
+            # The file grew since it was mapped, so map it again
+            with self.lock:
+                segment_map = self.maps.get(name)
+                if segment_map is None or len(segment_map) < end:
+                    with open(os.path.join(self.base_path, name), "rb") as f:
+                        segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.maps[name] = segment_map
+        return segment_map
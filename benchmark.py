@@ -0,0 +1,328 @@
+import numpy as np
+import pandas as pd
+import argparse
+import contextlib
+import csv
+import io
+import orjson
+import os
+import platform
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from lexicon import build_lexicon
+from forward_index import build_forward_index
+from inverted_index import build_inverted_index, peak_rss_mb, NUM_SHARDS
+from normalizer import normalizer
+
+# Everything the benchmark generates and builds goes under this directory
+benchmark_path = "D:\\code\\DSAProject\\reSearch\\benchmark"
+
+DOCUMENT_FIELDS = ["title", "abstract", "year", "keywords", "n_citation", "url"]
+# Generated words are runs of consonant-vowel syllables. They end in a vowel, so the
+# lemmatizer leaves them as they are and the processed text can be written directly.
+SYLLABLES = [consonant + vowel for consonant in "bcdfghjklmnprtvz" for vowel in "aeiou"]
+# Words per field, drawn uniformly from these ranges
+TITLE_WORDS = (5, 13)
+ABSTRACT_WORDS = (80, 200)
+KEYWORDS = (2, 6)
+# Share of the query log that is phrase and boolean queries; the rest are plain queries
+PHRASE_QUERIES = 0.1
+BOOLEAN_QUERIES = 0.1
+GENERATE_CHUNK = 10000
+
+# Files of a benchmark directory, removed at the start of every run
+CORPUS_FILE = "corpus.csv"
+PROCESSED_FILE = "processed.csv"
+LEXICON_FILE = "lexicon.csv"
+LEXICON_SNAPSHOT_FILE = "lexicon.bin"
+FORWARD_INDEX_DIR = "forward_index"
+BARRELS_DIR = "barrels"
+DOCUMENTS_DIR = "documents"
+ATTRIBUTES_DIR = "attributes"
+QUERY_LOG_FILE = "queries.txt"
+BENCHMARK_FILES = [
+    CORPUS_FILE, PROCESSED_FILE, LEXICON_FILE, LEXICON_SNAPSHOT_FILE, FORWARD_INDEX_DIR,
+    BARRELS_DIR, DOCUMENTS_DIR, ATTRIBUTES_DIR, QUERY_LOG_FILE,
+]
+
+
+class Vocabulary:
+    """
+    Generated words with Zipfian frequencies: the word of rank r is drawn with probability
+    proportional to 1 / r ** exponent, as word frequencies in real text roughly are.
+    """
+
+    def __init__(self, size, exponent, rng):
+        stop_words = normalizer.load_stop_words()
+        words = {}
+        while len(words) < size:
+            word = "".join(rng.choice(SYLLABLES, size=int(rng.integers(2, 5))))
+            if word not in stop_words:
+                words.setdefault(word, None)
+        self.words = np.array(list(words), dtype=object)
+        weights = 1.0 / np.arange(1, size + 1) ** exponent
+        self.probabilities = weights / weights.sum()
+
+    def sample(self, rng, n):
+        return self.words[rng.choice(len(self.words), size=n, p=self.probabilities)].tolist()
+
+
+def generate_documents(vocabulary, rng, n, first_doc_id):
+    """
+    n documents in the schema of the cleaned data file, keywords as a list of words.
+    """
+    documents = []
+    for doc_id in range(first_doc_id, first_doc_id + n):
+        documents.append({
+            "title": " ".join(vocabulary.sample(rng, int(rng.integers(*TITLE_WORDS)))),
+            "abstract": " ".join(vocabulary.sample(rng, int(rng.integers(*ABSTRACT_WORDS)))),
+            "year": int(rng.integers(1980, 2025)),
+            "keywords": vocabulary.sample(rng, int(rng.integers(*KEYWORDS))),
+            # Citation counts are heavy tailed too
+            "n_citation": int(rng.pareto(1.2) * 10),
+            "url": f"https://papers.example.org/{doc_id}",
+        })
+    return documents
+
+
+def generate_corpus(vocabulary, rng, num_docs, corpus_path, processed_path):
+    """
+    Write the corpus both as the cleaned data file the backend serves from ('|' separated,
+    keywords as a list literal) and as the processed text the lexicon and forward index read.
+    """
+    with open(corpus_path, "w", encoding="utf-8", newline="") as corpus, open(processed_path, "w", encoding="utf-8", newline="") as processed:
+        corpus_writer = csv.writer(corpus, delimiter="|", lineterminator="\n")
+        corpus_writer.writerow(DOCUMENT_FIELDS)
+        processed.write(",".join(DOCUMENT_FIELDS) + "\n")
+        for first in range(1, num_docs + 1, GENERATE_CHUNK):
+            documents = generate_documents(vocabulary, rng, min(GENERATE_CHUNK, num_docs + 1 - first), first)
+            corpus_writer.writerows(
+                [document[field] if field != "keywords" else repr(document[field]) for field in DOCUMENT_FIELDS]
+                for document in documents
+            )
+            rows = pd.DataFrame(documents, columns=DOCUMENT_FIELDS)
+            rows["keywords"] = rows["keywords"].str.join(" ")
+            processed.write(rows.to_csv(index=False, header=False))
+
+
+def generate_query_log(vocabulary, rng, num_queries):
+    """
+    Queries drawn from a pool of distinct queries, popular ones repeating as in a real log.
+    Most are one to four words; some are phrases or use the boolean syntax.
+    """
+    pool = []
+    for _ in range(max(1, num_queries // 4)):
+        kind = rng.random()
+        if kind < PHRASE_QUERIES:
+            pool.append('"' + " ".join(vocabulary.sample(rng, 2)) + '"')
+        elif kind < PHRASE_QUERIES + BOOLEAN_QUERIES:
+            a, b, c = vocabulary.sample(rng, 3)
+            pool.append(rng.choice([f"{a} AND {b}", f"{a} {b} NOT {c}", f"({a} OR {b}) AND {c}"]))
+        else:
+            pool.append(" ".join(vocabulary.sample(rng, int(rng.integers(1, 5)))))
+    weights = 1.0 / np.arange(1, len(pool) + 1)
+    return [pool[i] for i in rng.choice(len(pool), size=num_queries, p=weights / weights.sum())]
+
+
+def build_index(path, num_shards, impacts=False):
+    """
+    Build the lexicon, forward index and barrels of the generated corpus. Run in a process of
+    its own, so its peak memory is measured apart from serving.
+    """
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        num_words = build_lexicon(
+            os.path.join(path, PROCESSED_FILE), os.path.join(path, LEXICON_FILE), os.path.join(path, LEXICON_SNAPSHOT_FILE),
+        )
+        timings["lexicon_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_forward_index(
+            os.path.join(path, PROCESSED_FILE), os.path.join(path, LEXICON_FILE), os.path.join(path, LEXICON_SNAPSHOT_FILE),
+            os.path.join(path, CORPUS_FILE), os.path.join(path, FORWARD_INDEX_DIR),
+        )
+        timings["forward_index_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_inverted_index(os.path.join(path, FORWARD_INDEX_DIR), os.path.join(path, BARRELS_DIR), num_shards=num_shards, impacts=impacts)
+        timings["inverted_index_seconds"] = time.perf_counter() - start
+
+    timings["total_seconds"] = sum(timings.values())
+    timings["words"] = num_words
+    timings["peak_rss_mb"] = peak_rss_mb()
+    # The forward index workers
+    timings["peak_worker_rss_mb"] = peak_rss_mb(children=True)
+    return timings
+
+
+def start_backend(path):
+    """
+    Point the backend at the benchmark directory and start it as app.py's main block would,
+    without serving HTTP.
+    """
+    import app
+    app.csv_path = os.path.join(path, CORPUS_FILE)
+    app.lexicon_path = os.path.join(path, LEXICON_FILE)
+    app.lexicon_snapshot_path = os.path.join(path, LEXICON_SNAPSHOT_FILE)
+    app.doc_store_path = os.path.join(path, DOCUMENTS_DIR)
+    app.attributes_path = os.path.join(path, ATTRIBUTES_DIR)
+    app.barrels_path = os.path.join(path, BARRELS_DIR)
+    app.wal_path = os.path.join(path, BARRELS_DIR, "delta.wal")
+    app.hot_terms_path = os.path.join(path, "hot_terms.txt")
+    app.generation_path = os.path.join(path, "generation.json")
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.start()
+    return app
+
+
+def replay(calls):
+    """
+    Run the calls one after another. Returns each call's latency and the total wall time.
+    """
+    latencies = []
+    # The backend prints a line for most requests
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for call in calls:
+            call_start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - call_start)
+        wall = time.perf_counter() - start
+    return latencies, wall
+
+
+def latency_summary(latencies, wall):
+    ms = np.asarray(latencies) * 1000
+    if not len(ms):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]).tolist()
+    return {
+        "count": len(ms),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+        "throughput_per_second": len(ms) / max(wall, 1e-9),
+    }
+
+
+def run_benchmark(path, num_docs=20000, vocabulary_size=30000, zipf_exponent=1.07, num_queries=2000,
+                  num_completions=1000, num_additions=200, warmup=100, num_shards=NUM_SHARDS, seed=0, query_log=None,
+                  impacts=False):
+    """
+    Generate a corpus, build its index, then replay a query log against search(), and
+    autocomplete and article additions through the API. The same seed gives the same corpus
+    and log, so results of different runs are comparable. Returns the results as a dict.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name in BENCHMARK_FILES:
+        target = os.path.join(path, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    vocabulary = Vocabulary(vocabulary_size, zipf_exponent, rng)
+    generate_corpus(vocabulary, rng, num_docs, os.path.join(path, CORPUS_FILE), os.path.join(path, PROCESSED_FILE))
+    if query_log is None:
+        queries = generate_query_log(vocabulary, rng, num_queries)
+    else:
+        with open(query_log, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    with open(os.path.join(path, QUERY_LOG_FILE), "w", encoding="utf-8") as f:
+        f.writelines(query + "\n" for query in queries)
+    generate_seconds = time.perf_counter() - start
+    print(f"Generated {num_docs} documents and {len(queries)} queries in {generate_seconds:.2f} seconds")
+
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        build = pool.submit(build_index, path, num_shards, impacts).result()
+    print(f"Built the index in {build['total_seconds']:.2f} seconds")
+
+    app = start_backend(path)
+    client = app.app.test_client()
+    k = app.TOP_K_WINDOW
+    # Warm the postings caches as the first queries after a restart would
+    replay([lambda query=query: app.search(query, k) for query in queries[:warmup]])
+    search_results = latency_summary(*replay([lambda query=query: app.search(query, k) for query in queries]))
+    print(f"Replayed {len(queries)} queries, p50 {search_results.get('p50_ms', 0):.2f} ms")
+
+    words = [word for query in queries for word in query.replace('"', " ").replace("(", " ").replace(")", " ").split() if word.islower()]
+    prefixes = [word[:int(rng.integers(1, 5))] for word in rng.choice(words, size=num_completions)] if words else []
+    completion_results = latency_summary(*replay([
+        lambda prefix=prefix: client.get("/api/autocomplete", query_string={"prefix": prefix}) for prefix in prefixes
+    ]))
+
+    articles = generate_documents(vocabulary, rng, num_additions, num_docs + 1)
+    for article in articles:
+        article["url"] += "-added"
+    addition_results = latency_summary(*replay([
+        lambda article=article: client.post("/api/add_document", json=article) for article in articles
+    ]))
+
+    app.compactor.stop()
+    if app.shard_searcher is not None:
+        app.shard_searcher.shutdown()
+
+    return {
+        "config": {
+            "documents": num_docs,
+            "vocabulary": vocabulary_size,
+            "zipf_exponent": zipf_exponent,
+            "queries": len(queries),
+            "warmup_queries": min(warmup, len(queries)),
+            "completions": len(prefixes),
+            "additions": num_additions,
+            "shards": num_shards,
+            "impacts": impacts,
+            "top_k": k,
+            "seed": seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "generate_seconds": generate_seconds,
+        "build": build,
+        "search": search_results,
+        "autocomplete": completion_results,
+        "add_article": addition_results,
+        # Of serving only; the build ran in its own process
+        "serve_peak_rss_mb": peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark index building and search on a generated corpus.")
+    parser.add_argument("--path", default=benchmark_path, help="directory for the corpus and index, cleared first")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocabulary", type=int, default=30000)
+    parser.add_argument("--zipf", type=float, default=1.07, help="exponent of the word frequency distribution")
+    parser.add_argument("--queries", type=int, default=2000, help="length of the generated query log")
+    parser.add_argument("--query-log", help="replay this query log, one query per line, instead")
+    parser.add_argument("--completions", type=int, default=1000)
+    parser.add_argument("--additions", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=100, help="queries run before timing starts")
+    parser.add_argument("--shards", type=int, default=NUM_SHARDS)
+    parser.add_argument("--impacts", action="store_true", help="build impact-ordered postings for score-at-a-time queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results here as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        args.path, args.docs, args.vocabulary, args.zipf, args.queries, args.completions, args.additions,
+        args.warmup, args.shards, args.seed, args.query_log, args.impacts,
+    )
+    output = orjson.dumps(results, option=orjson.OPT_INDENT_2)
+    if args.out:
+        with open(args.out, "wb") as f:
+            f.write(output)
+    print(output.decode())
@@ -1,69 +1,113 @@
 import pandas as pd
 from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-from nltk import pos_tag  
-from nltk.corpus import stopwords
-
-lemmatizer = WordNetLemmatizer()
-
-csv_path = "exported_data_final.csv"
-data = pd.read_csv(csv_path, delimiter = "|")
-
-def get_wordnet_pos(treebank_tag):
-    # adjective
-    if treebank_tag.startswith('J'):
-        return 'a'
-    # verb
-    elif treebank_tag.startswith('V'):
-        return 'v'  
-    # noun
-    elif treebank_tag.startswith('N'):
-        return 'n'  
-    # adverb
-    elif treebank_tag.startswith('R'):
-        return 'r'  
-    # for unknown or other tags
+import ast
+import os
+import sys
+import time
+import orjson
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from normalizer import normalizer
+
+csv_path = "cleaned_data_final.csv"
+output_path = "processed_text_final.csv"
+
+def preprocess_column(column):
+    """
+    Preprocess a whole column at once so its words are POS tagged in one batch.
+    Unlike the query path, tokens that are not alphanumeric are kept here.
+    """
+    token_lists = [word_tokenize(text) for text in column]
+    return [" ".join(tokens) for tokens in normalizer.normalize_batch(token_lists, alnum_only=False)]
+
+def preprocess_chunk(chunk):
+    """
+    Runs in a worker process. Returns the processed chunk as encoded CSV rows without a header.
+    """
+    chunk['title'] = preprocess_column(chunk['title'])
+    chunk['abstract'] = preprocess_column(chunk['abstract'])
+    chunk['keywords'] = chunk['keywords'].apply(lambda x: " ".join(ast.literal_eval(x)))
+    return chunk.to_csv(index=False, header=False).encode("utf-8"), len(chunk)
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {"chunks": 0, "rows": 0, "bytes": 0}
+    with open(checkpoint_path, "rb") as f:
+        return orjson.loads(f.read())
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(checkpoint))
+    os.replace(tmp_path, checkpoint_path)
+
+def run(input_path, output_path, chunk_size=10000, workers=None):
+    """
+    Preprocess the cleaned CSV in chunks on a process pool and write the chunks in order.
+    At most two chunks per worker are in flight, so memory stays bounded whatever the corpus size.
+    Progress is checkpointed after every chunk, and a rerun resumes after the last completed one.
+    """
+    workers = workers or os.cpu_count()
+    checkpoint_path = output_path + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path) if os.path.exists(output_path) else {"chunks": 0, "rows": 0, "bytes": 0}
+
+    if checkpoint["chunks"] == 0:
+        # Start fresh with just the header
+        header = pd.read_csv(input_path, delimiter="|", nrows=0)
+        with open(output_path, "wb") as f:
+            f.write(header.to_csv(index=False).encode("utf-8"))
+            checkpoint["bytes"] = f.tell()
     else:
-        return None  
-
-def preprocess(text):
-    # for removal of stop words 
-    stop_words = set(stopwords.words('english')) 
-
-    # Tokenize text into words
-    tokens = word_tokenize(text)
-
-    # Process each token explicitly
-    processed_tokens = []
-    
-    for word in tokens:
-        # Convert the word to lowercase
-        lowercased_word = word.lower()
-        
-        # Checks if the word is not a stopword, and greater than 2 characters
-        if lowercased_word not in stop_words and len(lowercased_word) > 2:
-            
-        # Get POS tag in WordNet format using the helper function
-            pos_tagged = pos_tag([lowercased_word])
-                
-            # pos_tagged gives [0] the word and [1] the parts of speech tag.
-            wordnet_pos = get_wordnet_pos(pos_tagged[0][1])
-                
-            # Lemmatize the word using the correct POS tag
-            if wordnet_pos:
-                lemmatized_word = lemmatizer.lemmatize(lowercased_word, wordnet_pos)
-            else:
-                # Default to noun if no valid POS
-                lemmatized_word = lemmatizer.lemmatize(lowercased_word)
-
-            
-            processed_tokens.append(lemmatized_word.lower())
-
-    return " ".join(processed_tokens)
-
-
-data['title'] = data['title'].apply(preprocess)
-data ['abstract'] = data['abstract'].apply(preprocess)
-data ['keywords'] = data['keywords'].apply(lambda x: " ".join((eval(x))))
-
-data.to_csv('processed_text_final.csv', index=False)
\ No newline at end of file
+        print(f"Resuming after chunk {checkpoint['chunks']} ({checkpoint['rows']} rows)")
+
+    reader = pd.read_csv(
+        input_path, delimiter="|", chunksize=chunk_size,
+        # Skip the rows of completed chunks without processing them again
+        skiprows=range(1, checkpoint["rows"] + 1),
+    )
+
+    start_time = time.perf_counter()
+    rows_this_run = 0
+    with open(output_path, "r+b") as out, ProcessPoolExecutor(max_workers=workers) as pool:
+        # Drop anything written after the last checkpoint by an interrupted run
+        out.truncate(checkpoint["bytes"])
+        out.seek(checkpoint["bytes"])
+
+        pending = deque()
+        for chunk in reader:
+            # pandas yields one empty chunk for an input without rows
+            if chunk.empty:
+                continue
+            pending.append(pool.submit(preprocess_chunk, chunk))
+            while len(pending) >= 2 * workers:
+                rows_this_run += write_chunk(pending.popleft().result(), out, checkpoint, checkpoint_path)
+                report_progress(checkpoint, rows_this_run, start_time)
+        while pending:
+            rows_this_run += write_chunk(pending.popleft().result(), out, checkpoint, checkpoint_path)
+            report_progress(checkpoint, rows_this_run, start_time)
+
+    # An input without rows never writes a checkpoint
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"Preprocessed {checkpoint['rows']} rows in {time.perf_counter() - start_time:.2f} seconds")
+
+def write_chunk(result, out, checkpoint, checkpoint_path):
+    text, rows = result
+    out.write(text)
+    out.flush()
+    os.fsync(out.fileno())
+    checkpoint["chunks"] += 1
+    checkpoint["rows"] += rows
+    checkpoint["bytes"] = out.tell()
+    save_checkpoint(checkpoint_path, checkpoint)
+    return rows
+
+def report_progress(checkpoint, rows_this_run, start_time):
+    elapsed = time.perf_counter() - start_time
+    print(f"chunk {checkpoint['chunks']}: {checkpoint['rows']} rows done, {rows_this_run / elapsed:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    run(csv_path, output_path)
@@ -0,0 +1,46 @@
+import argparse
+import shutil
+import time
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from doc_store import DocStore
+from attributes import AttributeStore
+
+# Paths to the cleaned data and the document and attribute stores served by the backend
+csv_path = "D:\\code\\DSAProject\\reSearch\\cleaned_data_final.csv"
+doc_store_path = "D:\\code\\DSAProject\\reSearch\\documents"
+attributes_path = "D:\\code\\DSAProject\\reSearch\\attributes"
+
+def build_doc_store(csv_path, store_path, compressed=False, block_size=64 * 1024):
+    """
+    Build the document store from scratch. Doc ids are row numbers of the csv, as in the forward index.
+    """
+    shutil.rmtree(store_path, ignore_errors=True)
+    store = DocStore.create(store_path, compressed, block_size)
+    num_docs = store.sync(csv_path)
+    data_size = os.path.getsize(store.data_path)
+    print(f"Stored {num_docs} documents in {data_size / (1024 * 1024):.1f} MB")
+    return store
+
+def build_attribute_store(doc_store, attributes_path):
+    """
+    Build the year and citation columns of every stored document from scratch.
+    """
+    shutil.rmtree(attributes_path, ignore_errors=True)
+    attributes = AttributeStore(attributes_path)
+    num_docs = attributes.sync(doc_store)
+    print(f"Stored attributes of {num_docs} documents")
+    return attributes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the document and attribute stores from the cleaned csv.")
+    parser.add_argument("--compress", action="store_true", help="zlib compress the records in blocks")
+    parser.add_argument("--block-kb", type=int, default=64, help="uncompressed size of a compressed block")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    store = build_doc_store(csv_path, doc_store_path, args.compress, args.block_kb * 1024)
+    build_attribute_store(store, attributes_path)
+    print(f"Time taken: {time.perf_counter() - start_time:.2f} seconds")
@@ -1,136 +1,141 @@
 import pandas as pd
+import numpy as np
+import os
+import sys
 import time
-from collections import Counter, defaultdict
-import orjson
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from forward_store import ForwardIndexWriter, FIELD_POSITION_GAP
+from lexicon_store import load_lexicon
 
 # Paths to the input and output files
 processed_text_path = "D:\\code\\DSAProject\\reSearch\\processed_text_final.csv"
 lexicon_path = "D:\\code\\DSAProject\\reSearch\\lexicon.csv"
+lexicon_snapshot_path = "D:\\code\\DSAProject\\reSearch\\lexicon.bin"
 original_text_path = "D:\\code\\DSAProject\\reSearch\\cleaned_data_final.csv"
-output_path = "D:\\code\\DSAProject\\reSearch\\forward_index.csv"
+output_path = "D:\\code\\DSAProject\\reSearch\\forward_index"
+
+FIELDS = ["title", "abstract", "keywords"]
 
-# Load the lexicon into a dictionary
-lexicon_df = pd.read_csv(lexicon_path)
-lexicon = dict(zip(lexicon_df["Word"], lexicon_df["WordId"]))
-total_docs_length = 0
+# Set in each worker process by init_worker
+lexicon_words = None
+lexicon_ids = None
 
 def compute_byte_offsets(file_path):
     """
     Compute byte offsets for each row in a CSV file, excluding the header row.
-    Returns a dictionary mapping row numbers (1-indexed) to byte offsets.
+    Returns an array where entry n is the byte offset of row n (1-indexed, entry 0 unused).
     """
-    offsets = {}  # To store row number and byte offset
-    with open(file_path, "r", encoding="utf-8") as f:
+    offsets = [0]
+    with open(file_path, "rb") as f:
         header = f.readline()  # Read and skip the header row
         print(f"Skipped header: {header.strip()}")  # Optional: log the skipped header
-        
-        row_number = 0
-        while True:
-            position = f.tell()  # Get the current byte position
-            line = f.readline()  # Read the next line
-            if not line:  # End of file
-                break
-            if line.strip():  # Skip blank lines
-                row_number += 1
-                offsets[row_number] = position  # Map row number to byte offset
-
-    return offsets
-
-# Compute byte offsets for the original text
-byte_offsets = compute_byte_offsets(original_text_path)
-
-# Function to process a single batch and create the forward index
-def process_batch(data, byte_offsets):
-    forward_index = {}
-    global total_docs_length
-    for index, row in data.iterrows():
-        doc_id = index + 1
-        length = [0, 0, 0]
-        # Fetch byte offset for the document
-        byte_offset = byte_offsets.get(doc_id)
-
-        title_words = row['title']
-        abstract_words = row['abstract']
-        keyword_words = row['keywords']
-
-        title_word_counts = Counter(title_words)
-        abstract_word_counts = Counter(abstract_words)
-        keyword_word_counts = Counter(keyword_words)
-        length[0] = len(title_words)
-        length[1] = len(abstract_words)
-        length[2] = len(keyword_words)
-
-        total_docs_length += sum(length)
-
-        word_scores = defaultdict(lambda: {"frequency": [0, 0, 0], "positions": []})
-
-        # Add frequencies for title, abstract and keywords
-        for word, count in title_word_counts.items():
-            word_id = lexicon.get(word)
-            if word_id:
-                word_id = str(word_id)
-                word_scores[word_id]["frequency"][0] += count  # Title index is 0
-        
-        for word, count in abstract_word_counts.items():
-            word_id = lexicon.get(word)
-            if word_id:
-                word_id = str(word_id)
-                word_scores[word_id]["frequency"][1] += count  # Abstract index is 1
-
-        for word, count in keyword_word_counts.items():
-            word_id = lexicon.get(word)
-            if word_id:
-                word_id = str(word_id)
-                word_scores[word_id]["frequency"][2] += count  # Keywords index is 2
-
-        # Add to the forward index
-        forward_index[doc_id] = {
-            "byte_offset": byte_offset,
-            "length": length,
-            "word_scores": {
-                word_id: {
-                    "frequency": scores["frequency"],
-                }
-                for word_id, scores in word_scores.items()
-            }
-        }
-
-    return forward_index
-
 
-if __name__ == "__main__":
-    # Batch processing loop
-    batch_size = 10000
-    chunk_number = 0
+        position = f.tell()
+        for line in f:
+            if line.strip():  # Skip blank lines
+                offsets.append(position)
+            position += len(line)
 
-    start_time = time.time()
+    return np.array(offsets, dtype=np.uint64)
 
-    # Read the data in chunks
-    for chunk in pd.read_csv(processed_text_path, chunksize=batch_size):
-        chunk['title'] = chunk['title'].apply(str).apply(str.split)
-        chunk['abstract'] = chunk['abstract'].apply(str).apply(str.split)
-        chunk['keywords'] = chunk['keywords'].apply(str).apply(str.split)
+def init_worker(lexicon_csv, snapshot_path):
+    # Each worker maps the lexicon snapshot itself and hashes it once,
+    # so every chunk can map tokens to ids in bulk
+    global lexicon_words, lexicon_ids
+    words, lexicon_ids = load_lexicon(lexicon_csv, snapshot_path).arrays()
+    lexicon_words = pd.Index(words)
 
-        forward_index = process_batch(chunk, byte_offsets)
+def process_batch(data, first_doc_id, byte_offsets):
+    """
+    Build the forward index entries of one chunk with array operations.
+    Tokens are mapped to term ids in bulk and (doc, term, field) occurrences are counted
+    with a single bincount instead of per document Counters.
+    """
+    num_docs = len(data)
+    lengths = np.zeros((num_docs, 3), dtype=np.int64)
+    doc_parts, term_parts, field_parts, position_parts = [], [], [], []
+
+    for field_index, field in enumerate(FIELDS):
+        tokens = data[field].astype(str).str.split()
+        lengths[:, field_index] = tokens.str.len().to_numpy()
+
+        exploded = tokens.explode()
+        exploded = exploded[exploded.notna()]
+        word_indices = lexicon_words.get_indexer(exploded.to_numpy())
+        known = word_indices >= 0
+        field_lengths = lengths[:, field_index]
+        doc_parts.append(np.repeat(np.arange(num_docs), field_lengths)[known])
+        term_parts.append(lexicon_ids[word_indices[known]])
+        field_parts.append(np.full(np.count_nonzero(known), field_index))
+
+        # Position of each token in the document: the field's first position plus its index in the field.
+        # Fields follow each other with a gap of FIELD_POSITION_GAP positions.
+        field_starts = lengths[:, :field_index].sum(axis=1) + field_index * FIELD_POSITION_GAP
+        token_index = np.arange(len(exploded)) - np.repeat(np.cumsum(field_lengths) - field_lengths, field_lengths)
+        position_parts.append((np.repeat(field_starts, field_lengths) + token_index)[known])
+
+    local_docs = np.concatenate(doc_parts).astype(np.uint64)
+    term_ids = np.concatenate(term_parts).astype(np.uint64)
+    fields = np.concatenate(field_parts)
+    token_positions = np.concatenate(position_parts)
+
+    # One key per (doc, term) pair; unique sorts them by doc then term
+    keys, inverse = np.unique((local_docs << np.uint64(32)) | term_ids, return_inverse=True)
+    frequencies = np.bincount(inverse * 3 + fields, minlength=len(keys) * 3).reshape(-1, 3)
+    counts = np.bincount((keys >> np.uint64(32)).astype(np.int64), minlength=num_docs)
+    # Positions grouped by (doc, term) entry, ascending within each
+    positions = token_positions[np.lexsort((token_positions, inverse))]
+
+    doc_ids = np.arange(first_doc_id, first_doc_id + num_docs)
+    return (
+        doc_ids, byte_offsets, lengths, counts,
+        (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32), frequencies.astype(np.uint16),
+        positions.astype(np.uint32),
+    )
+
+def build_forward_index(processed_path, lexicon_csv, snapshot_path, original_path, out_path, batch_size=10000, workers=None):
+    """
+    Build the binary forward index with chunks spread over worker processes.
+    Chunks are written in order and at most two per worker are in flight.
+    """
+    workers = workers or os.cpu_count()
+    byte_offsets = compute_byte_offsets(original_path)
+    # Bring the snapshot up to date once here rather than in every worker
+    load_lexicon(lexicon_csv, snapshot_path)
+    writer = ForwardIndexWriter(out_path)
+    total_docs_length = 0
+
+    def write(result):
+        nonlocal total_docs_length
+        doc_ids, offsets, lengths, counts, term_ids, frequencies, positions = result
+        writer.append(doc_ids, offsets, lengths, counts, term_ids, frequencies, positions)
+        total_docs_length += int(lengths.sum())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(lexicon_csv, snapshot_path)) as pool:
+        pending = deque()
+        first_doc_id = 1
+        for chunk in pd.read_csv(processed_path, chunksize=batch_size):
+            chunk_offsets = byte_offsets[first_doc_id:first_doc_id + len(chunk)]
+            pending.append(pool.submit(process_batch, chunk[FIELDS], first_doc_id, chunk_offsets))
+            first_doc_id += len(chunk)
+            while len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+
+    writer.close()
+    return writer.num_docs, total_docs_length
 
-        export_data = [
-            {
-                "DocumentID": doc_id,
-                "byte_offset": data["byte_offset"],
-                "length": data["length"],
-                "word_scores": orjson.dumps(data["word_scores"]).decode("utf-8")
-            }
-            for doc_id, data in forward_index.items()
-        ]
-        df = pd.DataFrame(export_data)
 
-        mode = 'a' if chunk_number > 0 else 'w'
-        header = chunk_number == 0
-        df.to_csv(output_path, mode=mode, header=header, index=False)
+if __name__ == "__main__":
+    start_time = time.time()
 
-        chunk_number += 1
+    num_docs, total_docs_length = build_forward_index(processed_text_path, lexicon_path, lexicon_snapshot_path, original_text_path, output_path)
 
     # some stats
-    print("average doc length", total_docs_length/200000)
+    print("average doc length", total_docs_length / max(num_docs, 1))
     end_time = time.time()
-    print(f"Time taken to create forward index: {end_time - start_time:.2f} seconds")
\ No newline at end of file
+    print(f"Time taken to create forward index: {end_time - start_time:.2f} seconds")
@@ -1,53 +1,267 @@
-import pandas as pd
-import orjson
+import numpy as np
+import argparse
+import heapq
+import shutil
 import time
-from collections import defaultdict
 import os
+import sys
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from postings import PostingList, POSTING_SIZE, write_postings, write_positions, write_impacts
+from scoring import term_scores, set_corpus_stats, quantize_impacts, impact_scale
+from term_dictionary import TermDictionary, DICTIONARY_FILE, segment_file, positions_file, impacts_file
+from doc_table import write_doc_table, DOC_TABLE_FILE, DOC_TABLE_DTYPE
+from forward_store import read_forward_index
+from shards import shard_dir, write_corpus_stats
 
 # Paths to input forward index and output inverted index
-forward_index_path = "D:\\code\\DSAProject\\reSearch\\forward_index.csv"
+forward_index_path = "D:\\code\\DSAProject\\reSearch\\forward_index"
 inverted_index_base_path = "D:\\code\\DSAProject\\reSearch\\barrels"
 
-def create_inverted_index():
-    # Create 120 empty barrels
-    barrels = [defaultdict(list) for _ in range(120)]
-
-    forward_index = pd.read_csv(forward_index_path)
-    for _, row in forward_index.iterrows():
-        doc_id = row["DocumentID"]
-        byte_offset = row["byte_offset"]
-        length = orjson.loads(row["length"])
-        word_scores = orjson.loads(row["word_scores"])
-
-        for word_id, data in word_scores.items():
-            # Determine barrel index
-            barrel_index = int(word_id) % 120  
-            barrels[barrel_index][word_id].append({
-                "DocumentID": doc_id,
-                "byte_offset": byte_offset,
-                "length": length,
-                "frequency": data["frequency"],
-            })
-
-    return barrels
-
-def save_barrels(barrels, base_path):
-    if not os.path.exists(base_path):
-        os.makedirs(base_path)
-
-    for i, barrel in enumerate(barrels):
-        barrel_path = os.path.join(base_path, f"barrel_{i}.parquet")
-        export_data = [
-            {"WordId": word_id, "DocumentDetails": orjson.dumps(details).decode("utf-8")}
-            for word_id, details in barrel.items()
-        ]
-        barrel_df = pd.DataFrame(export_data)
-        barrel_df.to_parquet(barrel_path, index=False, engine="pyarrow")
-        print(f"Barrel {i} saved to: {barrel_path}")
+NUM_BARRELS = 120
+NUM_SHARDS = 1
+MEMORY_LIMIT_MB = 512
+# Working memory per posting while a block is inverted: the gathered posting fields,
+# the sort permutation, the sorted copies and the posting's share of the positions
+BLOCK_BYTES_PER_POSTING = 96
+# Byte offsets and lengths are per document and go to the doc table, not the runs.
+# position_starts[i] is where posting i's positions begin in the run's positions.
+RUN_ARRAYS = ["terms", "doc_ids", "frequencies", "position_starts", "positions"]
+# The merge encodes a term this many postings at a time, so a long posting list never has to
+# fit in memory at once. The runs are memory-mapped and read again for every pass over a term.
+MERGE_PIECE_POSTINGS = 64 * 1024
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident memory of this process, or of the largest of its finished child processes.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def plan_blocks(counts, max_postings):
+    """
+    Split documents into consecutive ranges holding at most max_postings postings each
+    (a single document larger than that gets a block of its own).
+    """
+    ends = np.cumsum(counts, dtype=np.int64)
+    blocks = []
+    first = 0
+    while first < len(counts):
+        already = ends[first - 1] if first else 0
+        last = int(np.searchsorted(ends, already + max_postings, side="right"))
+        last = max(last, first + 1)
+        blocks.append((first, last))
+        first = last
+    return blocks
+
+def plan_shards(counts, num_shards):
+    """
+    Split documents into num_shards consecutive ranges with about the same number of postings,
+    so every shard takes about as long to search.
+    """
+    ends = np.cumsum(counts, dtype=np.int64)
+    total = int(ends[-1]) if len(ends) else 0
+    cuts = np.searchsorted(ends, [total * shard // num_shards for shard in range(1, num_shards)], side="right")
+    bounds = [0] + np.maximum.accumulate(cuts).tolist() + [len(counts)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def invert_block(docs, term_ids, frequencies, positions, first, last, run_path):
+    """
+    Invert documents first..last-1 and spill them as a run sorted by term, then doc id.
+    """
+    block_docs = docs[first:last]
+    start = int(block_docs["start"][0])
+    end = start + int(block_docs["count"].sum())
+    doc_rows = np.repeat(np.arange(len(block_docs)), block_docs["count"])
+    block_terms = np.asarray(term_ids[start:end])
+    block_frequencies = np.asarray(frequencies[start:end])
+
+    # Each posting owns as many consecutive positions as its frequencies add up to
+    position_counts = block_frequencies.sum(axis=1, dtype=np.int64)
+    position_start = int(block_docs["position_start"][0])
+    block_positions = np.asarray(positions[position_start:position_start + int(position_counts.sum())])
+    old_starts = np.cumsum(position_counts) - position_counts
+
+    order = np.lexsort((doc_rows, block_terms))
+    sorted_counts = position_counts[order]
+    new_starts = np.cumsum(sorted_counts) - sorted_counts
+    # Move every posting's run of positions along with the posting
+    gather = np.repeat(old_starts[order] - new_starts, sorted_counts) + np.arange(int(sorted_counts.sum()))
+    run = {
+        "terms": block_terms[order],
+        "doc_ids": block_docs["doc_id"][doc_rows[order]],
+        "frequencies": block_frequencies[order],
+        "position_starts": np.append(new_starts, int(sorted_counts.sum())),
+        "positions": block_positions[gather],
+    }
+    os.makedirs(run_path, exist_ok=True)
+    for name in RUN_ARRAYS:
+        np.save(os.path.join(run_path, f"{name}.npy"), run[name])
+    # Where each term's postings start in the run, so the merge never scans the terms array
+    unique_terms, term_starts = np.unique(run["terms"], return_index=True)
+    np.save(os.path.join(run_path, "term_table.npy"), np.stack([unique_terms.astype(np.int64), term_starts]))
+    return len(order)
+
+def iter_run_terms(run_index, run_path):
+    term_table = np.load(os.path.join(run_path, "term_table.npy"))
+    num_postings = len(np.load(os.path.join(run_path, "terms.npy"), mmap_mode="r"))
+    unique_terms, term_starts = term_table[0].tolist(), term_table[1].tolist()
+    for i, term_id in enumerate(unique_terms):
+        end = term_starts[i + 1] if i + 1 < len(unique_terms) else num_postings
+        yield term_id, run_index, term_starts[i], end
+
+def iter_term_pieces(runs, slices, piece_postings=MERGE_PIECE_POSTINGS):
+    """
+    A term's postings across its run slices, in doc id order, at most piece_postings at a time:
+    (doc_ids, frequencies, position counts, positions) views into the mapped runs.
+    """
+    for run_index, start, end in slices:
+        run = runs[run_index]
+        for piece_start in range(start, end, piece_postings):
+            piece_end = min(piece_start + piece_postings, end)
+            frequencies = run["frequencies"][piece_start:piece_end]
+            positions = run["positions"][run["position_starts"][piece_start]:run["position_starts"][piece_end]]
+            yield run["doc_ids"][piece_start:piece_end], frequencies, frequencies.sum(axis=1, dtype=np.int64), positions
+
+def merge_runs(run_paths, base_path, doc_table, first_doc_id=0, impacts=False):
+    """
+    k-way merge of the sorted runs into the final barrels and term dictionary.
+    Runs cover increasing doc id ranges, so concatenating a term's slices in run order
+    keeps its postings sorted by doc id. doc_table holds each document's byte offset and lengths,
+    starting at first_doc_id. With impacts, every term also gets an impact-ordered copy of
+    its postings for score-at-a-time queries. Terms are encoded in pieces of
+    MERGE_PIECE_POSTINGS postings, so memory stays bounded however long a posting list is.
+    """
+    os.makedirs(base_path, exist_ok=True)
+    runs = [{name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in RUN_ARRAYS} for path in run_paths]
+    barrels = [open(os.path.join(base_path, segment_file(i)), "wb") for i in range(NUM_BARRELS)]
+    position_barrels = [open(os.path.join(base_path, positions_file(i)), "wb") for i in range(NUM_BARRELS)]
+    impact_barrels = [open(os.path.join(base_path, impacts_file(i)), "wb") for i in range(NUM_BARRELS)] if impacts else []
+    dictionary = TermDictionary()
+
+    def saturation_pieces(slices):
+        for doc_ids, frequencies, _, _ in iter_term_pieces(runs, slices):
+            lengths = doc_table["length"][np.asarray(doc_ids) - first_doc_id]
+            postings = PostingList(doc_ids, None, frequencies, lengths, len(doc_ids) * POSTING_SIZE)
+            yield doc_ids, term_scores(postings, 1.0)
+
+    def flush(word_id, slices):
+        count = sum(end - start for _, start, end in slices)
+        barrel_index = word_id % NUM_BARRELS
+        f = barrels[barrel_index]
+        positions_f = position_barrels[barrel_index]
+        offset, positions_offset = f.tell(), positions_f.tell()
+        length = write_postings(f, count, lambda: ((p[0], p[1]) for p in iter_term_pieces(runs, slices)))
+        positions_length = write_positions(positions_f, count, lambda: ((p[2], p[3]) for p in iter_term_pieces(runs, slices)))
+        # Best saturation of any posting, the per-term upper bound used by top-k queries
+        max_saturation = max(float(saturations.max()) for _, saturations in saturation_pieces(slices))
+        location = (offset, length, count, max_saturation, positions_offset, positions_length)
+        if impacts:
+            # Fixed at build time except for idf, which queries multiply in
+            scale = impact_scale(max_saturation)
+            impacts_f = impact_barrels[barrel_index]
+            impacts_offset = impacts_f.tell()
+            impacts_length = write_impacts(impacts_f, lambda: (
+                (doc_ids, quantize_impacts(saturations, scale)[0]) for doc_ids, saturations in saturation_pieces(slices)
+            ))
+            location += (impacts_offset, impacts_length, scale)
+        # Record where the term's postings start so queries can seek straight to them
+        dictionary.set(word_id, barrel_index, *location)
+
+    current_term = None
+    slices = []
+    merged = heapq.merge(*(iter_run_terms(i, path) for i, path in enumerate(run_paths)))
+    for term_id, run_index, start, end in merged:
+        if term_id != current_term and slices:
+            flush(current_term, slices)
+            slices = []
+        current_term = term_id
+        slices.append((run_index, start, end))
+    if slices:
+        flush(current_term, slices)
+
+    for f in barrels + position_barrels + impact_barrels:
+        f.close()
+    dictionary.save(os.path.join(base_path, DICTIONARY_FILE))
+    return len(dictionary)
+
+def build_shard(docs, term_ids, frequencies, positions, first, last, shard_path, first_doc_id, max_postings, temp_path, impacts=False):
+    """
+    Build the barrels of documents first..last-1 in shard_path, SPIMI style: invert blocks that
+    fit in the memory limit, spill each as a sorted run, then merge the runs into barrels.
+    The shard's doc table starts at first_doc_id.
+    """
+    shard_docs = docs[first:last]
+    os.makedirs(shard_path, exist_ok=True)
+    doc_table_path = os.path.join(shard_path, DOC_TABLE_FILE)
+    write_doc_table(doc_table_path, shard_docs["doc_id"], shard_docs["byte_offset"], shard_docs["length"], first_doc_id)
+    doc_table = np.memmap(doc_table_path, dtype=DOC_TABLE_DTYPE, mode="r")
+
+    run_paths = []
+    for block_first, block_last in plan_blocks(shard_docs["count"], max_postings):
+        run_path = os.path.join(temp_path, f"run_{len(run_paths)}")
+        num_postings = invert_block(docs, term_ids, frequencies, positions, first + block_first, first + block_last, run_path)
+        run_paths.append(run_path)
+        print(f"Run {len(run_paths) - 1}: docs {first + block_first}-{first + block_last - 1}, {num_postings} postings, peak RSS {peak_rss_mb()} MB")
+
+    num_terms = merge_runs(run_paths, shard_path, doc_table, first_doc_id, impacts)
+    shutil.rmtree(temp_path, ignore_errors=True)
+    print(f"Merged {len(run_paths)} runs into {NUM_BARRELS} barrels with {num_terms} terms")
+    return num_terms
+
+def build_inverted_index(forward_path, base_path, memory_limit_mb=MEMORY_LIMIT_MB, temp_path=None, num_shards=NUM_SHARDS, impacts=False):
+    """
+    Build the barrels from the forward index, split into num_shards document-partitioned shards
+    with about the same number of postings each. One shard is written straight into base_path.
+    Statistics of the whole corpus are recorded for every shard to score with. With impacts,
+    quantized impact-ordered postings are written too, and top-k queries use them.
+    """
+    temp_path = temp_path or os.path.join(base_path, "runs")
+    docs, term_ids, frequencies, positions = read_forward_index(forward_path)
+    os.makedirs(base_path, exist_ok=True)
+    max_postings = max(1, memory_limit_mb * 1024 * 1024 // BLOCK_BYTES_PER_POSTING)
+
+    # Upper bounds stored in the dictionary must be computed with the lengths queries will use
+    num_docs = len(docs)
+    avg_doc_length = float(docs["length"].sum(dtype=np.int64)) / max(num_docs, 1)
+    set_corpus_stats(num_docs, avg_doc_length)
+
+    # A tiny corpus can't fill every shard
+    shard_ranges = [(first, last) for first, last in plan_shards(docs["count"], num_shards) if last > first]
+    num_terms = 0
+    for shard, (first, last) in enumerate(shard_ranges):
+        if len(shard_ranges) == 1:
+            # The unsharded layout, as the backend has always read it
+            shard_path, first_doc_id = base_path, 0
+        else:
+            shard_path, first_doc_id = os.path.join(base_path, shard_dir(shard)), int(docs["doc_id"][first])
+        print(f"Shard {shard}: docs {first}-{last - 1}")
+        num_terms = max(num_terms, build_shard(
+            docs, term_ids, frequencies, positions, first, last, shard_path, first_doc_id, max_postings, temp_path, impacts,
+        ))
+
+    write_corpus_stats(base_path, num_docs, avg_doc_length, [
+        (docs["doc_id"][first], docs["doc_id"][last - 1]) for first, last in shard_ranges
+    ])
+    return num_terms
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the barrels from the binary forward index.")
+    parser.add_argument("--memory-mb", type=int, default=MEMORY_LIMIT_MB, help="memory ceiling for each inverted block")
+    parser.add_argument("--shards", type=int, default=NUM_SHARDS, help="number of document-partitioned shards")
+    parser.add_argument("--impacts", action="store_true", help="also write quantized impact-ordered postings for score-at-a-time queries")
+    args = parser.parse_args()
+
     start_time = time.perf_counter()
-    barrels = create_inverted_index()
-    save_barrels(barrels, inverted_index_base_path)
+    build_inverted_index(forward_index_path, inverted_index_base_path, args.memory_mb, num_shards=args.shards, impacts=args.impacts)
     end_time = time.perf_counter()
-    print(f"Time taken: {end_time - start_time:.2f} seconds")
\ No newline at end of file
+    print(f"Time taken: {end_time - start_time:.2f} seconds")
+    print(f"Peak RSS: {peak_rss_mb()} MB")
@@ -1,17 +1,16 @@
 import pandas as pd
-# Initializing lexicon (dict)
-lexicon = {}
-# Reading the Processed Text from the CSV 
-data = pd.read_csv("D:\\code\\DSAProject\\reSearch\\processed_text_final.csv")
+import os
+import sys
 
-# Creating the 'processed_text' column by concatenating non-NaN values from 'title', 'abstract', and 'keywords'
-data['processed_text'] = data.apply(lambda row: " ".join([str(row[col]) for col in ['title', 'abstract', 'keywords'] if pd.notna(row[col])]), axis=1)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from lexicon_store import build_snapshot
 
-# applying the split operation to the 'processed_text' column
-data['processed_text'] = data['processed_text'].apply(lambda x: x.split())
+processed_text_path = "D:\\code\\DSAProject\\reSearch\\processed_text_final.csv"
+lexicon_path = "D:\\code\\DSAProject\\reSearch\\lexicon.csv"
+lexicon_snapshot_path = "D:\\code\\DSAProject\\reSearch\\lexicon.bin"
 
-def make_lexicon(column):
-    id = 1
+def make_lexicon(column, lexicon):
+    id = len(lexicon) + 1
 
     for tokens in column:
         for word in tokens:
@@ -21,10 +20,34 @@ def make_lexicon(column):
                 id += 1
 
 
-make_lexicon(data['processed_text'])
+def build_lexicon(processed_path, lexicon_path, snapshot_path):
+    """
+    Number every word of the processed text in order of first appearance, and write the
+    lexicon csv and its binary snapshot. Returns the number of words.
+    """
+    # Initializing lexicon (dict)
+    lexicon = {}
+    # Reading the Processed Text from the CSV 
+    data = pd.read_csv(processed_path)
 
-# Convert the lexicon dictionary to a DataFrame for exporting
-df = pd.DataFrame(list(lexicon.items()), columns=["Word", "WordId"])
+    # Creating the 'processed_text' column by concatenating non-NaN values from 'title', 'abstract', and 'keywords'
+    data['processed_text'] = data.apply(lambda row: " ".join([str(row[col]) for col in ['title', 'abstract', 'keywords'] if pd.notna(row[col])]), axis=1)
 
-# Export the DataFrame to a CSV file
-df.to_csv("D:\\code\\DSAProject\\reSearch\\lexicon.csv", index=False)
\ No newline at end of file
+    # applying the split operation to the 'processed_text' column
+    data['processed_text'] = data['processed_text'].apply(lambda x: x.split())
+
+    make_lexicon(data['processed_text'], lexicon)
+
+    # Convert the lexicon dictionary to a DataFrame for exporting
+    df = pd.DataFrame(list(lexicon.items()), columns=["Word", "WordId"])
+
+    # Export the DataFrame to a CSV file
+    df.to_csv(lexicon_path, index=False)
+
+    # Binary snapshot that the backend and forward_index.py memory-map instead of parsing the csv
+    build_snapshot(lexicon_path, snapshot_path)
+    return len(lexicon)
+
+
+if __name__ == "__main__":
+    build_lexicon(processed_text_path, lexicon_path, lexicon_snapshot_path)
@@ -0,0 +1,88 @@
+import numpy as np
+import argparse
+import orjson
+import time
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from postings import decode_postings
+from shards import open_shards
+from doc_table import DOC_TABLE_FILE
+
+# Barrels to report on
+inverted_index_base_path = "D:\\code\\DSAProject\\reSearch\\barrels"
+
+# Bytes per posting of the uncompressed layout used before: uint64 byte offset, uint32 doc id,
+# uint16 x 3 frequencies and uint16 x 3 lengths
+LEGACY_POSTING_SIZE = 8 + 4 + 2 * 3 + 2 * 3
+
+def legacy_encode(postings):
+    return b"".join([
+        postings.byte_offsets.astype(np.uint64).tobytes(), postings.doc_ids.astype(np.uint32).tobytes(),
+        postings.frequencies.astype(np.uint16).tobytes(), postings.lengths.astype(np.uint16).tobytes(),
+    ])
+
+def legacy_decode(buffer):
+    n = len(buffer) // LEGACY_POSTING_SIZE
+    byte_offsets = np.frombuffer(buffer, dtype=np.uint64, count=n)
+    doc_ids = np.frombuffer(buffer, dtype=np.uint32, count=n, offset=8 * n)
+    frequencies = np.frombuffer(buffer, dtype=np.uint16, count=3 * n, offset=12 * n).reshape(n, 3)
+    lengths = np.frombuffer(buffer, dtype=np.uint16, count=3 * n, offset=18 * n).reshape(n, 3)
+    return doc_ids, byte_offsets, frequencies, lengths
+
+def time_decode(decode, buffers, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for buffer in buffers:
+            decode(buffer)
+    return time.perf_counter() - start
+
+def postings_report(base_path, sample_terms=1000, repeat=3):
+    """
+    Compare the size of the compressed barrels with the uncompressed layout, and the decode
+    speed of both on the sample_terms longest posting lists. Sharded indexes are reported
+    as a whole.
+    """
+    stores = open_shards(base_path)
+    num_terms = num_postings = compressed_bytes = doc_table_bytes = 0
+    lists = []  # (doc_freq, shard, term_id) of every posting list
+    for shard, store in enumerate(stores):
+        entries = store.dictionary.entries
+        term_ids = np.flatnonzero(entries["length"])
+        num_terms = max(num_terms, len(term_ids))
+        num_postings += int(entries["doc_freq"][term_ids].sum())
+        compressed_bytes += int(entries["length"][term_ids].sum())
+        doc_table_bytes += os.path.getsize(os.path.join(store.base_path, DOC_TABLE_FILE))
+        lists.extend(zip(entries["doc_freq"][term_ids].tolist(), [shard] * len(term_ids), term_ids.tolist()))
+
+    longest = sorted(lists, reverse=True)[:sample_terms]
+    buffers = [(bytes(stores[shard].read(term_id)), stores[shard].doc_table) for _, shard, term_id in longest]
+    legacy_buffers = [legacy_encode(decode_postings(buffer, doc_table)) for buffer, doc_table in buffers]
+    sample_postings = sum(doc_freq for doc_freq, _, _ in longest) * repeat
+
+    compressed_seconds = time_decode(lambda item: decode_postings(*item), buffers, repeat)
+    # The old layout decoded to zero-copy views; copy the columns so both end with owned arrays
+    legacy_seconds = time_decode(lambda buffer: [column.copy() for column in legacy_decode(buffer)], legacy_buffers, repeat)
+
+    return {
+        "terms": num_terms,
+        "postings": num_postings,
+        "legacy_bytes": num_postings * LEGACY_POSTING_SIZE,
+        "compressed_bytes": compressed_bytes,
+        "doc_table_bytes": doc_table_bytes,
+        "compression_ratio": num_postings * LEGACY_POSTING_SIZE / max(compressed_bytes + doc_table_bytes, 1),
+        "bytes_per_posting": compressed_bytes / max(num_postings, 1),
+        "decode_sample_terms": len(buffers),
+        "legacy_decode_postings_per_second": sample_postings / max(legacy_seconds, 1e-9),
+        "compressed_decode_postings_per_second": sample_postings / max(compressed_seconds, 1e-9),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report index size and decode speed of the compressed barrels.")
+    parser.add_argument("--sample-terms", type=int, default=1000, help="number of longest posting lists to time")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    report = postings_report(inverted_index_base_path, args.sample_terms, args.repeat)
+    print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
@@ -0,0 +1,87 @@
+import contextlib
+import io
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+import benchmark
+
+
+class Words:
+    """
+    Generated words with Zipfian frequencies, as benchmark.Vocabulary draws them, without
+    its stop word check.
+    """
+
+    def __init__(self, size, rng, exponent=1.07):
+        words = {}
+        while len(words) < size:
+            words.setdefault("".join(rng.choice(benchmark.SYLLABLES, size=int(rng.integers(2, 5)))), None)
+        self.words = np.array(list(words), dtype=object)
+        weights = 1.0 / np.arange(1, size + 1) ** exponent
+        self.probabilities = weights / weights.sum()
+
+    def sample(self, rng, n):
+        return self.words[rng.choice(len(self.words), size=n, p=self.probabilities)].tolist()
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """
+    Builds a generated corpus and its index in tmp_path, or a directory name of it, and starts
+    the backend on it. Returns (app, vocabulary).
+    """
+    apps = []
+
+    def start(num_docs=400, vocabulary_size=300, num_shards=1, impacts=False, seed=0, name=""):
+        rng = np.random.default_rng(seed)
+        vocabulary = Words(vocabulary_size, rng)
+        path = os.path.join(str(tmp_path), name)
+        os.makedirs(path, exist_ok=True)
+        benchmark.generate_corpus(
+            vocabulary, rng, num_docs, os.path.join(path, benchmark.CORPUS_FILE), os.path.join(path, benchmark.PROCESSED_FILE),
+        )
+        benchmark.build_index(path, num_shards, impacts)
+        app = benchmark.start_backend(path)
+        # Results cached from the corpus of an earlier test
+        app.result_cache.invalidate_all()
+        apps.append(app)
+        return app, vocabulary
+
+    yield start
+    for app in apps:
+        app.compactor.stop()
+        if app.shard_searcher is not None:
+            app.shard_searcher.shutdown()
+            app.shard_searcher = None
+
+
+@pytest.fixture
+def quiet():
+    # The backend prints a line for most steps of a query
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@pytest.fixture
+def add_documents():
+    """
+    Indexes documents as ingest_documents does once they are analysed, without the analyser.
+    """
+
+    def add(app, words, n=1):
+        """
+        Index n documents holding the given words once each in their title. Returns their doc ids.
+        """
+        doc_ids = list(range(app.next_doc_id, app.next_doc_id + n))
+        app.next_doc_id += n
+        analysed = [([len(words), 0, 0], {word: [1, 0, 0] for word in words}, {word: [position] for position, word in enumerate(words)})] * n
+        app.index_documents(analysed, doc_ids, [0] * n)
+        app.result_cache.invalidate_terms(words)
+        return doc_ids
+
+    return add
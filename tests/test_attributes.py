@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from attributes import AttributeStore, ATTRIBUTE_COLUMNS, column_file, filter_mask, sort_order
+
+
+def csv_columns(csv_path):
+    # As the store parses them; row i of the data file is doc id i + 1
+    rows = pd.read_csv(csv_path, sep="|", dtype=str, keep_default_na=False)
+    return {name: [0] + pd.to_numeric(rows[name], errors="coerce").fillna(0).astype(int).tolist() for name in ATTRIBUTE_COLUMNS}
+
+
+@pytest.fixture
+def corpus(backend, quiet):
+    app, _ = backend(num_docs=150)
+    return app
+
+
+def test_sync_builds_the_columns_from_the_document_store(corpus, tmp_path):
+    store = AttributeStore(str(tmp_path / "rebuilt"))
+    assert store.sync(corpus.doc_store, chunk_size=40) == 150
+    assert len(store) == 151
+    expected = csv_columns(corpus.csv_path)
+    for name in ATTRIBUTE_COLUMNS:
+        assert store.column(name, np.arange(151)).tolist() == expected[name]
+        # Doc ids past the end read as 0
+        assert store.column(name, [150, 151, 10 ** 6]).tolist() == [expected[name][150], 0, 0]
+    assert store.sync(corpus.doc_store) == 0
+
+
+def test_sync_catches_up_documents_added_without_attributes(corpus):
+    store = corpus.attribute_store
+    documents = [
+        {"year": 2021, "n_citation": 12},
+        {"year": "unknown", "n_citation": ""},
+        {"year": "1999", "n_citation": -4},
+    ]
+    corpus.doc_store.append([151, 152, 153], [dict(document, title="t", abstract="a", keywords=[], url="u") for document in documents])
+    # Another process reading the store sees them once it catches up
+    reader = AttributeStore(corpus.attributes_path)
+    assert store.sync(corpus.doc_store) == 3
+    assert store.column("year", [151, 152, 153]).tolist() == [2021, 0, 1999]
+    assert store.column("n_citation", [151, 152, 153]).tolist() == [12, 0, 0]
+    assert len(reader) == 151
+    reader.refresh()
+    assert reader.column("year", [151, 152, 153]).tolist() == [2021, 0, 1999]
+
+
+def test_sync_completes_a_column_a_crash_left_short(corpus):
+    store = corpus.attribute_store
+    expected = store.column("year", np.arange(151)).tolist()
+    citations = os.path.join(corpus.attributes_path, column_file("n_citation"))
+    with open(citations, "r+b") as f:
+        f.truncate(100 * ATTRIBUTE_COLUMNS["n_citation"].itemsize)
+    store = AttributeStore(corpus.attributes_path)
+    assert len(store) == 100
+    assert store.sync(corpus.doc_store) == 51
+    assert len(store) == 151
+    assert store.column("year", np.arange(151)).tolist() == expected
+    assert store.column("n_citation", np.arange(151)).tolist() == csv_columns(corpus.csv_path)["n_citation"]
+
+
+def test_filters_and_sort_orders(tmp_path):
+    store = AttributeStore(str(tmp_path / "rebuilt"))
+    years = [0, 2001, 0, 2010, 1995, 2010, 2005]
+    citations = [0, 5, 40, 5, 0, 12, 40]
+    store.append(np.arange(1, 7), [{"year": year, "n_citation": n} for year, n in zip(years[1:], citations[1:])])
+    doc_ids = np.array([6, 2, 5, 1, 3, 4, 9])
+    scores = np.array([1.0, 3.0, 2.0, 2.0, 0.5, 1.0, 4.0])
+
+    def passing(**filters):
+        return doc_ids[filter_mask(store, doc_ids, **filters)].tolist()
+
+    assert passing() == doc_ids.tolist()
+    # Documents without a year, and unknown doc ids, never pass a year filter
+    assert passing(year_from=2000) == [6, 5, 1, 3]
+    assert passing(year_to=2005) == [6, 1, 4]
+    assert passing(year_from=2001, year_to=2005, min_citations=10) == [6]
+    assert passing(min_citations=10) == [6, 2, 5]
+
+    def ordered(mode):
+        return doc_ids[sort_order(store, doc_ids, scores, mode)].tolist()
+
+    assert ordered("relevance") == [9, 2, 1, 5, 4, 6, 3]
+    assert ordered("citations") == [2, 6, 5, 1, 3, 9, 4]
+    assert ordered("newest") == [5, 3, 6, 1, 4, 9, 2]
+    # Unknown years last
+    assert ordered("oldest") == [4, 1, 6, 5, 3, 9, 2]
@@ -0,0 +1,36 @@
+def ranked(app, prefix, limit=10):
+    # Every suggestable word of the lexicon with the prefix, best first as complete ranks them
+    words = [(app.document_frequency(word_id), word) for word, word_id in app.lexicon.items() if word.startswith(prefix) and word.isalnum()]
+    return [word for _, word in sorted(words, key=lambda suggestion: (-suggestion[0], suggestion[1]))[:limit]]
+
+
+def test_completions_are_ranked_by_document_frequency(backend, quiet):
+    app, vocabulary = backend(num_docs=300, vocabulary_size=2000)
+    words = vocabulary.words.tolist()
+    # Prefixes with stored top lists, and rarer ones ranked when queried
+    prefixes = ["", "b", "ba", "za"] + [word[:3] for word in words[:20]] + [word[:4] for word in words[100:120]] + words[:5]
+    for prefix in prefixes:
+        assert app.completion_index.complete(prefix) == ranked(app, prefix), prefix
+        assert app.completion_index.complete(prefix, limit=25) == ranked(app, prefix, 25), prefix
+    assert app.completion_index.complete("qqq") == []
+
+
+def test_added_documents_and_words_count_at_once(backend, quiet, add_documents):
+    app, vocabulary = backend(num_docs=300, vocabulary_size=2000)
+    prefix = vocabulary.words[0][:2]
+    # A word of the snapshot too rare to be suggested, and a word new to the lexicon
+    rare = [word for word, _ in app.lexicon.items() if word.startswith(prefix) and word not in app.completion_index.complete(prefix)][0]
+    new_word = prefix + "zuzuzu"
+    new_id = app.next_word_id
+    app.next_word_id += 1
+    app.lexicon.update({new_word: new_id})
+    app.completion_index.add_words({new_word: new_id})
+    top = app.document_frequency(app.lexicon.get(app.completion_index.complete(prefix)[0]))
+    # Both now above every stored completion, the new word ahead
+    add_documents(app, [rare], n=top + 1 - app.document_frequency(app.lexicon.get(rare)))
+    add_documents(app, [new_word], n=top + 2)
+    assert app.completion_index.complete(prefix)[:2] == [new_word, rare]
+    assert app.completion_index.complete(prefix) == ranked(app, prefix)
+
+    response = app.app.test_client().get("/api/autocomplete", query_string={"prefix": prefix.upper()})
+    assert response.get_json() == ranked(app, prefix)
@@ -0,0 +1,20 @@
+from barrel_cache import BarrelCache
+from postings import POSTING_SIZE
+
+
+def test_warm_up_stays_within_the_decoded_budget(backend, quiet):
+    app, vocabulary = backend(num_docs=300)
+    store = app.shard_set.writable
+    term_ids = [app.lexicon.get(word) for word in vocabulary.words[:20]]
+    # Room for the decoded postings of the first five terms, and for the sixth only compressed
+    warmed = sum(store.doc_freq(term_id) for term_id in term_ids[:5]) * POSTING_SIZE
+    spare = store.doc_freq(term_ids[5]) * POSTING_SIZE // 2
+    assert len(store.read(term_ids[5])) < spare
+    cache = BarrelCache(store, max_bytes=warmed + spare)
+    assert cache.warm_up(term_ids) == 5
+    assert cache.current_bytes == warmed
+    # Every warmed term is still there to be hit
+    for term_id in term_ids[:5]:
+        cache.get(term_id)
+    assert cache.stats()["hits"] == 5
+    assert cache.stats()["evictions"] == 0
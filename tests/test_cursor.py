@@ -0,0 +1,73 @@
+import base64
+import numpy as np
+import pytest
+from cursor import encode_cursor, decode_cursor, resume_position
+
+
+def test_resume_position():
+    doc_ids = np.array([8, 3, 5, 9, 1])
+    assert resume_position(doc_ids, 0, 7) == 0
+    # The hit before the page is where it was
+    assert resume_position(doc_ids, 2, 3) == 2
+    # Hits were added ahead of it
+    assert resume_position(doc_ids, 2, 5) == 3
+    assert resume_position(doc_ids, 2, 1) == 5
+    # Gone from the hits, the offset is all there is to go by
+    assert resume_position(doc_ids, 2, 4) == 2
+    assert resume_position(doc_ids, 9, 4) == 9
+
+
+def test_cursor_round_trip():
+    state = {"query": "neural network", "per_page": 10, "offset": 20, "last": 1234, "sort": "newest", "year_from": 2001}
+    assert decode_cursor(encode_cursor(state)) == dict(state, v=1)
+
+
+@pytest.mark.parametrize("token", [
+    "", "not a cursor", "e30", encode_cursor({"query": "a", "per_page": 10, "offset": 10, "last": 3})[:-3],
+    encode_cursor({"query": "a", "per_page": 10, "offset": 10}),
+    encode_cursor({"query": "a", "per_page": 10, "offset": -10, "last": 3}),
+    encode_cursor({"query": "a", "per_page": True, "offset": 10, "last": 3}),
+    # A cursor of another version
+    base64.urlsafe_b64encode(b'{"v":0,"query":"a","per_page":10,"offset":10,"last":3}').decode("ascii"),
+])
+def test_malformed_cursors_are_refused(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+@pytest.fixture
+def client(backend, quiet, monkeypatch):
+    app, vocabulary = backend(num_docs=300)
+    app.compactor.stop()
+    # The query normaliser needs NLTK data; the generated words are normalised already
+    monkeypatch.setattr(app, "normalise_query", lambda text: text.lower().split())
+    return app, vocabulary, app.app.test_client()
+
+
+def served(client, body):
+    response = client.post("/api/process", json=body)
+    assert response.status_code == 200
+    body = response.get_json()
+    return [document["doc_id"] for document in body["output"]], body["next_cursor"]
+
+
+def test_pages_stay_stable_as_documents_are_added(client, add_documents):
+    app, vocabulary, client = client
+    word = vocabulary.words[4]
+    everything, _ = served(client, {"query": word, "per_page": 1000})
+    assert len(everything) > 30
+
+    pages = []
+    page, cursor = served(client, {"query": word, "per_page": 7})
+    while cursor is not None:
+        pages.append(page)
+        # Hits ranked ahead of the page just served, as short documents with the word in their
+        # title are; the document store doesn't have them, so they are never served
+        added = add_documents(app, [word], n=2)
+        ranked = app.search_terms([word])[0][0].tolist()
+        assert set(added) <= set(ranked[:ranked.index(page[-1])])
+        page, cursor = served(client, {"cursor": cursor})
+    pages.append(page)
+    # Every hit of the first search once, in its order
+    assert [doc_id for page in pages for doc_id in page] == everything
+    assert all(len(page) == 7 for page in pages[:-1])
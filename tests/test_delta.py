@@ -0,0 +1,128 @@
+import os
+import numpy as np
+from delta_index import DeltaIndex
+
+
+def segment_bytes(store):
+    usage = store.segment_usage()
+    return sum(live for live, _ in usage.values()), sum(file_bytes for _, file_bytes in usage.values())
+
+
+def test_compaction_reclaims_replaced_segments(backend, quiet, add_documents):
+    app, vocabulary = backend(num_docs=300)
+    app.compactor.stop()
+    store = app.shard_set.writable
+    common = app.lexicon.get(vocabulary.words[0])
+    before = len(app.term_postings(common))
+    added = []
+    for _ in range(30):
+        # Every compaction rewrites the whole posting list of the common word
+        added += add_documents(app, [vocabulary.words[0]])
+        app.delta_index.compact(app.invalidate_terms)
+        live, file_bytes = segment_bytes(store)
+        assert file_bytes <= 2.5 * live
+
+    postings = app.term_postings(common)
+    assert len(postings) == before + len(added)
+    assert set(added) <= set(postings.doc_ids.tolist())
+    # Of the segments compaction wrote, only the live one and those replaced by the last compaction are left
+    assert len([segment for segment in store.segments_on_disk() if segment >= store.num_segments]) <= 3
+
+
+def test_compaction_moves_live_postings_unchanged(backend, quiet, add_documents):
+    app, vocabulary = backend(num_docs=300)
+    app.compactor.stop()
+    store = app.shard_set.writable
+    common = app.lexicon.get(vocabulary.words[0])
+    barrel = store.location(common)[0]
+    # The other terms of the common word's barrel, which compaction never rewrites
+    neighbours = np.flatnonzero((store.dictionary.entries["segment"] == barrel) & (store.dictionary.entries["length"] > 0))
+    neighbours = [int(term_id) for term_id in neighbours if term_id != common]
+    assert neighbours
+    expected = {term_id: (store.read(term_id), store.read_positions(term_id)) for term_id in neighbours}
+    for _ in range(3):
+        add_documents(app, [vocabulary.words[0]])
+        app.delta_index.compact(app.invalidate_terms)
+    # The barrel is mostly garbage once the common word moves out, so its other terms move too
+    assert barrel not in store.segments_on_disk()
+    for term_id in neighbours:
+        assert store.location(term_id)[0] >= store.num_segments
+        assert (store.read(term_id), store.read_positions(term_id)) == expected[term_id]
+
+
+def recovered_doc_ids(app):
+    # As a restart recovers the log
+    delta_index = DeltaIndex(app.wal_path, app.shard_set.writable)
+    delta_index.wal.close()
+    return [record["doc_id"] for record in delta_index.recovered]
+
+
+def test_documents_without_terms_are_not_replayed_once_compacted(backend, quiet, add_documents):
+    app, vocabulary = backend(num_docs=100)
+    app.compactor.stop()
+    common = app.lexicon.get(vocabulary.words[0])
+    empty = add_documents(app, [])
+    added = add_documents(app, [vocabulary.words[0]])
+    assert recovered_doc_ids(app) == empty + added
+    with open(app.wal_path, "rb") as f:
+        logged = f.read()
+    app.delta_index.compact(app.invalidate_terms)
+    # A crash after the compaction was published, before its log was removed
+    with open(app.delta_index.compacting_path, "wb") as f:
+        f.write(logged)
+    assert recovered_doc_ids(app) == []
+
+
+def test_recovery_drops_a_torn_final_record(backend, quiet, add_documents):
+    app, vocabulary = backend(num_docs=100)
+    app.compactor.stop()
+    common = app.lexicon.get(vocabulary.words[0])
+    added = add_documents(app, [vocabulary.words[0]], n=3)
+    next_doc_id = app.next_doc_id
+    # A crash halfway through writing the next record
+    with open(app.wal_path, "ab") as f:
+        f.write(b'{"doc_id": %d, "byte_offset": 0, "len' % next_doc_id)
+    assert recovered_doc_ids(app) == added
+    # The log was rewritten clean, so records appended after recovery are read back too
+    with open(app.wal_path, "rb") as f:
+        assert f.read().endswith(b"}\n")
+    delta_index = DeltaIndex(app.wal_path, app.shard_set.writable)
+    delta_index.add_documents([(next_doc_id, 0, [1, 0, 0], {common: [1, 0, 0]}, None, {common: [0]})])
+    delta_index.wal.close()
+    assert recovered_doc_ids(app) == added + [next_doc_id]
+
+
+def test_recovery_replays_an_interrupted_compaction(backend, quiet, add_documents):
+    app, vocabulary = backend(num_docs=100)
+    app.compactor.stop()
+    common = app.lexicon.get(vocabulary.words[0])
+    compacting = add_documents(app, [vocabulary.words[0]], n=2)
+    # A crash after the log was set aside for compaction, before the segment was published
+    app.delta_index.wal.close()
+    os.replace(app.wal_path, app.delta_index.compacting_path)
+    app.delta_index.wal = open(app.wal_path, "ab")
+    logged = add_documents(app, [vocabulary.words[0]])
+
+    delta_index = DeltaIndex(app.wal_path, app.shard_set.writable)
+    delta_index.wal.close()
+    assert [record["doc_id"] for record in delta_index.recovered] == compacting + logged
+    assert delta_index.get(common).doc_ids.tolist() == compacting + logged
+    # Folded back into a single log
+    assert not os.path.exists(delta_index.compacting_path)
+    assert recovered_doc_ids(app) == compacting + logged
+
+
+def test_recovery_skips_documents_already_compacted(backend, quiet, add_documents):
+    app, vocabulary = backend(num_docs=100)
+    app.compactor.stop()
+    common = app.lexicon.get(vocabulary.words[0])
+    compacted = add_documents(app, [vocabulary.words[0]], n=2)
+    with open(app.wal_path, "rb") as f:
+        logged = f.read()
+    app.delta_index.compact(app.invalidate_terms)
+    pending = add_documents(app, [vocabulary.words[0]])
+    # A crash after the compaction was published, before its log was removed
+    with open(app.delta_index.compacting_path, "wb") as f:
+        f.write(logged)
+    assert recovered_doc_ids(app) == pending
+    assert set(compacted) <= set(app.term_postings(common).doc_ids.tolist())
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+from doc_store import DocStore, DOCUMENT_FIELDS
+
+DOCUMENT = {
+    "title": "quokka habitat",
+    "abstract": "where | quokka live",
+    "year": 2020,
+    "keywords": ["marsupial"],
+    "n_citation": 7,
+    "url": "https://papers.example.org/quokka",
+}
+
+
+def csv_rows(csv_path):
+    # Row i of the data file is doc id i + 1
+    return pd.read_csv(csv_path, sep="|", dtype=str, keep_default_na=False).to_dict("records")
+
+
+@pytest.fixture
+def corpus(backend, quiet):
+    app, _ = backend(num_docs=120)
+    return app
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_sync_builds_the_store_from_the_data_file(corpus, tmp_path, compressed):
+    store = DocStore.create(str(tmp_path / "documents"), compressed=compressed, block_size=4096)
+    assert store.sync(corpus.csv_path, chunk_size=50) == 120
+    rows = csv_rows(corpus.csv_path)
+    documents = store.get_many(range(1, 121))
+    assert [{field: document[field] for field in DOCUMENT_FIELDS} for document in documents] == rows
+    assert [document["doc_id"] for document in documents] == list(range(1, 121))
+    assert store.get_many([0, 121, 5]) == [None, None, store.get(5)]
+    # Nothing new, nothing added
+    assert store.sync(corpus.csv_path) == 0
+
+
+def test_sync_catches_up_rows_added_to_the_data_file(corpus):
+    store = corpus.doc_store
+    corpus.append_document_rows([dict(DOCUMENT, title=f"quokka {i}") for i in range(3)])
+    # A row still being written is left for the next sync
+    with open(corpus.csv_path, "ab") as f:
+        f.write(b"half written|row")
+    assert store.sync(corpus.csv_path) == 3
+    assert [document["title"] for document in store.get_many([121, 122, 123])] == ["quokka 0", "quokka 1", "quokka 2"]
+    assert store.get(122)["abstract"] == "where | quokka live"
+    assert store.get(124) is None
+
+    with open(corpus.csv_path, "ab") as f:
+        f.write(b"|2021|['x']|0|https://papers.example.org/half\n")
+    assert store.sync(corpus.csv_path) == 1
+    assert store.get(124)["title"] == "half written"
+    assert store.get(124)["abstract"] == "row"
+
+
+def test_readers_see_documents_another_process_appended(corpus):
+    reader = DocStore(corpus.doc_store_path)
+    assert reader.num_docs == 120
+    corpus.doc_store.append([121, 122], [DOCUMENT, dict(DOCUMENT, title="numbat")])
+    assert reader.get(121) is None
+    reader.refresh()
+    assert reader.num_docs == 122
+    assert reader.get(122)["title"] == "numbat"
+    assert reader.get(121)["year"] == "2020"
@@ -0,0 +1,19 @@
+import os
+
+
+def test_failed_publish_keeps_the_old_generation(backend, quiet, monkeypatch, tmp_path):
+    app, _ = backend(num_docs=50)
+    monkeypatch.setattr(app, "publishes_generations", True)
+    before = app.generation_state()
+    # Exists, so the request is accepted, but holds no index to open
+    barrels = tmp_path / "empty_barrels"
+    barrels.mkdir()
+    response = app.app.test_client().post("/api/generation", json={
+        "barrels": str(barrels), "lexicon": app.lexicon_path, "lexicon_snapshot": app.lexicon_snapshot_path,
+    })
+    assert response.status_code == 500
+    assert app.generation_state() == before
+    assert not os.path.exists(app.generation_path)
+    # The old generation still logs and compacts
+    assert not app.delta_index.wal.closed
+    assert app.compactor.is_alive()
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import scoring
+from shards import ShardSet
+
+
+def queries(vocabulary, rng, n=60):
+    # Common words, which most documents share and whose impacts collide most, and rare ones
+    return [vocabulary.sample(rng, int(rng.integers(1, 5))) for _ in range(n)] + [[word] for word in vocabulary.words[:10]]
+
+
+@pytest.mark.parametrize("num_shards", [1, 2])
+def test_impact_top_k_without_budget_matches_bm25_top_k(backend, quiet, monkeypatch, num_shards):
+    app, vocabulary = backend(impacts=True, num_shards=num_shards)
+    assert app.shard_set.has_impacts
+    monkeypatch.setattr(app, "IMPACT_BUDGET_MS", None)
+    rng = np.random.default_rng(1)
+    for query in queries(vocabulary, rng):
+        (impact_ids, impact_scores, impact_offsets), _ = app.compute_impact_top_k(query, 10)
+        with monkeypatch.context() as m:
+            m.setattr(ShardSet, "has_impacts", False)
+            (doc_ids, scores, byte_offsets), _ = app.compute_bm25_top_k(query, 10)
+        assert impact_ids.tolist() == doc_ids.tolist(), query
+        assert impact_scores.tolist() == scores.tolist(), query
+        assert impact_offsets.tolist() == byte_offsets.tolist(), query
+
+
+def test_impacts_are_scaled_per_term():
+    # A term whose saturations are all small still spreads them over the levels
+    saturations = np.linspace(0.01, 0.2, 50)
+    levels, scale = scoring.quantize_impacts(saturations)
+    assert levels.max() == scoring.IMPACT_LEVELS
+    assert len(np.unique(levels)) == len(saturations)
+    assert np.all(np.abs(levels * scale - saturations) <= scale)
@@ -0,0 +1,69 @@
+import pytest
+from doc_store import DocStore
+
+DOCUMENT = {
+    "title": "quokka habitat",
+    "abstract": "where quokka live",
+    "year": 2020,
+    "keywords": ["marsupial"],
+    "n_citation": 0,
+    "url": "https://papers.example.org/quokka",
+}
+
+
+@pytest.fixture
+def client(backend, quiet):
+    app, _ = backend(num_docs=50)
+    return app, app.app.test_client()
+
+
+@pytest.mark.parametrize("route", ["/api/add_document", "/api/add_documents"])
+def test_malformed_json_is_rejected(client, route):
+    app, client = client
+    response = client.post(route, data='[{"title": "quokka"', content_type="application/json")
+    assert response.status_code == 400
+    assert app.next_doc_id == 51
+
+
+@pytest.mark.parametrize("route", ["/api/add_document", "/api/add_documents"])
+def test_unsupported_content_type_is_rejected(client, route):
+    app, client = client
+    response = client.post(route, data="quokka habitat", content_type="text/plain")
+    assert response.status_code == 400
+    assert app.next_doc_id == 51
+
+
+@pytest.mark.parametrize("field, value", [("title", 5), ("abstract", None), ("keywords", "marsupial"), ("keywords", [1])])
+def test_mistyped_fields_are_rejected(client, field, value):
+    app, client = client
+    document = dict(DOCUMENT, **{field: value})
+    response = client.post("/api/add_document", json=document)
+    assert response.status_code == 400
+    response = client.post("/api/add_documents", json=[DOCUMENT, document])
+    assert response.status_code == 400
+    assert response.get_json()["invalid"] == [1]
+    # Nothing of a rejected batch is added
+    assert app.next_doc_id == 51
+
+
+def test_line_breaks_are_cleaned_so_rows_stay_one_line(client, tmp_path):
+    app, _ = client
+    document = app.clean_document(dict(DOCUMENT, title="quokka\nhabitat", abstract="where\r\nquokka live", keywords=["marsu\npial"]))
+    assert (document["title"], document["abstract"], document["keywords"]) == ("quokka habitat", "where  quokka live", ["marsu pial"])
+    app.append_document_rows([document])
+    # A store rebuilt from the data file numbers the document right after the corpus
+    store = DocStore.create(str(tmp_path / "rebuilt"))
+    store.sync(app.csv_path)
+    assert store.num_docs == 51
+    assert store.get(51)["title"] == "quokka habitat"
+
+
+def test_next_doc_id_follows_the_document_store(client):
+    app, _ = client
+    # Stored as ingest_documents stores it, but with a row of two physical lines, as csv
+    # quoting writes a field holding a line break
+    document = dict(DOCUMENT, title="quokka\nhabitat")
+    _, csv_bytes = app.append_document_rows([document])
+    app.doc_store.append([51], [document], csv_bytes)
+    app.open_documents()
+    assert app.next_doc_id == 52
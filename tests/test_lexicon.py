@@ -0,0 +1,92 @@
+import csv
+import io
+import os
+import pytest
+from lexicon_store import Lexicon, build_snapshot, load_lexicon
+
+WORDS = {"network": 1, "neural": 2, "null": 3, "nan": 4, "naïve": 5, "a,b": 6, "zeta": 7, "n": 8}
+
+
+def write_rows(path, words):
+    # As append_lexicon writes them
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(words.items())
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write(buffer.getvalue())
+
+
+@pytest.fixture
+def lexicon_csv(tmp_path):
+    path = str(tmp_path / "lexicon.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Word,WordId\n")
+    write_rows(path, WORDS)
+    return path
+
+
+def test_snapshot_lookups(lexicon_csv, tmp_path):
+    snapshot_path = str(tmp_path / "lexicon.bin")
+    build_snapshot(lexicon_csv, snapshot_path)
+    lexicon = Lexicon(snapshot_path)
+    assert len(lexicon) == len(WORDS)
+    assert lexicon.max_id == 8
+    assert lexicon.csv_bytes == os.path.getsize(lexicon_csv)
+    for word, word_id in WORDS.items():
+        assert lexicon.get(word) == word_id, word
+    assert lexicon.get("neura") is None
+    assert lexicon.get("zz", 0) == 0
+    assert "network" in lexicon and "networks" not in lexicon
+    # Sorted bytewise, so the words with a prefix are contiguous from find
+    words = lexicon.words()
+    assert words == sorted(WORDS, key=lambda word: word.encode("utf-8"))
+    assert words[lexicon.find(b"ne"):lexicon.find(b"nf")] == ["network", "neural"]
+    assert dict(lexicon.items()) == WORDS
+
+
+def test_load_adds_words_appended_since_the_snapshot(lexicon_csv, tmp_path):
+    snapshot_path = str(tmp_path / "lexicon.bin")
+    build_snapshot(lexicon_csv, snapshot_path)
+    write_rows(lexicon_csv, {"pruning": 10, "quokka": 11})
+    covered = os.path.getsize(lexicon_csv)
+    # A row still being written is left for later
+    with open(lexicon_csv, "a", encoding="utf-8") as f:
+        f.write("trans")
+
+    lexicon = load_lexicon(lexicon_csv, snapshot_path)
+    assert lexicon.count == len(WORDS)
+    assert lexicon.get("pruning") == 10 and lexicon.get("quokka") == 11
+    assert lexicon.get("trans") is None
+    assert lexicon.max_id == 11
+    assert lexicon.csv_read == covered
+    assert dict(lexicon.items()) == dict(WORDS, pruning=10, quokka=11)
+
+    with open(lexicon_csv, "a", encoding="utf-8") as f:
+        f.write("former,12\n")
+    write_rows(lexicon_csv, {"unet": 13})
+    assert lexicon.follow(lexicon_csv) == {"transformer": 12, "unet": 13}
+    assert lexicon.follow(lexicon_csv) == {}
+    assert lexicon.get("transformer") == 12
+    assert len(lexicon) == len(WORDS) + 4
+
+
+def test_load_rebuilds_a_stale_snapshot(lexicon_csv, tmp_path, capsys):
+    snapshot_path = str(tmp_path / "lexicon.bin")
+    # Missing
+    lexicon = load_lexicon(lexicon_csv, snapshot_path)
+    assert lexicon.csv_bytes == os.path.getsize(lexicon_csv)
+    del lexicon
+
+    # Too many words appended since it was written
+    write_rows(lexicon_csv, {"pruning": 10, "quokka": 11})
+    lexicon = load_lexicon(lexicon_csv, snapshot_path, max_tail_words=1)
+    assert lexicon.count == len(WORDS) + 2 and not lexicon.added
+    assert lexicon.get("quokka") == 11
+    del lexicon
+
+    # Of a lexicon.csv that was replaced by a shorter one
+    with open(lexicon_csv, "w", encoding="utf-8") as f:
+        f.write("Word,WordId\n")
+    write_rows(lexicon_csv, {"zeta": 1})
+    lexicon = load_lexicon(lexicon_csv, snapshot_path)
+    assert dict(lexicon.items()) == {"zeta": 1}
+    assert capsys.readouterr().out.count("Rebuilding lexicon snapshot") == 3
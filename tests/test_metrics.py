@@ -0,0 +1,28 @@
+import metrics
+
+
+def test_scrapes_add_up_the_workers(tmp_path, monkeypatch):
+    for name, value in [("SNAPSHOT_SECONDS", 3600), ("request_histograms", {}), ("stage_histograms", {}),
+                        ("request_errors", {}), ("shared_path", None), ("worker_name", None), ("shares_requests", True)]:
+        monkeypatch.setattr(metrics, name, value)
+    # Two reader workers of serve.py, one after the other in this process
+    for worker, (requests, hits) in enumerate([(5, 2), (7, 3)]):
+        monkeypatch.setattr(metrics.os, "getpid", lambda worker=worker: 1000 + worker)
+        metrics.share_metrics(str(tmp_path), f"reader-{worker}", lambda: [])
+        for _ in range(requests):
+            metrics.start_trace()
+            metrics.finish_trace("/api/process")
+        metrics.write_snapshot([
+            ("cache_hits_total", "counter", "Hits.", [({}, hits)]),
+            ("cache_entries", "gauge", "Entries.", [({}, hits * 10)]),
+        ])
+
+    requests, _, _, extra = metrics.merge_snapshots()
+    assert sum(requests["/api/process"][0]) == 12
+    # Counters add up, gauges are kept apart by worker
+    assert {name: samples for name, _, _, samples in extra} == {
+        "cache_hits_total": [({}, 5)],
+        "cache_entries": [({"worker": "reader-0"}, 20), ({"worker": "reader-1"}, 30)],
+    }
+    # Whichever worker is scraped reports them all
+    assert 'research_request_seconds_count{route="/api/process"} 12' in metrics.render_metrics()
@@ -0,0 +1,45 @@
+import io
+import numpy as np
+import pytest
+from postings import (
+    encode_postings, encode_positions, encode_impacts, write_postings, write_positions, write_impacts, BLOCK_SIZE,
+)
+
+
+def term(rng, n):
+    doc_ids = np.sort(rng.choice(1 << 24, size=n, replace=False)).astype(np.uint32)
+    frequencies = rng.integers(0, 200, size=(n, 3)).astype(np.uint16)
+    counts = frequencies.sum(axis=1, dtype=np.int64)
+    positions = np.concatenate([np.sort(rng.choice(1 << 20, size=c, replace=False)) for c in counts] + [np.zeros(0, np.int64)])
+    impacts = rng.integers(1, 256, size=n).astype(np.uint8)
+    return doc_ids, frequencies, counts, positions, impacts
+
+
+def written(write):
+    # Something before and after, as other terms share the barrel
+    f = io.BytesIO()
+    f.write(b"before")
+    size = write(f)
+    f.write(b"after")
+    data = f.getvalue()
+    assert size == len(data) - len(b"before") - len(b"after")
+    return data[len(b"before"):-len(b"after")]
+
+
+@pytest.mark.parametrize("n", [0, 1, BLOCK_SIZE, 3 * BLOCK_SIZE + 5, 1000])
+def test_piecewise_writers_match_encoders(n):
+    rng = np.random.default_rng(n)
+    doc_ids, frequencies, counts, positions, impacts = term(rng, n)
+    # Pieces of uneven sizes that don't line up with the blocks
+    bounds = [0] + np.sort(rng.integers(0, n + 1, size=4)).tolist() + [n]
+    position_starts = np.concatenate(([0], np.cumsum(counts)))
+
+    def pieces(*columns):
+        return lambda: (tuple(column[a:b] for column in columns) for a, b in zip(bounds[:-1], bounds[1:]))
+
+    def position_pieces():
+        return ((counts[a:b], positions[position_starts[a]:position_starts[b]]) for a, b in zip(bounds[:-1], bounds[1:]))
+
+    assert written(lambda f: write_postings(f, n, pieces(doc_ids, frequencies))) == encode_postings(doc_ids, frequencies)
+    assert written(lambda f: write_positions(f, n, position_pieces)) == encode_positions(counts, positions)
+    assert written(lambda f: write_impacts(f, pieces(doc_ids, impacts))) == encode_impacts(doc_ids, impacts)
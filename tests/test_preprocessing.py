@@ -0,0 +1,12 @@
+import os
+import data_preprocessing
+
+
+def test_input_without_rows_writes_only_the_header(tmp_path, quiet):
+    input_path = tmp_path / "cleaned.csv"
+    input_path.write_text("title|abstract|year|keywords|n_citation|url\n", encoding="utf-8")
+    output_path = str(tmp_path / "processed.csv")
+    data_preprocessing.run(str(input_path), output_path, workers=1)
+    with open(output_path, encoding="utf-8") as f:
+        assert f.read() == "title,abstract,year,keywords,n_citation,url\n"
+    assert not os.path.exists(output_path + ".checkpoint")
@@ -0,0 +1,32 @@
+import numpy as np
+import scoring
+from forward_store import FIELD_POSITION_GAP
+
+
+def positions(*values):
+    return np.array(values, dtype=np.uint32)
+
+
+def test_boost_reorders_near_ties_only(backend, quiet, monkeypatch):
+    app, vocabulary = backend(num_docs=50)
+    first, second = vocabulary.words[:2]
+    # Both terms are adjacent in docs 2 and 3, far apart in doc 1
+    term_positions = {
+        app.lexicon.get(first): {1: positions(3), 2: positions(7), 3: positions(7)},
+        app.lexicon.get(second): {1: positions(40), 2: positions(8), 3: positions(8)},
+    }
+    monkeypatch.setattr(app, "term_positions", lambda term_id, doc_ids: [term_positions[term_id][doc_id] for doc_id in doc_ids])
+    # Doc 2 is a near-tie with doc 1, doc 3 is clearly behind both
+    hits = app.hit_arrays([1, 2, 3], [10.0, 9.9, 5.0], [0, 0, 0])
+    doc_ids, scores, _ = app.apply_proximity(hits, [first, second])
+    assert doc_ids.tolist() == [2, 1, 3]
+    assert scores[0] <= 9.9 + app.PROXIMITY_WEIGHT * 10.0 + 1e-5
+
+
+def test_terms_in_different_fields_are_not_near():
+    title_end = positions(4)
+    abstract_start = positions(5 + FIELD_POSITION_GAP)
+    assert scoring.proximity_score([title_end, abstract_start]) == 0.0
+    assert scoring.proximity_score([positions(4), positions(5)]) == 1.0
+    # The mean over pairs, so more query terms don't mean a larger boost
+    assert scoring.proximity_score([positions(4), positions(5), positions(7)]) == 0.75
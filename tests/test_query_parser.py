@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from query_parser import is_boolean, parse_boolean, expression_terms
+
+
+def normalise(text):
+    # Lowercases and drops "the", as the query normaliser drops stop words
+    return [word for word in text.lower().split() if word != "the"]
+
+
+def term(word):
+    return ("term", word)
+
+
+def test_is_boolean_needs_capital_operators_or_parentheses():
+    assert is_boolean("neural AND network")
+    assert is_boolean("(neural network)")
+    assert not is_boolean("neural and network")
+    assert not is_boolean('"neural network" pruning')
+
+
+@pytest.mark.parametrize("query, expected", [
+    # AND binds tighter than OR
+    ("a OR b AND c", ("or", (term("a"), ("and", (term("b"), term("c")))))),
+    ("a AND b OR c", ("or", (("and", (term("a"), term("b"))), term("c")))),
+    # Parentheses override it
+    ("(a OR b) AND c", ("and", (("or", (term("a"), term("b"))), term("c")))),
+    # Operands without an operator are ORed
+    ("a b AND c", ("or", (term("a"), ("and", (term("b"), term("c")))))),
+    # NOT binds tightest and is ANDed with what precedes it
+    ("a NOT b OR c", ("or", (("and", (term("a"), ("not", term("b")))), term("c")))),
+    ("a AND NOT (b OR c)", ("and", (term("a"), ("not", ("or", (term("b"), term("c"))))))),
+    ("NOT NOT a", ("not", ("not", term("a")))),
+    # Quoted words are phrases; a quoted single word is a term
+    ('a AND "Neural Network"', ("and", (term("a"), ("phrase", ("neural", "network"))))),
+    ('a AND "b"', ("and", (term("a"), term("b")))),
+])
+def test_precedence(query, expected):
+    assert parse_boolean(query, normalise) == expected
+
+
+def test_dropped_words_leave_no_operand():
+    assert parse_boolean("the AND a", normalise) == term("a")
+    assert parse_boolean("a AND NOT the", normalise) == term("a")
+    assert parse_boolean('"the" OR (the)', normalise) is None
+
+
+@pytest.mark.parametrize("query", ["a AND", "AND a", "a AND OR b", "(a OR b", "a OR b)", "()", "a NOT", "a (OR b)"])
+def test_malformed_queries_raise(query):
+    with pytest.raises(ValueError):
+        parse_boolean(query, normalise)
+
+
+def test_expression_terms():
+    expression = parse_boolean('a AND NOT b OR "c d"', normalise)
+    assert expression_terms(expression) == ["a", "c", "d"]
+    assert expression_terms(expression, negated=True) == ["a", "b", "c", "d"]
+
+
+def test_matches_agree_with_set_operations(backend, quiet):
+    app, vocabulary = backend(num_docs=300)
+    words = vocabulary.words[:3].tolist() + vocabulary.words[40:43].tolist()
+    matches = {word: set(app.term_postings(app.lexicon.get(word)).doc_ids.tolist()) for word in words}
+    a, b, c, d, e, f = words
+    cases = [
+        (("and", (term(a), term(d))), matches[a] & matches[d]),
+        (("or", (term(d), term(e), term(f))), matches[d] | matches[e] | matches[f]),
+        (("and", (term(a), ("not", term(b)))), matches[a] - matches[b]),
+        (("and", (("or", (term(d), term(e))), ("not", term(c)), ("not", term(f)))), (matches[d] | matches[e]) - matches[c] - matches[f]),
+        (("or", (("and", (term(b), term(e))), ("and", (term(c), ("not", term(a)))))), (matches[b] & matches[e]) | (matches[c] - matches[a])),
+        # A word the lexicon doesn't have matches nothing
+        (("and", (term(a), term("zzzz"))), set()),
+        (("or", (term(f), term("zzzz"))), matches[f]),
+    ]
+    for expression, expected in cases:
+        matched = app.evaluate(expression)
+        assert matched.tolist() == sorted(expected), expression
+        (doc_ids, scores, _), total = app.compute_boolean_search(expression)
+        assert total == len(expected)
+        assert sorted(doc_ids.tolist()) == sorted(expected)
+        assert (np.diff(scores) <= 0).all()
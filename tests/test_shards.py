@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+
+def queries(vocabulary):
+    words = vocabulary.words.tolist()
+    return [
+        [words[0]],
+        [words[50]],
+        [words[0], words[1]],
+        [words[2], words[60], words[200]],
+        [words[5], "zzzz"],
+        ["zzzz"],
+    ]
+
+
+def results(app, vocabulary):
+    answers = []
+    for query in queries(vocabulary):
+        answers.append(app.compute_bm25(query))
+        for k in (1, 10, 1000):
+            answers.append(app.compute_bm25_top_k(query, k))
+    return answers
+
+
+def search_both(backend, add_documents, num_docs, **options):
+    """
+    Results of the same queries over the same corpus, unsharded and in 3 shards, with a few
+    documents in the delta index too.
+    """
+    answers = []
+    for name, num_shards in (("single", 1), ("sharded", 3)):
+        app, vocabulary = backend(num_docs=num_docs, num_shards=num_shards, name=name, **options)
+        app.compactor.stop()
+        assert len(app.shard_set) == num_shards
+        assert (app.shard_searcher is not None) == (num_shards > 1)
+        add_documents(app, vocabulary.words[:2].tolist(), n=3)
+        add_documents(app, [vocabulary.words[60]])
+        answers.append(results(app, vocabulary))
+    return answers
+
+
+def assert_same_hits(expected, actual):
+    assert len(expected) == len(actual)
+    for want, got in zip(expected, actual):
+        if isinstance(want, tuple) and len(want) == 2:
+            # A top k and its hit count
+            (want, want_total), (got, got_total) = want, got
+            assert got_total == want_total
+        want_ids, want_scores, want_offsets = want
+        got_ids, got_scores, got_offsets = got
+        assert got_ids.tolist() == want_ids.tolist()
+        assert np.allclose(got_scores, want_scores, rtol=1e-5)
+        assert got_offsets.tolist() == want_offsets.tolist()
+
+
+@pytest.mark.parametrize("impacts", [False, True])
+def test_sharded_results_match_unsharded(backend, quiet, add_documents, impacts):
+    single, sharded = search_both(backend, add_documents, num_docs=600, impacts=impacts)
+    assert any(len(hits[0]) > 100 for hits in single if not isinstance(hits[0], tuple))
+    assert_same_hits(single, sharded)
@@ -0,0 +1,20 @@
+import os
+from term_dictionary import SegmentStore, DICTIONARY_FILE
+
+
+def test_refresh_sees_a_dictionary_replaced_within_one_mtime_tick(backend, quiet):
+    app, vocabulary = backend(num_docs=100)
+    app.compactor.stop()
+    writer = app.shard_set.writable
+    reader = SegmentStore(app.barrels_path)
+    dictionary_path = os.path.join(app.barrels_path, DICTIONARY_FILE)
+    mtime_ns = os.stat(dictionary_path).st_mtime_ns
+
+    term_id = app.lexicon.get(vocabulary.words[0])
+    writer.dictionary.entries[term_id]["doc_freq"] += 1
+    writer.save_dictionary()
+    # As a filesystem with coarse timestamps records a second save in the same tick
+    os.utime(dictionary_path, ns=(mtime_ns, mtime_ns))
+
+    reader.refresh()
+    assert reader.doc_freq(term_id) == writer.doc_freq(term_id)